@@ -6,6 +6,9 @@ from .models import (
     CalificacionTributaria, 
     LogAuditoria, 
     CargaMasiva,
+    CargaMasivaError,
+    TrabajoCarga,
+    TrabajoExportacion,
     IntentoLogin,
     CuentaBloqueada
 )
@@ -139,7 +142,54 @@ class CargaMasivaAdmin(admin.ModelAdmin):
     list_filter = ('estado', 'fecha_carga')
     search_fields = ('archivo_nombre', 'usuario__username')
     date_hierarchy = 'fecha_carga'
-    readonly_fields = ('fecha_carga', 'registros_procesados', 'registros_exitosos', 'registros_fallidos', 'errores_detalle')
+    readonly_fields = ('fecha_carga', 'registros_procesados', 'registros_exitosos', 'registros_fallidos', 'errores_detalle', 'fila_checkpoint')
+
+    def get_queryset(self, request):
+        # El listado no muestra errores_detalle (se carga solo al abrir el detalle)
+        return super().get_queryset(request).defer('errores_detalle')
+
+
+@admin.register(CargaMasivaError)
+class CargaMasivaErrorAdmin(admin.ModelAdmin):
+    """Panel admin para los errores por fila de cargas masivas (solo lectura)"""
+    list_display = ('carga_id', 'fila', 'columna', 'codigo', 'mensaje')
+    list_filter = ('codigo',)
+    search_fields = ('carga__archivo_nombre',)
+    raw_id_fields = ('carga',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TrabajoExportacion)
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    """Panel admin para la cola y cache de exportaciones (solo lectura)"""
+    list_display = ('id', 'formato', 'estado', 'filas_exportadas', 'tamano', 'descargas', 'fecha_encolado', 'ultimo_acceso')
+    list_filter = ('estado', 'formato')
+    search_fields = ('clave', 'worker')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TrabajoCarga)
+class TrabajoCargaAdmin(admin.ModelAdmin):
+    """Panel admin para la cola de trabajos de carga masiva (solo lectura)"""
+    list_display = ('id', 'carga', 'estado', 'worker', 'intentos', 'filas_procesadas', 'filas_totales', 'fecha_encolado', 'ultimo_latido')
+    list_filter = ('estado', 'fecha_encolado')
+    search_fields = ('carga__archivo_nombre', 'worker')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 # Nuevo: Admin para IntentoLogin
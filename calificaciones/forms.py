@@ -150,24 +150,32 @@ class InstrumentoFinancieroForm(forms.ModelForm):
 
 
 class CargaMasivaForm(forms.Form):
-    """Formulario para carga masiva de archivos CSV/Excel"""
+    """Formulario para carga masiva de archivos CSV/Excel (CSV puede venir comprimido en .gz)"""
     archivo = forms.FileField(
         label='Archivo',
-        help_text='Formatos permitidos: CSV, XLSX',
+        help_text='Formatos permitidos: CSV, CSV.GZ, XLSX',
         widget=forms.FileInput(attrs={
             'class': 'form-control',
-            'accept': '.csv,.xlsx'
+            'accept': '.csv,.gz,.xlsx'
+        })
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Simular sin guardar',
+        help_text='Muestra cuántas filas se crearían, actualizarían, omitirían o rechazarían sin escribir en la base de datos',
+        widget=forms.CheckboxInput(attrs={
+            'class': 'form-check-input'
         })
     )
 
     def clean_archivo(self):
-        """Valida que el archivo sea CSV o XLSX"""
+        """Valida que el archivo sea CSV, CSV.GZ o XLSX"""
         archivo = self.cleaned_data.get('archivo')
         
         if archivo:
             nombre = archivo.name.lower()
-            if not (nombre.endswith('.csv') or nombre.endswith('.xlsx')):
-                raise forms.ValidationError('Solo se permiten archivos CSV o XLSX')
+            if not nombre.endswith(('.csv', '.csv.gz', '.xlsx')):
+                raise forms.ValidationError('Solo se permiten archivos CSV, CSV.GZ o XLSX')
             
             # Validar tamaño (máximo 10 MB)
             if archivo.size > 10 * 1024 * 1024:
@@ -0,0 +1,174 @@
+"""
+Benchmark de rendimiento de la carga masiva
+Uso: python manage.py benchmark_carga [--filas 1000 100000 1000000] [--formatos csv xlsx csv.gz]
+                                      [--mezcla crear=0.6,actualizar=0.25,omitir=0.1,invalida=0.05]
+                                      [--salida resultados.json] [--comparar base.json]
+                                      [--usar-bd-configurada]
+
+Genera archivos sintéticos deterministas, los procesa como un worker y
+registra filas/s, pico de RSS y consultas por carga en JSON. Con --comparar
+marca las métricas que empeoran más que --tolerancia respecto de una línea
+base guardada y termina con error si hay regresiones.
+
+Por defecto corre sobre una base de datos de prueba aislada, creada para la
+ocasión con el motor configurado en DATABASES (SQLite o PostgreSQL) y
+eliminada al terminar. --usar-bd-configurada corre sobre la base configurada:
+se niega si ya hay instrumentos con los códigos del benchmark y al terminar
+elimina solo las filas que creó (por id). Staging y procesos se pasan al
+motor, sin modificar settings.
+"""
+
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from calificaciones.utils.benchmark_carga import (
+    FORMATOS,
+    MEZCLA_POR_DEFECTO,
+    TOLERANCIA_POR_DEFECTO,
+    BenchmarkFallido,
+    comparar_resultados,
+    ejecutar_benchmark,
+    parsear_mezcla,
+)
+
+FILAS_POR_DEFECTO = [1000, 100000, 1000000]
+
+
+class Command(BaseCommand):
+    help = 'Mide el rendimiento de la carga masiva con archivos sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--filas',
+            type=int,
+            nargs='+',
+            default=FILAS_POR_DEFECTO,
+            help='Tamaños de archivo a medir (default: 1000 100000 1000000)',
+        )
+        parser.add_argument(
+            '--formatos',
+            nargs='+',
+            choices=FORMATOS,
+            default=FORMATOS,
+            help='Formatos de archivo (default: csv xlsx csv.gz)',
+        )
+        parser.add_argument(
+            '--mezcla',
+            default=','.join(f'{tipo}={fraccion}' for tipo, fraccion in MEZCLA_POR_DEFECTO.items()),
+            help='Fracciones de filas crear/actualizar/omitir/invalida (se normalizan)',
+        )
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla de los archivos (default: 42)')
+        parser.add_argument(
+            '--staging',
+            action='store_true',
+            help='Escribe vía tabla de staging (CARGA_MASIVA_STAGING)',
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=1,
+            help='Procesos de parseo/validación (default: 1)',
+        )
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument('--comparar', help='JSON de una ejecución anterior (línea base)')
+        parser.add_argument(
+            '--tolerancia',
+            type=float,
+            default=TOLERANCIA_POR_DEFECTO,
+            help='Empeoramiento tolerado antes de marcar regresión (default: 0.15 = 15%%)',
+        )
+        parser.add_argument(
+            '--usar-bd-configurada',
+            action='store_true',
+            help='Corre sobre la base de datos configurada en lugar de una base de prueba aislada',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mezcla = parsear_mezcla(options['mezcla'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        base = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as archivo:
+                base = json.load(archivo)
+
+        configuracion = None
+        if not options['usar_bd_configurada']:
+            configuracion = setup_databases(verbosity=0, interactive=False, aliases={connection.alias})
+        try:
+            ejecucion = self._ejecutar(options, mezcla)
+        except BenchmarkFallido as e:
+            raise CommandError(str(e))
+        finally:
+            if configuracion is not None:
+                teardown_databases(configuracion, verbosity=0)
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(ejecucion, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
+
+        if base is not None:
+            self._comparar(ejecucion, base, options['tolerancia'])
+
+    def _ejecutar(self, options, mezcla):
+        ejecucion = {
+            'fecha': timezone.now().isoformat(),
+            'motor_bd': connection.vendor,
+            'staging': options['staging'],
+            'procesos': options['procesos'],
+            'semilla': options['semilla'],
+            'mezcla': mezcla,
+            'filas_por_commit': settings.CARGA_MASIVA_FILAS_POR_COMMIT,
+            'resultados': [],
+        }
+        self.stdout.write(f"{'Filas':>10} | {'Formato':<7} | {'Filas/s':>9} | {'RSS (MB)':>8} | {'Consultas':>9}")
+        self.stdout.write('-' * 56)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            for filas in sorted(options['filas']):
+                for formato in options['formatos']:
+                    resultado = ejecutar_benchmark(
+                        filas, formato, directorio,
+                        mezcla=mezcla,
+                        semilla=options['semilla'],
+                        staging=options['staging'],
+                        procesos=options['procesos'],
+                    )
+                    ejecucion['resultados'].append(resultado)
+                    self.stdout.write(
+                        f"{filas:>10} | {formato:<7} | {resultado['filas_por_segundo'] or 0:>9.1f} | "
+                        f"{resultado['pico_rss_mb'] or 0:>8.1f} | {resultado['consultas']:>9}"
+                    )
+                    esperado = resultado['esperado']
+                    obtenido = (
+                        resultado['creados'], resultado['actualizados'],
+                        resultado['omitidos'], resultado['fallidos'],
+                    )
+                    if obtenido != (esperado['crear'], esperado['actualizar'], esperado['omitir'], esperado['invalida']):
+                        self.stderr.write(self.style.WARNING(
+                            f"  Contadores distintos de la mezcla generada: {obtenido} vs {esperado}"
+                        ))
+        return ejecucion
+
+    def _comparar(self, ejecucion, base, tolerancia):
+        comparacion = comparar_resultados(ejecucion, base, tolerancia)
+        regresiones = [item for item in comparacion if item['regresion']]
+        for item in comparacion:
+            linea = (
+                f"{item['filas']:>10} {item['formato']:<7} {item['metrica']:<18} "
+                f"{item['base']:>12} -> {item['actual']:>12} ({item['variacion']:+.1%})"
+            )
+            self.stdout.write(self.style.ERROR(linea) if item['regresion'] else linea)
+
+        if regresiones:
+            raise CommandError(f'{len(regresiones)} regresiones respecto de la línea base (tolerancia {tolerancia:.0%})')
+        self.stdout.write(self.style.SUCCESS(f'✓ Sin regresiones respecto de la línea base ({len(comparacion)} métricas)'))
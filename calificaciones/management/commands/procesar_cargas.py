@@ -0,0 +1,79 @@
+"""
+Worker de la cola de cargas masivas
+Uso: python manage.py procesar_cargas [--una-vez] [--intervalo 5] [--procesos N]
+
+Se pueden ejecutar varios workers en paralelo (incluso en nodos distintos):
+cada trabajo se reclama con bloqueo de fila y los trabajos de un worker
+caído se vuelven a reclamar cuando su latido expira.
+
+Con CARGA_MASIVA_LOG_COLA el log de la ingesta se escribe desde un hilo en
+segundo plano mientras el worker está activo (ver utils/log_carga).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from calificaciones.utils.cola_cargas import (
+    ejecutar_trabajo,
+    identificador_worker,
+    reclamar_trabajo,
+)
+from calificaciones.utils.log_carga import detener_cola_log, iniciar_cola_log
+
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos de carga masiva encolados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Drena la cola y termina (sin esperar nuevos trabajos)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help='Segundos de espera entre consultas cuando la cola está vacía (default: 5)',
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=None,
+            help='Procesos para parsear/validar cada archivo (default: CARGA_MASIVA_PROCESOS)',
+        )
+
+    def handle(self, *args, **options):
+        worker_id = identificador_worker()
+        self.stdout.write(f'Worker {worker_id} iniciado')
+
+        if settings.CARGA_MASIVA_LOG_COLA:
+            iniciar_cola_log()
+        try:
+            while True:
+                trabajo = reclamar_trabajo(worker_id)
+                if trabajo is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f'Procesando trabajo {trabajo.id}: {trabajo.carga.archivo_nombre}')
+                try:
+                    ejecutar_trabajo(trabajo, procesos=options['procesos'])
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f'✗ Trabajo {trabajo.id} falló: {e}'))
+                    continue
+
+                trabajo.carga.refresh_from_db()
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ Trabajo {trabajo.id} terminado: {trabajo.carga.estado} '
+                    f'({trabajo.carga.registros_exitosos}/{trabajo.carga.registros_procesados} exitosos)'
+                ))
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido')
+        finally:
+            if settings.CARGA_MASIVA_LOG_COLA:
+                detener_cola_log()
@@ -0,0 +1,61 @@
+"""
+Worker de la cola de exportaciones
+Uso: python manage.py procesar_exportaciones [--una-vez] [--intervalo 5]
+
+Genera los archivos de exportar_excel / exportar_csv en MEDIA_ROOT/exportaciones/.
+Se pueden ejecutar varios workers en paralelo: cada trabajo se reclama con
+bloqueo de fila y los de un worker caído se vuelven a reclamar cuando su
+latido expira. Tras cada archivo se aplica EXPORTACION_CACHE_MAX_MB (LRU).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from calificaciones.utils.cola_cargas import identificador_worker
+from calificaciones.utils.cola_exportaciones import ejecutar_exportacion, reclamar_exportacion
+
+
+class Command(BaseCommand):
+    help = 'Genera los archivos de exportación encolados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Drena la cola y termina (sin esperar nuevos trabajos)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help='Segundos de espera entre consultas cuando la cola está vacía (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        worker_id = identificador_worker()
+        self.stdout.write(f'Worker de exportaciones {worker_id} iniciado')
+
+        try:
+            while True:
+                trabajo = reclamar_exportacion(worker_id)
+                if trabajo is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f'Generando exportación {trabajo.id} ({trabajo.formato})')
+                try:
+                    completado = ejecutar_exportacion(trabajo)
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f'✗ Exportación {trabajo.id} falló: {e}'))
+                    continue
+
+                if completado is not None:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ Exportación {trabajo.id} terminada: {completado.filas_exportadas} filas, '
+                        f'{completado.tamano} bytes'
+                    ))
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido')
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0013_calificaciontributaria_fuente_origen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cargamasiva',
+            name='estado',
+            field=models.CharField(choices=[('EN_COLA', 'En cola'), ('PROCESANDO', 'Procesando'), ('EXITOSO', 'Exitoso'), ('PARCIAL', 'Parcial con errores'), ('FALLIDO', 'Fallido')], default='PROCESANDO', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='TrabajoCarga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('intentos', models.IntegerField(default=0)),
+                ('fecha_encolado', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_latido', models.DateTimeField(blank=True, null=True)),
+                ('filas_totales', models.IntegerField(default=0)),
+                ('filas_procesadas', models.IntegerField(default=0)),
+                ('carga', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trabajo', to='calificaciones.cargamasiva')),
+            ],
+            options={
+                'verbose_name_plural': 'Trabajos de Carga',
+                'ordering': ['fecha_encolado'],
+                'indexes': [models.Index(fields=['estado', 'fecha_encolado'], name='calificacio_estado_2f6a70_idx')],
+            },
+        ),
+    ]
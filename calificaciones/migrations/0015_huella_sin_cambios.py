@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0014_trabajocarga'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='huella',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='registros_sin_cambios',
+            field=models.IntegerField(default=0),
+        ),
+    ]
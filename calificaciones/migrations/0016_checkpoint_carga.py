@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0015_huella_sin_cambios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='fila_checkpoint',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='fila_inicio',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0016_checkpoint_carga'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaMasivaError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila', models.IntegerField()),
+                ('columna', models.CharField(blank=True, max_length=100)),
+                ('codigo', models.CharField(choices=[('CAMPO_FALTANTE', 'Campo requerido faltante'), ('VALOR_INVALIDO', 'Valor inválido'), ('VALIDACION', 'Error de validación'), ('REGLA_A', 'Factor fuera de rango (REGLA A)'), ('REGLA_B', 'Suma de factores 8-16 mayor a 1 (REGLA B)'), ('DUPLICADO', 'Registro duplicado'), ('INTEGRIDAD', 'Error de integridad'), ('OMITIDO', 'Omitido por prioridad (Corredora > Bolsa)'), ('ERROR', 'Error inesperado')], max_length=20)),
+                ('mensaje', models.TextField()),
+                ('carga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='errores', to='calificaciones.cargamasiva')),
+            ],
+            options={
+                'verbose_name': 'Error de Carga Masiva',
+                'verbose_name_plural': 'Errores de Carga Masiva',
+                'ordering': ['fila', 'id'],
+                'indexes': [models.Index(fields=['carga', 'fila'], name='calificacio_carga_i_ca0fc8_idx'), models.Index(fields=['carga', 'codigo'], name='calificacio_carga_i_cffdbd_idx')],
+            },
+        ),
+    ]
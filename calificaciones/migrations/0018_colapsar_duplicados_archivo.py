@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0017_carga_masiva_error'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='registros_colapsados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='cargamasivaerror',
+            name='codigo',
+            field=models.CharField(choices=[('CAMPO_FALTANTE', 'Campo requerido faltante'), ('VALOR_INVALIDO', 'Valor inválido'), ('VALIDACION', 'Error de validación'), ('REGLA_A', 'Factor fuera de rango (REGLA A)'), ('REGLA_B', 'Suma de factores 8-16 mayor a 1 (REGLA B)'), ('DUPLICADO', 'Registro duplicado'), ('INTEGRIDAD', 'Error de integridad'), ('OMITIDO', 'Omitido por prioridad (Corredora > Bolsa)'), ('COLAPSADO', 'Clave repetida en el archivo'), ('ERROR', 'Error inesperado')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0018_colapsar_duplicados_archivo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cargamasiva',
+            name='estado',
+            field=models.CharField(choices=[('EN_COLA', 'En cola'), ('PROCESANDO', 'Procesando'), ('EXITOSO', 'Exitoso'), ('PARCIAL', 'Parcial con errores'), ('FALLIDO', 'Fallido'), ('REVERTIDO', 'Revertido')], default='PROCESANDO', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CambioCarga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila_hasta', models.IntegerField()),
+                ('creados', models.IntegerField(default=0)),
+                ('actualizados', models.IntegerField(default=0)),
+                ('datos', models.BinaryField()),
+                ('carga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios', to='calificaciones.cargamasiva')),
+            ],
+            options={
+                'verbose_name': 'Cambio de Carga Masiva',
+                'verbose_name_plural': 'Cambios de Carga Masiva',
+                'ordering': ['carga', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0019_cambios_carga'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cambiocarga',
+            name='conteo_campos',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='cambiocarga',
+            name='diferencias',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
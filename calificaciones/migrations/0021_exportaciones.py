@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0020_diferencias_carga'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instrumentofinanciero',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('formato', models.CharField(choices=[('XLSX', 'Excel'), ('CSV', 'CSV')], max_length=4)),
+                ('filtros', models.JSONField(blank=True, default=dict)),
+                ('version_datos', models.CharField(max_length=100)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('intentos', models.IntegerField(default=0)),
+                ('fecha_encolado', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_latido', models.DateTimeField(blank=True, null=True)),
+                ('filas_exportadas', models.IntegerField(default=0)),
+                ('archivo', models.FileField(blank=True, upload_to='exportaciones/')),
+                ('tamano', models.BigIntegerField(default=0)),
+                ('ultimo_acceso', models.DateTimeField(blank=True, null=True)),
+                ('descargas', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Exportación',
+                'verbose_name_plural': 'Trabajos de Exportación',
+                'ordering': ['fecha_encolado'],
+                'indexes': [models.Index(fields=['estado', 'fecha_encolado'], name='calificacio_estado_59f162_idx'), models.Index(fields=['estado', 'ultimo_acceso'], name='calificacio_estado_9b83ba_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:20
+
+from django.db import migrations
+from django.db.models import F
+
+
+def descontar_colapsados(apps, schema_editor):
+    """registros_exitosos ya no incluye las filas colapsadas (no se escriben)."""
+    CargaMasiva = apps.get_model('calificaciones', 'CargaMasiva')
+    CargaMasiva.objects.filter(registros_colapsados__gt=0).update(
+        registros_exitosos=F('registros_exitosos') - F('registros_colapsados')
+    )
+
+
+def sumar_colapsados(apps, schema_editor):
+    CargaMasiva = apps.get_model('calificaciones', 'CargaMasiva')
+    CargaMasiva.objects.filter(registros_colapsados__gt=0).update(
+        registros_exitosos=F('registros_exitosos') + F('registros_colapsados')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0021_exportaciones'),
+    ]
+
+    operations = [
+        migrations.RunPython(descontar_colapsados, sumar_colapsados),
+    ]
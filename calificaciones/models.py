@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+import hashlib
 
 
 class Rol(models.Model):
@@ -36,46 +37,28 @@ class InstrumentoFinanciero(models.Model):
     nombre_instrumento = models.CharField(max_length=255)
     tipo_instrumento = models.CharField(max_length=100)  # Acción, Bono, ETF, etc.
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)  # Versión de datos de las exportaciones
     activo = models.BooleanField(default=True)
 
     def _generar_codigo_unico(self):
         """Genera código único desde nombre (iniciales/acrónimo). Máx 10 chars."""
-        import re
-        from django.utils.text import slugify
-        
-        # Extraer iniciales o acrónimo del nombre
-        palabras = self.nombre_instrumento.upper().split()
-        
-        # Opción 1: Si tiene menos de 3 palabras, usar iniciales
-        if len(palabras) <= 3:
-            codigo_base = ''.join([p[0] for p in palabras if p])
-        else:
-            # Opción 2: Usar primeras 2-3 iniciales de palabras principales (excluir artículos/preposiciones)
-            palabras_clave = [p for p in palabras if p not in ['S.A.', 'S.A', 'SA', 'DE', 'DEL', 'LA', 'LAS', 'LOS', 'EL']]
-            codigo_base = ''.join([p[0] for p in palabras_clave[:4] if p])
-        
-        # Limitar a 10 caracteres
-        codigo_base = codigo_base[:10]
-        
-        # Verificar unicidad
-        codigo = codigo_base
-        contador = 1
-        while InstrumentoFinanciero.objects.filter(codigo_instrumento=codigo).exclude(pk=self.pk).exists():
-            # Agregar sufijo numérico si existe duplicado
-            codigo = f"{codigo_base}{contador}"
-            contador += 1
-            if contador > 999:  # Límite de seguridad
-                import uuid
-                codigo = f"{codigo_base[:6]}{str(uuid.uuid4())[:4].upper()}"
-                break
-        
-        return codigo
+        from .utils.codigos_instrumento import generar_codigos_unicos
+
+        return generar_codigos_unicos([self.nombre_instrumento], excluir_pk=self.pk)[0]
 
     def save(self, *args, **kwargs):
-        """Autogenera codigo_instrumento si vacío."""
-        if not self.codigo_instrumento:
+        """Autogenera codigo_instrumento si vacío (bloqueando su base, como la carga masiva)."""
+        if self.codigo_instrumento:
+            super().save(*args, **kwargs)
+            return
+
+        from .utils.bloqueo_carga import ESPACIO_INSTRUMENTO, bloquear_claves, clave_bloqueo
+        from .utils.codigos_instrumento import codigo_base
+
+        with transaction.atomic():
+            bloquear_claves([clave_bloqueo(ESPACIO_INSTRUMENTO, codigo_base(self.nombre_instrumento))])
             self.codigo_instrumento = self._generar_codigo_unico()
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.codigo_instrumento} - {self.nombre_instrumento}"
@@ -230,36 +213,33 @@ class CalificacionTributaria(models.Model):
     activo = models.BooleanField(default=True)  # Eliminación lógica
 
     observaciones = models.TextField(blank=True, null=True)
+
+    # SHA-256 del contenido (factores + metadata); la carga masiva omite filas sin cambios
+    huella = models.CharField(max_length=64, blank=True, editable=False)
+
+    # Campos que no forman parte del contenido tributario de la huella
+    CAMPOS_SIN_HUELLA = {
+        'id', 'usuario_creador', 'fecha_creacion', 'fecha_modificacion', 'activo', 'huella',
+    }
     
     def clean(self):
         """
         Valida integridad tributaria:
         REGLA A: 0 <= factor_i <= 1 (rango individual)
         REGLA B: suma(factores 8-16) <= 1.0 (límite crítico)
+
+        La carga masiva evalúa las reglas para todo el lote de una vez
+        (validador_factores) y deja el resultado en _mensaje_reglas_factores.
         """
         from django.core.exceptions import ValidationError
-        
-        # REGLA A: Validar rango individual de cada factor (0 <= factor <= 1)
-        for i in range(8, 38):  # Factores 8 a 37
-            field_name = f'factor_{i}'
-            factor_value = getattr(self, field_name, None)
-            
-            if factor_value is not None:
-                if factor_value < Decimal('0') or factor_value > Decimal('1'):
-                    raise ValidationError(
-                        f'El {field_name} debe estar entre 0 y 1. Valor recibido: {factor_value}'
-                    )
-        
-        # REGLA B: Validar suma de factores 8-16 (límite crítico)
-        suma_factores_criticos = sum([
-            getattr(self, f'factor_{i}', None) or Decimal('0')
-            for i in range(8, 17)  # Factores 8 a 16
-        ])
-        
-        if suma_factores_criticos > Decimal('1'):
-            raise ValidationError(
-                'La suma de los factores 8 al 16 no puede superar 1.'
-            )
+        from .utils.validador_factores import CAMPOS_FACTORES, NO_EVALUADA, validar_factores_fila
+
+        mensaje = getattr(self, '_mensaje_reglas_factores', NO_EVALUADA)
+        if mensaje is NO_EVALUADA:
+            mensaje = validar_factores_fila([getattr(self, campo, None) for campo in CAMPOS_FACTORES])
+
+        if mensaje:
+            raise ValidationError(mensaje)
 
     def calcular_factor_desde_monto(self):
         """Factor = Monto / 1.000.000"""
@@ -275,16 +255,39 @@ class CalificacionTributaria(models.Model):
             return self.monto
         return None
 
-    def save(self, *args, **kwargs):
-        """Guarda con cálculo automático (monto↔factor) y validación full_clean()."""
-        # Cálculo legacy de compatibilidad
+    def aplicar_calculo_legacy(self):
+        """Cálculo legacy de compatibilidad (monto↔factor) según metodo_ingreso."""
         if self.metodo_ingreso == 'MONTO' and self.monto:
             self.calcular_factor_desde_monto()
         elif self.metodo_ingreso == 'FACTOR' and self.factor:
             self.calcular_monto_desde_factor()
-        
+
+    def calcular_huella(self):
+        """
+        SHA-256 de los valores canónicos del contenido (instrumento, fecha, DJ,
+        metadata y factores). Retorna None si algún valor no es convertible.
+        """
+        partes = []
+        try:
+            for field in self._meta.concrete_fields:
+                if field.name in self.CAMPOS_SIN_HUELLA:
+                    continue
+                valor = field.to_python(getattr(self, field.attname))
+                if isinstance(valor, Decimal):
+                    valor = valor.normalize()  # 0.1 == 0.10000000
+                partes.append(f"{field.attname}={'' if valor is None else valor}")
+        except Exception:
+            return None
+        return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+    def save(self, *args, **kwargs):
+        """Guarda con cálculo automático (monto↔factor) y validación full_clean()."""
+        # Cálculo legacy de compatibilidad
+        self.aplicar_calculo_legacy()
+
         # Ejecutar todas las validaciones antes de guardar
         self.full_clean()
+        self.huella = self.calcular_huella()
         
         super().save(*args, **kwargs)
 
@@ -371,10 +374,12 @@ class CuentaBloqueada(models.Model):
 class CargaMasiva(models.Model):
     """Trazabilidad de cargas masivas (CSV/Excel). Estados: EXITOSO, PARCIAL, FALLIDO."""
     ESTADOS = [
+        ('EN_COLA', 'En cola'),
         ('PROCESANDO', 'Procesando'),
         ('EXITOSO', 'Exitoso'),
         ('PARCIAL', 'Parcial con errores'),
         ('FALLIDO', 'Fallido'),
+        ('REVERTIDO', 'Revertido'),
     ]
 
     usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
@@ -382,10 +387,23 @@ class CargaMasiva(models.Model):
     archivo = models.FileField(upload_to='cargas_masivas/', null=True)
     fecha_carga = models.DateTimeField(auto_now_add=True)
     registros_procesados = models.IntegerField(default=0)
-    registros_exitosos = models.IntegerField(default=0)
+    registros_exitosos = models.IntegerField(default=0)  # Creados, actualizados o sin cambios (no incluye colapsados)
     registros_fallidos = models.IntegerField(default=0)
+    registros_sin_cambios = models.IntegerField(default=0)  # Huella igual a la almacenada
+    registros_colapsados = models.IntegerField(default=0)  # Clave repetida en el archivo: prevalece otra fila
     estado = models.CharField(max_length=20, choices=ESTADOS, default='PROCESANDO')
     errores_detalle = models.TextField(blank=True)
+    fila_checkpoint = models.IntegerField(default=0)  # Última fila del archivo ya confirmada (reanudación)
+
+    @property
+    def puede_reanudarse(self):
+        """Carga interrumpida con filas ya confirmadas: puede continuar desde el checkpoint."""
+        return self.estado == 'FALLIDO' and self.fila_checkpoint > 0 and bool(self.archivo)
+
+    @property
+    def puede_revertirse(self):
+        """Carga terminada que escribió filas (su changeset se puede deshacer)."""
+        return self.estado in ('EXITOSO', 'PARCIAL', 'FALLIDO') and self.fila_checkpoint > 0
 
     def __str__(self):
         return f"{self.archivo_nombre} - {self.estado}"
@@ -395,6 +413,165 @@ class CargaMasiva(models.Model):
         ordering = ['-fecha_carga']
 
 
+class CargaMasivaError(models.Model):
+    """
+    Error por fila de una carga masiva. Se escribe por lotes en cada checkpoint,
+    por lo que CargaMasiva.errores_detalle solo guarda un resumen acotado.
+    """
+    CODIGOS = [
+        ('CAMPO_FALTANTE', 'Campo requerido faltante'),
+        ('VALOR_INVALIDO', 'Valor inválido'),
+        ('VALIDACION', 'Error de validación'),
+        ('REGLA_A', 'Factor fuera de rango (REGLA A)'),
+        ('REGLA_B', 'Suma de factores 8-16 mayor a 1 (REGLA B)'),
+        ('DUPLICADO', 'Registro duplicado'),
+        ('INTEGRIDAD', 'Error de integridad'),
+        ('OMITIDO', 'Omitido por prioridad (Corredora > Bolsa)'),
+        ('COLAPSADO', 'Clave repetida en el archivo'),
+        ('ERROR', 'Error inesperado'),
+    ]
+
+    carga = models.ForeignKey(CargaMasiva, on_delete=models.CASCADE, related_name='errores')
+    fila = models.IntegerField()  # Número de fila de datos en el archivo (1 = primera fila tras el encabezado)
+    columna = models.CharField(max_length=100, blank=True)
+    codigo = models.CharField(max_length=20, choices=CODIGOS)
+    mensaje = models.TextField()
+
+    def __str__(self):
+        return f"Carga {self.carga_id} - Fila {self.fila} - {self.codigo}"
+
+    class Meta:
+        verbose_name = "Error de Carga Masiva"
+        verbose_name_plural = "Errores de Carga Masiva"
+        ordering = ['fila', 'id']
+        indexes = [
+            models.Index(fields=['carga', 'fila']),
+            models.Index(fields=['carga', 'codigo']),
+        ]
+
+
+class CambioCarga(models.Model):
+    """
+    Changeset inverso de una transacción de carga masiva: ids creados y valores
+    previos de las filas actualizadas, en formato columnar comprimido (zlib + JSON,
+    ver utils/cambios_carga). Permite revertir la carga con sentencias masivas.
+    También guarda el diff por campo de las filas actualizadas (reporte de diferencias).
+    """
+    carga = models.ForeignKey(CargaMasiva, on_delete=models.CASCADE, related_name='cambios')
+    fila_hasta = models.IntegerField()  # Checkpoint de la transacción que generó el changeset
+    creados = models.IntegerField(default=0)
+    actualizados = models.IntegerField(default=0)
+    datos = models.BinaryField()
+    diferencias = models.BinaryField(null=True, blank=True)  # Diff por fila (mismo formato columnar)
+    conteo_campos = models.JSONField(default=dict, blank=True)  # {campo: filas modificadas}
+
+    def __str__(self):
+        return f"Carga {self.carga_id} - hasta fila {self.fila_hasta}"
+
+    class Meta:
+        verbose_name = "Cambio de Carga Masiva"
+        verbose_name_plural = "Cambios de Carga Masiva"
+        ordering = ['carga', 'id']
+
+
+class TrabajoCarga(models.Model):
+    """
+    Cola de trabajos de carga masiva (respaldada en BD).
+    Los workers (manage.py procesar_cargas) reclaman trabajos con bloqueo de fila
+    y mantienen un latido; un trabajo EN_CURSO sin latido reciente se vuelve a reclamar.
+    """
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('COMPLETADO', 'Completado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+
+    carga = models.OneToOneField(CargaMasiva, on_delete=models.CASCADE, related_name='trabajo')
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    ip_address = models.GenericIPAddressField(null=True, blank=True)  # IP del usuario que encoló (auditoría)
+    worker = models.CharField(max_length=255, blank=True)
+    intentos = models.IntegerField(default=0)
+    fecha_encolado = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    ultimo_latido = models.DateTimeField(null=True, blank=True)
+    filas_totales = models.IntegerField(default=0)
+    filas_procesadas = models.IntegerField(default=0)
+    fila_inicio = models.IntegerField(default=0)  # Checkpoint desde el que partió el intento actual
+
+    def filas_por_segundo(self):
+        """Velocidad del intento actual (filas/seg) según el último latido."""
+        if not self.fecha_inicio or not self.ultimo_latido:
+            return 0.0
+        segundos = (self.ultimo_latido - self.fecha_inicio).total_seconds()
+        if segundos <= 0:
+            return 0.0
+        return (self.filas_procesadas - self.fila_inicio) / segundos
+
+    def eta_segundos(self):
+        """Tiempo restante estimado en segundos (None si aún no hay velocidad)."""
+        velocidad = self.filas_por_segundo()
+        if not velocidad or not self.filas_totales:
+            return None
+        return max(self.filas_totales - self.filas_procesadas, 0) / velocidad
+
+    def __str__(self):
+        return f"Trabajo {self.id} - {self.carga.archivo_nombre} - {self.estado}"
+
+    class Meta:
+        verbose_name_plural = "Trabajos de Carga"
+        ordering = ['fecha_encolado']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_encolado']),
+        ]
+
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación de calificaciones generada en segundo plano (manage.py procesar_exportaciones)
+    y guardada en MEDIA_ROOT. La clave identifica filtros normalizados, formato y versión
+    de los datos: una solicitud idéntica sobre datos sin cambios reutiliza el archivo.
+    Los archivos se descartan por LRU (ultimo_acceso) según EXPORTACION_CACHE_MAX_MB.
+    """
+    FORMATOS = [
+        ('XLSX', 'Excel'),
+        ('CSV', 'CSV'),
+    ]
+    ESTADOS = TrabajoCarga.ESTADOS
+
+    clave = models.CharField(max_length=64, unique=True)  # SHA-256 de filtros + formato + versión de datos
+    formato = models.CharField(max_length=4, choices=FORMATOS)
+    filtros = models.JSONField(default=dict, blank=True)  # Parámetros GET (CalificacionQuery) para generar el archivo
+    version_datos = models.CharField(max_length=100)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)  # Quien la solicitó primero
+    worker = models.CharField(max_length=255, blank=True)
+    intentos = models.IntegerField(default=0)
+    fecha_encolado = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    ultimo_latido = models.DateTimeField(null=True, blank=True)
+    filas_exportadas = models.IntegerField(default=0)
+    archivo = models.FileField(upload_to='exportaciones/', blank=True)
+    tamano = models.BigIntegerField(default=0)  # Bytes del archivo (presupuesto de disco)
+    ultimo_acceso = models.DateTimeField(null=True, blank=True)  # Orden LRU
+    descargas = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Exportación {self.id} - {self.formato} - {self.estado}"
+
+    class Meta:
+        verbose_name = "Trabajo de Exportación"
+        verbose_name_plural = "Trabajos de Exportación"
+        ordering = ['fecha_encolado']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_encolado']),
+            models.Index(fields=['estado', 'ultimo_acceso']),
+        ]
+
+
 class ArchivoCargado(models.Model):
     """Detección de archivos duplicados vía hash SHA-256."""
     nombre_archivo = models.CharField(max_length=255)
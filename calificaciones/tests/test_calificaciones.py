@@ -320,6 +320,26 @@ class TestInstrumentoFinanciero(TestCase):
         expected = 'BOND001 - Bono Corporativo'
         assert str(instrumento) == expected
 
+    def test_codigo_autogenerado_con_sufijo(self):
+        """Test: Sin código, save() genera iniciales con sufijo si ya existen"""
+        InstrumentoFinanciero.objects.create(codigo_instrumento='BC', nombre_instrumento='Bono Corto', tipo_instrumento='BONO')
+        InstrumentoFinanciero.objects.create(codigo_instrumento='BC1', nombre_instrumento='Bono Cero', tipo_instrumento='BONO')
+
+        instrumento = InstrumentoFinanciero.objects.create(nombre_instrumento='Bono Corporativo', tipo_instrumento='BONO')
+
+        assert instrumento.codigo_instrumento == 'BC2'
+
+    def test_codigos_de_un_lote_con_una_consulta(self):
+        """Test: generar_codigos_unicos asigna códigos distintos a todo el lote con una consulta"""
+        from calificaciones.utils.codigos_instrumento import generar_codigos_unicos
+
+        InstrumentoFinanciero.objects.create(codigo_instrumento='BC', nombre_instrumento='Bono Corto', tipo_instrumento='BONO')
+
+        with self.assertNumQueries(1):
+            codigos = generar_codigos_unicos(['Bono Corporativo', 'Bono Chileno', 'Acción Nueva', ''])
+
+        assert codigos == ['BC1', 'BC2', 'AN', 'INST']
+
 
 # Comando para ejecutar los tests:
 # pytest calificaciones/tests/test_calificaciones.py -v
@@ -0,0 +1,811 @@
+"""
+Tests para la cola de trabajos de carga masiva
+Cubre: encolado, archivos duplicados, reclamo con latido, trabajos abandonados,
+reanudación desde checkpoint, errores por fila (CargaMasivaError), reversión
+de cargas (CambioCarga), endpoint de progreso y benchmark de carga
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+import openpyxl
+import pytest
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.utils import timezone
+from calificaciones.models import (
+    ArchivoCargado,
+    CalificacionTributaria,
+    CargaMasiva,
+    CambioCarga,
+    CargaMasivaError,
+    InstrumentoFinanciero,
+    LogAuditoria,
+    PerfilUsuario,
+    Rol,
+    TrabajoCarga,
+)
+from calificaciones.utils import cola_cargas, staging_carga
+from calificaciones.utils.benchmark_carga import comparar_resultados, ejecutar_benchmark
+from calificaciones.utils.bloqueo_carga import ESPACIO_CALIFICACION, clave_bloqueo
+from calificaciones.utils.cambios_carga import (
+    ReversionNoPermitida,
+    deserializar_cambios,
+    iterar_diferencias,
+    revertir_carga,
+)
+from calificaciones.utils.cola_cargas import (
+    ejecutar_trabajo,
+    encolar_archivo,
+    encolar_carga,
+    reanudar_carga,
+    reclamar_trabajo,
+)
+from calificaciones.utils.motor_carga import MotorCargaMasiva
+
+
+class BytesContados(io.BytesIO):
+    """BytesIO que cuenta los bytes leídos."""
+
+    leidos = 0
+
+    def read(self, *args):
+        datos = super().read(*args)
+        self.leidos += len(datos)
+        return datos
+
+
+CSV_VALIDO = (
+    "codigo_instrumento,fecha_informe,origen,numero_dj,factor_8\n"
+    "INST001,2025-01-15,BOLSA,1949,0.1\n"
+    "INST002,2025-01-15,BOLSA,1949,0.2\n"
+)
+
+
+@pytest.mark.django_db
+class TestColaCargas(TestCase):
+    """Tests para reclamo y ejecución de trabajos"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def crear_carga(self, contenido=CSV_VALIDO, nombre='carga.csv'):
+        carga = CargaMasiva(usuario=self.user, archivo_nombre=nombre, estado='EN_COLA')
+        carga.archivo.save(nombre, ContentFile(contenido.encode('utf-8')))
+        return carga
+
+    def test_archivo_ilegible_marca_el_trabajo_fallido(self):
+        """Test: Si el archivo no se puede leer, carga y trabajo quedan FALLIDOS y el archivo se puede reenviar"""
+        carga = CargaMasiva(usuario=self.user, archivo_nombre='carga.xlsx', estado='EN_COLA')
+        carga.archivo.save('carga.xlsx', ContentFile(b'no es un excel'))
+        trabajo = encolar_carga(carga)
+
+        resultado = ejecutar_trabajo(reclamar_trabajo('worker-a', trabajo_id=trabajo.id))
+
+        assert resultado is None
+        trabajo.refresh_from_db()
+        carga.refresh_from_db()
+        assert (trabajo.estado, carga.estado) == ('FALLIDO', 'FALLIDO')
+        assert trabajo.fecha_fin is not None
+        assert carga.errores_detalle.startswith('Error')
+        assert carga.estado in cola_cargas.ESTADOS_REENVIABLES
+
+    def test_reclamar_y_ejecutar_trabajo(self):
+        """Test: Un worker reclama el trabajo, lo procesa y registra el avance"""
+        trabajo = encolar_carga(self.crear_carga(), ip_address='127.0.0.1')
+
+        reclamado = reclamar_trabajo('worker-a')
+        resultado = ejecutar_trabajo(reclamado)
+
+        assert reclamado.id == trabajo.id
+        assert resultado.creados == 2
+        trabajo.refresh_from_db()
+        assert trabajo.estado == 'COMPLETADO'
+        assert (trabajo.filas_procesadas, trabajo.filas_totales) == (2, 2)
+        assert trabajo.carga.estado == 'EXITOSO'
+
+    def test_trabajo_en_curso_no_se_reclama_dos_veces(self):
+        """Test: Un trabajo con latido vigente no lo toma otro worker"""
+        encolar_carga(self.crear_carga())
+
+        assert reclamar_trabajo('worker-a') is not None
+        assert reclamar_trabajo('worker-b') is None
+
+    def test_trabajo_abandonado_se_vuelve_a_reclamar(self):
+        """Test: Si el worker muere (latido expirado), otro worker retoma el trabajo"""
+        encolar_carga(self.crear_carga())
+        trabajo = reclamar_trabajo('worker-a')
+        expirado = timezone.now() - timedelta(seconds=cola_cargas.SEGUNDOS_EXPIRACION + 1)
+        TrabajoCarga.objects.filter(pk=trabajo.pk).update(ultimo_latido=expirado)
+
+        retomado = reclamar_trabajo('worker-b')
+
+        assert retomado.id == trabajo.id
+        assert (retomado.worker, retomado.intentos) == ('worker-b', 2)
+        # El worker original ya no puede reportar avance
+        with pytest.raises(cola_cargas.TrabajoPerdido):
+            cola_cargas._latido(trabajo, filas_procesadas=1)
+
+    def test_trabajo_agotado_se_marca_fallido(self):
+        """Test: Tras MAX_INTENTOS reclamos abandonados el trabajo y la carga quedan FALLIDO"""
+        trabajo = encolar_carga(self.crear_carga())
+        expirado = timezone.now() - timedelta(seconds=cola_cargas.SEGUNDOS_EXPIRACION + 1)
+        TrabajoCarga.objects.filter(pk=trabajo.pk).update(
+            estado='EN_CURSO', intentos=cola_cargas.MAX_INTENTOS, ultimo_latido=expirado
+        )
+
+        assert reclamar_trabajo('worker-a') is None
+        trabajo.refresh_from_db()
+        assert trabajo.estado == 'FALLIDO'
+        assert trabajo.carga.estado == 'FALLIDO'
+
+
+@pytest.mark.django_db
+class TestReanudarCarga(TestCase):
+    """Tests para la reanudación de cargas interrumpidas desde su checkpoint"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def carga_interrumpida(self):
+        """Carga de 3 filas con las 2 primeras confirmadas antes de una caída."""
+        contenido = CSV_VALIDO + "INST003,2025-01-15,BOLSA,1949,1.5\n"
+        carga = CargaMasiva(usuario=self.user, archivo_nombre='carga.csv', estado='EN_COLA')
+        carga.archivo.save('carga.csv', ContentFile(contenido.encode('utf-8')))
+        trabajo = encolar_carga(carga)
+        TrabajoCarga.objects.filter(pk=trabajo.pk).update(estado='COMPLETADO', intentos=1)
+        CargaMasiva.objects.filter(pk=carga.pk).update(
+            estado='FALLIDO', fila_checkpoint=2, registros_procesados=2, registros_exitosos=2,
+            errores_detalle='Error al procesar el archivo: conexión perdida.',
+        )
+        carga.refresh_from_db()
+        return carga
+
+    def test_reanudar_continua_desde_checkpoint(self):
+        """Test: Las filas confirmadas no se reprocesan y los contadores se acumulan"""
+        carga = self.carga_interrumpida()
+        assert carga.puede_reanudarse
+
+        trabajo = reanudar_carga(carga)
+        ejecutar_trabajo(reclamar_trabajo('worker-a', trabajo_id=trabajo.id))
+
+        carga.refresh_from_db()
+        assert not CalificacionTributaria.objects.exists()  # Filas 1-2 ya estaban confirmadas
+        assert (carga.registros_procesados, carga.registros_exitosos, carga.registros_fallidos) == (3, 2, 1)
+        assert (carga.estado, carga.fila_checkpoint) == ('PARCIAL', 3)
+        assert carga.errores_detalle.splitlines()[-1].startswith('Fila 3:')
+        assert list(carga.errores.values_list('fila', 'codigo', 'columna')) == [(3, 'REGLA_A', 'factor_8')]
+        trabajo.refresh_from_db()
+        assert (trabajo.fila_inicio, trabajo.filas_procesadas, trabajo.filas_totales) == (2, 3, 3)
+
+    def test_error_critico_deja_checkpoint_reanudable(self):
+        """Test: Un error a mitad de carga marca FALLIDO e indica desde qué fila reanudar"""
+        carga = self.carga_interrumpida()
+        carga.archivo.delete(save=False)
+        reanudar_carga(carga)
+
+        ejecutar_trabajo(reclamar_trabajo('worker-a'))
+
+        carga.refresh_from_db()
+        assert carga.estado == 'FALLIDO'
+        assert 'puede reanudar la carga desde la fila 3' in carga.errores_detalle
+
+    def test_carga_sin_checkpoint_no_se_reanuda(self):
+        """Test: Una carga sin filas confirmadas no se puede reanudar desde la vista"""
+        carga = self.carga_interrumpida()
+        CargaMasiva.objects.filter(pk=carga.pk).update(fila_checkpoint=0)
+
+        response = self.client.post(reverse('reanudar_carga_masiva', args=[carga.id]), follow=True)
+
+        mensajes = [str(m) for m in response.context['messages']]
+        assert any('no tiene un avance pendiente' in m for m in mensajes)
+        assert TrabajoCarga.objects.get().estado == 'COMPLETADO'
+
+    def test_vista_reanudar_encola_trabajo(self):
+        """Test: La vista vuelve a encolar la carga (modo asíncrono)"""
+        carga = self.carga_interrumpida()
+
+        with override_settings(CARGA_MASIVA_ASINCRONA=True):
+            response = self.client.post(reverse('reanudar_carga_masiva', args=[carga.id]))
+
+        assert response.status_code == 302
+        carga.refresh_from_db()
+        assert carga.estado == 'EN_COLA'
+        assert TrabajoCarga.objects.get().estado == 'PENDIENTE'
+
+    def test_vista_reanudar_sincrona_con_trabajo_ya_reclamado(self):
+        """Test: Si un worker ya reclamó el trabajo, la vista síncrona redirige al historial"""
+        carga = self.carga_interrumpida()
+
+        with override_settings(CARGA_MASIVA_ASINCRONA=False), \
+                patch('calificaciones.views.reclamar_trabajo', return_value=None):
+            response = self.client.post(reverse('reanudar_carga_masiva', args=[carga.id]), follow=True)
+
+        assert response.redirect_chain == [(reverse('carga_masiva'), 302)]
+        assert any('ya se está procesando' in str(m) for m in response.context['messages'])
+        assert TrabajoCarga.objects.get().estado == 'PENDIENTE'
+
+
+@pytest.mark.django_db
+class TestRevertirCarga(TestCase):
+    """Tests para los changesets inversos (CambioCarga) y la reversión de una carga"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+        # Estado previo: INST001 ya cargado por otro proceso
+        MotorCargaMasiva(usuario=None).procesar([
+            {'codigo_instrumento': 'INST001', 'fecha_informe': '2025-01-15', 'origen': 'BOLSA',
+             'numero_dj': '1949', 'factor_8': '0.05'},
+        ])
+        self.previo = self.estado()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def estado(self):
+        return sorted(CalificacionTributaria.objects.values_list(
+            'id', 'instrumento__codigo_instrumento', 'factor_8', 'usuario_creador',
+            'fuente_origen', 'huella', 'fecha_modificacion',
+        ))
+
+    def procesar(self, contenido=CSV_VALIDO, **ajustes):
+        carga = CargaMasiva(usuario=self.user, archivo_nombre='carga.csv', estado='EN_COLA')
+        carga.archivo.save('carga.csv', ContentFile(contenido.encode('utf-8')))
+        with override_settings(**ajustes):
+            ejecutar_trabajo(reclamar_trabajo('worker-a', trabajo_id=encolar_carga(carga).id))
+        carga.refresh_from_db()
+        return carga
+
+    def test_changeset_por_transaccion(self):
+        """Test: Cada transacción guarda ids creados y valores previos de las filas actualizadas"""
+        carga = self.procesar()
+
+        cambio = CambioCarga.objects.get(carga=carga)
+        assert (cambio.fila_hasta, cambio.creados, cambio.actualizados) == (2, 1, 1)
+        previos, creados = deserializar_cambios(cambio.datos)
+        assert previos[0]['factor_8'] == Decimal('0.05')
+        assert creados == [CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST002').id]
+
+    def test_revertir_restaura_estado_previo(self):
+        """Test: La reversión restaura las filas actualizadas y elimina las creadas con sentencias masivas"""
+        carga = self.procesar(CSV_VALIDO + "INST003,2025-01-15,BOLSA,1949,0.3\n")
+        assert self.estado() != self.previo
+
+        # SAVEPOINT + lock de escritura (SQLite) + carga + posteriores + changesets + CREATE + DELETE
+        # + carga de verificación + filas editadas + carga staging + UPDATE ... FROM + DELETE ... IN
+        # + instrumentos sin calificaciones (SELECT + cascada del ORM + DELETE) + estado + auditoría + RELEASE
+        with self.assertNumQueries(18):
+            reversion = revertir_carga(carga, usuario=self.user)
+
+        assert reversion == (1, 2, [], 2)
+        assert self.estado() == self.previo
+        assert list(InstrumentoFinanciero.objects.values_list('codigo_instrumento', flat=True)) == ['INST001']
+        carga.refresh_from_db()
+        assert carga.estado == 'REVERTIDO'
+        assert LogAuditoria.objects.filter(accion='BULK_ROLLBACK', registro_id=carga.id).exists()
+
+    def test_revertir_carga_con_staging(self):
+        """Test: La escritura vía tabla de staging también registra su changeset"""
+        carga = self.procesar(CARGA_MASIVA_STAGING=True)
+
+        assert revertir_carga(carga) == (1, 1, [], 1)
+        assert self.estado() == self.previo
+
+    def test_revertir_omite_filas_editadas_despues_de_la_carga(self):
+        """Test: Las filas editadas después de la carga no se restauran ni se eliminan, y se informan"""
+        carga = self.procesar()
+        actualizada = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST001')
+        actualizada.factor_8 = Decimal('0.15')
+        actualizada.save()
+        creada = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST002')
+
+        reversion = revertir_carga(carga)
+
+        assert reversion == (0, 1, [actualizada.pk], 1)
+        actualizada.refresh_from_db()
+        assert actualizada.factor_8 == Decimal('0.15')
+        assert not CalificacionTributaria.objects.filter(pk=creada.pk).exists()
+        auditoria = LogAuditoria.objects.get(accion='BULK_ROLLBACK', registro_id=carga.id)
+        assert f'1 omitidas por haber sido editadas después de la carga (ids: {actualizada.pk})' in auditoria.detalles
+
+    def test_revertir_bloquea_las_claves_antes_de_verificar(self):
+        """Test: La reversión bloquea las claves de las filas que toca (como el motor) antes de buscar las editadas"""
+        carga = self.procesar()
+        eventos = []
+        filas_modificadas = staging_carga.filas_modificadas
+
+        def verificar(cursor, generacion):
+            eventos.append('verificar')
+            return filas_modificadas(cursor, generacion)
+
+        with patch('calificaciones.utils.cambios_carga.bloqueo_por_clave', return_value=True), \
+                patch('calificaciones.utils.cambios_carga.bloquear_claves',
+                      side_effect=lambda claves: eventos.append(set(claves))), \
+                patch.object(staging_carga, 'filas_modificadas', side_effect=verificar):
+            revertir_carga(carga)
+
+        assert eventos == [
+            {
+                clave_bloqueo(ESPACIO_CALIFICACION, codigo, date(2025, 1, 15), '1949')
+                for codigo in ('INST001', 'INST002')
+            },
+            'verificar',
+        ]
+        assert self.estado() == self.previo
+
+    def test_revertir_solo_restaura_las_columnas_modificadas(self):
+        """Test: La reversión no pisa columnas que la carga no modificó"""
+        carga = self.procesar()
+        # Escritura sin save(): no cambia huella ni fecha_modificacion (no cuenta como edición)
+        CalificacionTributaria.objects.filter(instrumento__codigo_instrumento='INST001').update(
+            observaciones='Revisada'
+        )
+
+        assert revertir_carga(carga) == (1, 1, [], 1)
+
+        actualizada = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST001')
+        assert actualizada.factor_8 == Decimal('0.05')
+        assert actualizada.observaciones == 'Revisada'
+
+    def test_revertir_conserva_instrumentos_con_calificaciones(self):
+        """Test: Un instrumento creado por la carga que sigue en uso después de revertirla no se elimina"""
+        carga = self.procesar()
+        instrumento = InstrumentoFinanciero.objects.get(codigo_instrumento='INST002')
+        CalificacionTributaria.objects.create(
+            instrumento=instrumento, usuario_creador=self.user, fecha_informe=date(2025, 2, 1), numero_dj='1'
+        )
+
+        reversion = revertir_carga(carga)
+
+        assert reversion.instrumentos_eliminados == 0
+        assert InstrumentoFinanciero.objects.filter(pk=instrumento.pk).exists()
+
+    def test_solo_se_revierte_la_ultima_carga(self):
+        """Test: Una carga con cargas posteriores aplicadas no se puede revertir"""
+        primera = self.procesar()
+        segunda = self.procesar("codigo_instrumento,fecha_informe,origen,numero_dj,factor_8\nINST001,2025-01-15,BOLSA,1949,0.4\n")
+
+        with self.assertRaises(ReversionNoPermitida):
+            revertir_carga(primera)
+
+        revertir_carga(segunda)
+        revertir_carga(primera)
+        assert self.estado() == self.previo
+
+    def test_vista_revertir(self):
+        """Test: La vista revierte la carga una sola vez"""
+        carga = self.procesar()
+
+        response = self.client.post(reverse('revertir_carga_masiva', args=[carga.id]), follow=True)
+        assert any('revertida' in str(m) and '1 instrumentos eliminados' in str(m) for m in response.context['messages'])
+        assert self.estado() == self.previo
+
+        response = self.client.post(reverse('revertir_carga_masiva', args=[carga.id]), follow=True)
+        assert any('no tiene cambios que revertir' in str(m) for m in response.context['messages'])
+
+    def test_diferencias_se_guardan_con_el_changeset(self):
+        """Test: El diff por campo de cada transacción se guarda junto a su changeset"""
+        carga = self.procesar(CSV_VALIDO + "INST003,2025-01-15,BOLSA,1949,0.3\n")
+
+        assert list(carga.cambios.values_list('conteo_campos', flat=True)) == [{'factor_8': 1}]
+        calificacion = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST001')
+        assert list(iterar_diferencias(carga)) == [(1, calificacion.id, 'factor_8', '0.05000000', '0.1')]
+
+    def test_vista_reporte_diferencias(self):
+        """Test: El reporte de diferencias se descarga en Excel con resumen y detalle"""
+        carga = self.procesar()
+        response = self.client.get(reverse('carga_masiva'))
+        assert response.context['cargas_anteriores'][0].filas_actualizadas == 1
+
+        response = self.client.get(reverse('exportar_diferencias_carga_masiva', args=[carga.id]))
+
+        assert response.status_code == 200
+        assert f'diferencias_carga_{carga.id}.xlsx' in response['Content-Disposition']
+        libro = openpyxl.load_workbook(io.BytesIO(response.content))
+        assert list(libro['Resumen'].values) == [('Campo', 'Filas modificadas'), ('factor_8', 1)]
+        detalle = list(libro['Detalle'].values)
+        assert detalle[1][2:] == ('factor_8', '0.05000000', '0.1')
+
+
+CSV_CON_ERRORES = (
+    "codigo_instrumento,fecha_informe,origen,numero_dj,factor_8,factor_9\n"
+    "INST001,2025-01-15,BOLSA,1949,1.5,0\n"
+    "INST002,2025-01-15,BOLSA,1949,0.1,0.2\n"
+    "INST003,2025-01-15,BOLSA,1949,0.7,0.7\n"
+    "INST004,2025-01-15,BOLSA,1949,0.1,-1\n"
+    "INST005,2025-01-15,BOLSA,1949,0.1,0.1\n"
+)
+
+
+@pytest.mark.django_db
+class TestErroresCarga(TestCase):
+    """Tests para el registro estructurado de errores por fila y su consulta"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def procesar(self, contenido=CSV_CON_ERRORES):
+        carga = CargaMasiva(usuario=self.user, archivo_nombre='carga.csv', estado='EN_COLA')
+        carga.archivo.save('carga.csv', ContentFile(contenido.encode('utf-8')))
+        ejecutar_trabajo(reclamar_trabajo('worker-a', trabajo_id=encolar_carga(carga).id))
+        carga.refresh_from_db()
+        return carga
+
+    def test_errores_se_guardan_por_fila(self):
+        """Test: Cada fila rechazada queda en CargaMasivaError con código y columna"""
+        carga = self.procesar()
+
+        assert list(carga.errores.values_list('fila', 'columna', 'codigo')) == [
+            (1, 'factor_8', 'REGLA_A'),
+            (3, '', 'REGLA_B'),
+            (4, 'factor_9', 'REGLA_A'),
+        ]
+        assert carga.estado == 'PARCIAL'
+        assert carga.errores_detalle.splitlines()[0].startswith('Fila 1:')
+
+    def test_claves_repetidas_se_colapsan(self):
+        """Test: Las filas con clave repetida en el archivo se informan como colapsadas"""
+        carga = self.procesar(
+            "codigo_instrumento,fecha_informe,origen,numero_dj,factor_8\n"
+            "INST001,2025-01-15,BOLSA,1949,0.1\n"
+            "INST001,2025-01-15,BOLSA,1949,0.2\n"
+            "INST001,2025-01-15,BOLSA,1949,0.3\n"
+        )
+
+        # Las colapsadas no se escriben: no cuentan como exitosas, pero la carga no tiene errores
+        assert (carga.registros_procesados, carga.registros_exitosos, carga.registros_colapsados) == (3, 1, 2)
+        assert carga.estado == 'EXITOSO'
+        assert list(carga.errores.values_list('fila', 'codigo')) == [(1, 'COLAPSADO'), (2, 'COLAPSADO')]
+        assert CalificacionTributaria.objects.get().factor_8 == Decimal('0.3')
+
+    def test_resumen_de_errores_acotado(self):
+        """Test: errores_detalle guarda solo los primeros errores y cuántos faltan"""
+        with patch.object(cola_cargas, 'MAX_ERRORES_RESUMEN', 2):
+            carga = self.procesar()
+
+        lineas = carga.errores_detalle.splitlines()
+        assert len(lineas) == 3
+        assert lineas[-1].startswith('... y 1 errores más')
+        assert carga.errores.count() == 3
+
+    def test_vista_errores_filtra_y_pagina(self):
+        """Test: El detalle de errores filtra por código/columna y pagina"""
+        carga = self.procesar()
+        url = reverse('errores_carga_masiva', args=[carga.id])
+
+        response = self.client.get(url, {'codigo': 'REGLA_A'})
+        assert [e.fila for e in response.context['page_obj']] == [1, 4]
+        assert {item['codigo']: item['total'] for item in response.context['conteo_codigos']} == {
+            'REGLA_A': 2, 'REGLA_B': 1,
+        }
+
+        response = self.client.get(url, {'columna': 'factor_9'})
+        assert [e.fila for e in response.context['page_obj']] == [4]
+
+        with patch('calificaciones.views.ERRORES_CARGA_POR_PAGINA', 2):
+            response = self.client.get(url, {'page': 2})
+        assert [e.fila for e in response.context['page_obj']] == [4]
+
+    def test_exportar_errores_csv_en_streaming(self):
+        """Test: La descarga de rechazos es un CSV en streaming con los filtros aplicados"""
+        carga = self.procesar()
+
+        response = self.client.get(
+            reverse('exportar_errores_carga_masiva', args=[carga.id]), {'codigo': 'REGLA_A'}
+        )
+
+        assert response.streaming
+        lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        assert lineas[0] == 'Fila,Columna,Código,Mensaje'
+        assert [linea.split(',')[:3] for linea in lineas[1:]] == [
+            ['1', 'factor_8', 'REGLA_A'], ['4', 'factor_9', 'REGLA_A'],
+        ]
+
+    def test_errores_de_otro_usuario_no_accesibles(self):
+        """Test: Un usuario no puede ver ni descargar los errores de cargas de otro"""
+        otro = User.objects.create_user(username='otro', password='testpass123')
+        carga = CargaMasiva.objects.create(usuario=otro, archivo_nombre='x.csv', estado='PARCIAL')
+        CargaMasivaError.objects.create(carga=carga, fila=1, codigo='ERROR', mensaje='Fila 1: x')
+
+        assert self.client.get(reverse('errores_carga_masiva', args=[carga.id])).status_code == 404
+        assert self.client.get(reverse('exportar_errores_carga_masiva', args=[carga.id])).status_code == 404
+
+    def test_historial_no_carga_errores_detalle(self):
+        """Test: El historial de carga_masiva difiere el texto de errores"""
+        self.procesar()
+
+        response = self.client.get(reverse('carga_masiva'))
+
+        cargas = list(response.context['cargas_anteriores'])
+        assert cargas and all('errores_detalle' in c.get_deferred_fields() for c in cargas)
+        assert reverse('errores_carga_masiva', args=[cargas[0].id]).encode() in response.content
+
+
+@pytest.mark.django_db
+class TestArchivosDuplicados(TestCase):
+    """Tests para el rechazo de archivos ya cargados (hash SHA-256)"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def subir(self, nombre='carga.csv', contenido=CSV_VALIDO):
+        archivo = SimpleUploadedFile(nombre, contenido.encode('utf-8'), content_type='text/csv')
+        return self.client.post(reverse('carga_masiva'), {'archivo': archivo}, follow=True)
+
+    def test_archivo_repetido_no_se_reprocesa(self):
+        """Test: El mismo contenido (aunque cambie el nombre) apunta a la carga original"""
+        self.subir()
+        original = CargaMasiva.objects.get()
+
+        response = self.subir(nombre='reintento.csv')
+
+        assert CargaMasiva.objects.count() == 1
+        assert TrabajoCarga.objects.count() == 1
+        mensajes = [str(m) for m in response.context['messages']]
+        assert any(f'carga #{original.id}' in m for m in mensajes)
+        assert ArchivoCargado.objects.get().carga_masiva == original
+
+    def test_archivo_distinto_se_encola(self):
+        """Test: Un contenido distinto genera una nueva carga"""
+        self.subir()
+        self.subir(contenido=CSV_VALIDO + "INST003,2025-01-15,BOLSA,1949,0.3\n")
+
+        assert CargaMasiva.objects.count() == 2
+        assert ArchivoCargado.objects.count() == 2
+
+    def test_carga_original_fallida_permite_reenvio(self):
+        """Test: Si la carga original falló, el reenvío se procesa y toma el hash"""
+        trabajo, _ = encolar_archivo(SimpleUploadedFile('carga.csv', CSV_VALIDO.encode('utf-8')), self.user)
+        CargaMasiva.objects.filter(pk=trabajo.carga_id).update(estado='FALLIDO')
+
+        nuevo, original = encolar_archivo(SimpleUploadedFile('carga.csv', CSV_VALIDO.encode('utf-8')), self.user)
+
+        assert original is None
+        assert nuevo.carga_id != trabajo.carga_id
+        assert ArchivoCargado.objects.get().carga_masiva_id == nuevo.carga_id
+
+    def test_hash_y_filas_en_la_misma_pasada_que_el_guardado(self):
+        """Test: El archivo se lee una sola vez al encolar: hash, conteo de filas (CSV) y copia al storage"""
+        contenido = CSV_VALIDO.encode('utf-8')
+        subido = SimpleUploadedFile('carga.csv', b'')
+        subido.file = BytesContados(contenido)
+
+        trabajo, _ = encolar_archivo(subido, self.user)
+
+        assert subido.file.leidos == len(contenido)
+        assert trabajo.filas_totales == 2
+        assert ArchivoCargado.objects.get().hash_archivo == hashlib.sha256(CSV_VALIDO.encode('utf-8')).hexdigest()
+        with trabajo.carga.archivo.open('rb') as guardado:
+            assert guardado.read() == CSV_VALIDO.encode('utf-8')
+
+    def test_archivo_temporal_se_copia_con_hash(self):
+        """Test: Una subida grande (archivo temporal en disco) también se guarda y se identifica por hash"""
+        subido = TemporaryUploadedFile('carga.csv', 'text/csv', len(CSV_VALIDO), 'utf-8')
+        subido.write(CSV_VALIDO.encode('utf-8'))
+        subido.seek(0)
+
+        trabajo, _ = encolar_archivo(subido, self.user)
+        duplicado, original = encolar_archivo(SimpleUploadedFile('otra.csv', CSV_VALIDO.encode('utf-8')), self.user)
+
+        assert duplicado is None and original == trabajo.carga
+        # La copia del duplicado se descarta: solo queda el archivo de la carga original
+        assert os.listdir(os.path.join(self.media_root, 'cargas_masivas')) == [os.path.basename(trabajo.carga.archivo.name)]
+        subido.close()
+
+    def test_carga_sincrona_con_trabajo_ya_reclamado(self):
+        """Test: Si un worker reclama el trabajo antes que la solicitud, se redirige al historial"""
+        with override_settings(CARGA_MASIVA_ASINCRONA=False), \
+                patch('calificaciones.views.reclamar_trabajo', return_value=None):
+            response = self.subir()
+
+        assert response.redirect_chain == [(reverse('carga_masiva'), 302)]
+        assert any('ya se está procesando' in str(m) for m in response.context['messages'])
+        assert CargaMasiva.objects.get().estado == 'EN_COLA'
+
+    def test_carga_original_revertida_permite_reenvio(self):
+        """Test: Un archivo cuya carga se revirtió se puede volver a subir y procesar"""
+        trabajo, _ = encolar_archivo(SimpleUploadedFile('carga.csv', CSV_VALIDO.encode('utf-8')), self.user)
+        ejecutar_trabajo(reclamar_trabajo('worker-a', trabajo_id=trabajo.id))
+        revertir_carga(trabajo.carga)
+        assert not CalificacionTributaria.objects.exists()
+
+        with override_settings(CARGA_MASIVA_ASINCRONA=False):
+            response = self.subir()
+
+        assert not any('ya fue cargado' in str(m) for m in response.context['messages'])
+        nueva = CargaMasiva.objects.exclude(pk=trabajo.carga_id).get()
+        assert nueva.estado == 'EXITOSO'
+        assert CalificacionTributaria.objects.count() == 2
+        assert ArchivoCargado.objects.get().carga_masiva == nueva
+
+
+@pytest.mark.django_db
+class TestProgresoCargaView(TestCase):
+    """Tests para el endpoint JSON de progreso"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+
+    def test_progreso_reporta_velocidad_y_eta(self):
+        """Test: El endpoint reporta filas procesadas, filas/seg y ETA"""
+        carga = CargaMasiva.objects.create(usuario=self.user, archivo_nombre='x.csv', estado='PROCESANDO')
+        inicio = timezone.now() - timedelta(seconds=10)
+        TrabajoCarga.objects.create(
+            carga=carga, estado='EN_CURSO', worker='w', fecha_inicio=inicio,
+            ultimo_latido=inicio + timedelta(seconds=10), filas_totales=3000, filas_procesadas=1000,
+        )
+
+        datos = self.client.get(reverse('progreso_carga_masiva', args=[carga.id])).json()
+
+        assert datos['filas_procesadas'] == 1000
+        assert datos['porcentaje'] == 33.3
+        assert datos['filas_por_segundo'] == 100.0
+        assert datos['eta_segundos'] == 20.0
+
+    def test_progreso_de_otro_usuario_no_accesible(self):
+        """Test: Un usuario no puede consultar cargas de otro"""
+        otro = User.objects.create_user(username='otro', password='testpass123')
+        carga = CargaMasiva.objects.create(usuario=otro, archivo_nombre='x.csv')
+
+        response = self.client.get(reverse('progreso_carga_masiva', args=[carga.id]))
+
+        assert response.status_code == 404
+
+
+@pytest.mark.django_db
+class TestBenchmarkCarga(TestCase):
+    """Tests para el benchmark de carga masiva (manage.py benchmark_carga)"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.directorio = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def test_mezcla_determinista_en_todos_los_formatos(self):
+        """Test: Cada formato produce los contadores de la mezcla generada y deja la BD limpia"""
+        resultados = [ejecutar_benchmark(120, formato, self.directorio) for formato in ('csv', 'xlsx', 'csv.gz')]
+
+        for resultado in resultados:
+            esperado = resultado['esperado']
+            assert (resultado['creados'], resultado['actualizados'], resultado['omitidos'], resultado['fallidos']) == (
+                esperado['crear'], esperado['actualizar'], esperado['omitir'], esperado['invalida']
+            )
+            assert resultado['consultas'] > 0 and resultado['filas_por_segundo'] > 0
+        assert resultados[0]['esperado'] == resultados[1]['esperado'] == resultados[2]['esperado']
+        assert all(resultados[0]['esperado'].values())
+        assert not CalificacionTributaria.objects.exists()
+        assert not CargaMasiva.objects.exists()
+
+    def test_comparar_marca_regresiones(self):
+        """Test: Menos filas/s o más consultas que la tolerancia se marcan como regresión"""
+        base = {'resultados': [{'formato': 'csv', 'filas': 1000, 'filas_por_segundo': 100.0, 'consultas': 50}]}
+        actual = {'resultados': [{'formato': 'csv', 'filas': 1000, 'filas_por_segundo': 90.0, 'consultas': 60}]}
+
+        comparacion = {item['metrica']: item['regresion'] for item in comparar_resultados(actual, base, 0.15)}
+
+        assert comparacion == {'filas_por_segundo': False, 'consultas': True}
+
+    def test_comando_guarda_json_y_compara(self):
+        """Test: El comando guarda los resultados en JSON y falla ante una regresión"""
+        salida = os.path.join(self.directorio, 'resultados.json')
+        call_command('benchmark_carga', filas=[40], formatos=['csv'], usar_bd_configurada=True, salida=salida, stdout=io.StringIO())
+        with open(salida, encoding='utf-8') as archivo:
+            ejecucion = json.load(archivo)
+        assert [(r['formato'], r['filas']) for r in ejecucion['resultados']] == [('csv', 40)]
+        assert ejecucion['motor_bd'] == 'sqlite'
+
+        ejecucion['resultados'][0]['consultas'] //= 2  # Línea base con la mitad de consultas
+        base = os.path.join(self.directorio, 'base.json')
+        with open(base, 'w', encoding='utf-8') as archivo:
+            json.dump(ejecucion, archivo)
+        with pytest.raises(CommandError, match='regresiones'):
+            call_command('benchmark_carga', filas=[40], formatos=['csv'], usar_bd_configurada=True, comparar=base, stdout=io.StringIO())
+
+    @override_settings(CARGA_MASIVA_STAGING=False)
+    def test_staging_se_pasa_al_motor(self):
+        """Test: --staging llega al motor como parámetro, sin modificar settings"""
+        with patch.object(cola_cargas, 'MotorCargaMasiva', wraps=MotorCargaMasiva) as motor:
+            ejecutar_benchmark(40, 'csv', self.directorio, staging=True)
+
+        assert motor.call_args.kwargs['staging'] is True
+
+    def test_trabajo_perdido_es_error_del_comando(self):
+        """Test: Si ejecutar_trabajo no retorna resultado, el comando falla con un mensaje claro"""
+        with patch('calificaciones.utils.benchmark_carga.ejecutar_trabajo', return_value=None):
+            with pytest.raises(CommandError, match='no terminó'):
+                call_command('benchmark_carga', filas=[40], formatos=['csv'], usar_bd_configurada=True, stdout=io.StringIO())
+
+        assert not CargaMasiva.objects.exists()
+
+    def test_bd_configurada_no_toca_datos_ajenos(self):
+        """Test: Con datos de usuario con los nombres del benchmark, el comando se niega y no los elimina"""
+        usuario = User.objects.create_user(username='analista', password='testpass123')
+        instrumento = InstrumentoFinanciero.objects.create(codigo_instrumento='BENCH0000', nombre_instrumento='Real')
+        carga = CargaMasiva.objects.create(usuario=usuario, archivo_nombre='benchmark_real.csv', estado='EXITOSO')
+
+        with pytest.raises(CommandError, match='prefijo BENCH'):
+            call_command(
+                'benchmark_carga', filas=[40], formatos=['csv'], usar_bd_configurada=True, stdout=io.StringIO()
+            )
+
+        assert InstrumentoFinanciero.objects.filter(pk=instrumento.pk).exists()
+        assert CargaMasiva.objects.filter(pk=carga.pk).exists()
+
+    def test_limpieza_solo_por_id(self):
+        """Test: Tras la carga se eliminan solo las filas de la ejecución; una carga real 'benchmark_*' se conserva"""
+        usuario = User.objects.create_user(username='analista', password='testpass123')
+        carga = CargaMasiva.objects.create(usuario=usuario, archivo_nombre='benchmark_120.csv', estado='EXITOSO')
+
+        ejecutar_benchmark(120, 'csv', self.directorio)
+
+        assert list(CargaMasiva.objects.all()) == [carga]
+        assert not InstrumentoFinanciero.objects.exists()
+        assert not LogAuditoria.objects.filter(accion='BULK_UPLOAD').exists()
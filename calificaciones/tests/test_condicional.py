@@ -0,0 +1,166 @@
+"""
+Tests para GET condicional (ETag / Last-Modified)
+Cubre: 304 sin renderizar en listado y dashboard, invalidación por cambios de
+datos, identidad del usuario, mensajes pendientes y archivos de exportación
+"""
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+from calificaciones.models import CalificacionTributaria, InstrumentoFinanciero, LogAuditoria, PerfilUsuario, Rol
+from calificaciones.tests.test_exportacion import ExportacionTestCase
+
+
+@pytest.mark.django_db
+class TestListadoCondicional(ExportacionTestCase):
+    """Tests para listar_calificaciones"""
+
+    def get(self, response=None, **params):
+        cabeceras = {}
+        if response is not None:
+            cabeceras['HTTP_IF_NONE_MATCH'] = response['ETag']
+        return self.client.get(reverse('listar_calificaciones'), params, **cabeceras)
+
+    def test_validadores_en_la_respuesta(self):
+        response = self.get()
+
+        assert response.status_code == 200
+        assert response['ETag'].startswith('W/"')
+        assert not response.has_header('Last-Modified')  # No sería exacto (ver utils/condicional)
+        assert 'private' in response['Cache-Control'] and 'no-cache' in response['Cache-Control']
+
+    def test_no_modificada_sin_renderizar(self):
+        """Test: Con el ETag vigente responde 304 con solo el validador (sin COUNT, página ni render)"""
+        response = self.get(mercado='ACN')
+
+        # Autenticación (4) + validador
+        with self.assertNumQueries(5):
+            no_modificada = self.get(response, mercado='ACN')
+
+        assert no_modificada.status_code == 304
+        assert no_modificada.content == b''
+        assert no_modificada['ETag'] == response['ETag']
+
+    def test_if_modified_since_tras_eliminar_una_fila(self):
+        """Test: Una eliminación no mueve la última modificación: If-Modified-Since no da 304"""
+        self.get()
+        CalificacionTributaria.objects.filter(mercado='CFI').delete()
+
+        # Cualquier fecha posterior a la última modificación que conserva el cliente
+        actual = self.client.get(
+            reverse('listar_calificaciones'), HTTP_IF_MODIFIED_SINCE='Wed, 01 Jan 2099 00:00:00 GMT'
+        )
+
+        assert actual.status_code == 200
+        assert actual.context['page_obj'].paginator.count == 2
+
+    def test_modificacion_en_el_conjunto(self):
+        response = self.get(mercado='ACN')
+        calificacion = CalificacionTributaria.objects.filter(mercado='ACN').first()
+        calificacion.observaciones = 'Revisada'
+        calificacion.save()
+
+        assert self.get(response, mercado='ACN').status_code == 200
+
+    def test_eliminacion_logica(self):
+        response = self.get(mercado='ACN')
+        calificacion = CalificacionTributaria.objects.filter(mercado='ACN').first()
+        calificacion.activo = False
+        calificacion.save()
+
+        actual = self.get(response, mercado='ACN')
+
+        assert actual.status_code == 200
+        assert actual.context['page_obj'].paginator.count == 1
+
+    def test_instrumento_renombrado(self):
+        response = self.get()
+        instrumento = InstrumentoFinanciero.objects.get()
+        instrumento.codigo_instrumento = 'INST999'
+        instrumento.save()
+
+        assert self.get(response).status_code == 200
+
+    def test_cambios_fuera_del_conjunto_no_invalidan(self):
+        response = self.get(mercado='ACN')
+        calificacion = CalificacionTributaria.objects.get(mercado='CFI')
+        calificacion.observaciones = 'Revisada'
+        calificacion.save()
+
+        assert self.get(response, mercado='ACN').status_code == 304
+
+    def test_otra_pagina_u_otros_filtros(self):
+        response = self.get(mercado='ACN')
+
+        assert self.get(response, mercado='ACN', page=2).status_code == 200
+        assert self.get(response, mercado='CFI').status_code == 200
+
+    def test_otro_usuario(self):
+        """Test: La página es personal (navbar, menús por rol): otro usuario no reutiliza el ETag"""
+        response = self.get()
+        otro = User.objects.create_user(username='auditor', password='testpass123')
+        PerfilUsuario.objects.create(usuario=otro, rol=Rol.objects.create(nombre_rol='Auditor'))
+        self.client.login(username='auditor', password='testpass123')
+
+        assert self.get(response).status_code == 200
+
+    def test_mensajes_pendientes(self):
+        """Test: Con mensajes pendientes se renderiza la página (sin validadores) y se muestran"""
+        response = self.get()
+        calificacion = CalificacionTributaria.objects.first()
+        self.client.post(reverse('eliminar_calificacion', args=[calificacion.pk]))
+
+        actual = self.get(response)
+
+        assert actual.status_code == 200
+        assert not actual.has_header('ETag')
+        self.assertContains(actual, 'Solo los Administradores')
+        assert self.get(response).status_code == 304  # Ya mostrados
+
+
+@pytest.mark.django_db
+class TestDashboardCondicional(ExportacionTestCase):
+    """Tests para dashboard"""
+
+    def test_no_modificado(self):
+        response = self.client.get(reverse('dashboard'))
+
+        no_modificado = self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert response.status_code == 200
+        assert no_modificado.status_code == 304
+        assert not response.has_header('Last-Modified')
+
+    def test_nueva_actividad_invalida(self):
+        """Test: Un nuevo registro de auditoría (actividad reciente) genera otra versión"""
+        response = self.client.get(reverse('dashboard'))
+        LogAuditoria.objects.create(usuario=self.user, accion='READ', tabla_afectada='CalificacionTributaria')
+
+        assert self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+
+@pytest.mark.django_db
+class TestExportacionCondicional(ExportacionTestCase):
+    """Tests para exportar_excel / exportar_csv con archivo en cache"""
+
+    def test_archivo_no_modificado(self):
+        """Test: Con el ETag del archivo responde 304 sin enviarlo ni registrar otra descarga"""
+        response = self.client.get(reverse('exportar_csv'))
+        b''.join(response.streaming_content)
+        assert response['ETag'].startswith('"')
+        exportaciones = LogAuditoria.objects.filter(detalles__startswith='Exportación CSV')
+
+        no_modificada = self.client.get(reverse('exportar_csv'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert no_modificada.status_code == 304
+        assert exportaciones.count() == 1
+
+    def test_datos_nuevos_generan_otro_archivo(self):
+        response = self.client.get(reverse('exportar_excel'))
+        response.close()
+        CalificacionTributaria.objects.filter(mercado='CFI').get().save()
+
+        actual = self.client.get(reverse('exportar_excel'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert actual.status_code == 200
+        assert actual['ETag'] != response['ETag']
+        actual.close()
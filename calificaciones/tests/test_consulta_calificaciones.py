@@ -0,0 +1,113 @@
+"""
+Tests para CalificacionQuery (filtros compartidos de listado y exportaciones)
+Cubre: normalización de parámetros, filtros, proyección de columnas, clave de
+cache y número de consultas SQL de cada vista
+"""
+import pytest
+from datetime import date
+from django.http import QueryDict
+from django.urls import reverse
+from calificaciones.models import CalificacionTributaria, InstrumentoFinanciero
+from calificaciones.tests.test_exportacion import ExportacionTestCase
+from calificaciones.utils.consulta_calificaciones import CAMPOS_LISTADO, CalificacionQuery
+
+
+def consulta(texto):
+    return CalificacionQuery(QueryDict(texto))
+
+
+@pytest.mark.django_db
+class TestCalificacionQuery(ExportacionTestCase):
+    """Tests para CalificacionQuery (tres calificaciones de INST001: una CFI, dos ACN)"""
+
+    def test_sin_filtros(self):
+        assert consulta('').queryset().count() == 3
+
+    def test_filtros_combinados(self):
+        calificaciones = consulta('mercado=acn&ejercicio=2025&numero_dj=1').queryset()
+
+        assert [c.numero_dj for c in calificaciones] == ['1']
+
+    def test_codigo_busca_tambien_por_nombre(self):
+        assert consulta('codigo_instrumento=inst001').queryset().count() == 3
+        assert consulta('codigo_instrumento=instrumento uno').queryset().count() == 3
+        assert consulta('codigo_instrumento=otro').queryset().count() == 0
+
+    def test_rango_de_fechas(self):
+        assert consulta('fecha_desde=2025-01-15&fecha_hasta=2025-01-15').queryset().count() == 3
+        assert consulta('fecha_desde=2025-01-16').queryset().count() == 0
+
+    def test_valores_invalidos_se_ignoran(self):
+        """Test: Un ejercicio o fecha inválidos no rompen la consulta"""
+        q = consulta('ejercicio=abc&fecha_desde=2025-02-30&fecha_hasta=ayer&mercado=ACN')
+
+        assert q.activos == {'mercado': 'ACN'}
+        assert q.queryset().count() == 2
+
+    def test_listado_proyecta_columnas(self):
+        """Test: El listado trae el instrumento en la misma consulta y difiere el resto de la fila"""
+        calificacion = consulta('').para_listado()[0]
+
+        with self.assertNumQueries(0):
+            calificacion.instrumento.codigo_instrumento
+            calificacion.factor_37
+        assert 'observaciones' in calificacion.get_deferred_fields()
+        assert 'id' in CAMPOS_LISTADO
+
+    def test_exportacion_en_tuplas(self):
+        filas = list(consulta('mercado=cfi').para_exportacion(['numero_dj', 'instrumento__codigo_instrumento']))
+
+        assert filas == [('0', 'INST001')]
+
+    def test_clave_cache_normalizada(self):
+        """Test: Mismos filtros con otro orden, mayúsculas o espacios dan la misma clave"""
+        clave = consulta('mercado=acn&ejercicio=2025&codigo_instrumento=Inst').clave_cache()
+
+        assert clave == consulta('codigo_instrumento=INST+&ejercicio=2025&mercado=ACN&page=3').clave_cache()
+        assert clave == consulta('codigo_instrumento=inst&ejercicio=2025&mercado=ACN&numero_dj=').clave_cache()
+        assert clave != consulta('mercado=acn&ejercicio=2024&codigo_instrumento=inst').clave_cache()
+        assert clave.startswith('calificaciones:')
+        assert len(clave) < 250 and ' ' not in clave
+
+    def test_querystring_de_filtros_aplicados(self):
+        assert consulta('mercado=ACN&ejercicio=abc&numero_dj=&page=2').querystring() == 'mercado=ACN'
+
+
+@pytest.mark.django_db
+class TestConsultasPorVista(ExportacionTestCase):
+    """
+    Número de sentencias SQL de cada vista. Sesión, usuario, perfil y rol
+    (autenticación y permiso) son 4; el resto no depende del número de filas.
+    """
+
+    def setUp(self):
+        super().setUp()
+        instrumento = InstrumentoFinanciero.objects.create(codigo_instrumento='INST002')
+        CalificacionTributaria.objects.bulk_create([
+            CalificacionTributaria(instrumento=instrumento, fecha_informe=date(2025, 1, 15), numero_dj=str(n))
+            for n in range(20)
+        ])
+
+    def test_listar_calificaciones(self):
+        # Autenticación (4) + validador (también da el total del paginador) + página con el instrumento
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('listar_calificaciones'), {'mercado': 'acn'})
+
+        assert response.status_code == 200
+        assert 'mercado=acn' in response.context['filtros_query']
+
+    def test_exportar_csv_en_cache(self):
+        self.client.get(reverse('exportar_csv'))
+
+        # Autenticación (4) + versión de datos (2) + archivo en cache + acceso LRU + auditoría
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('exportar_csv'))
+            b''.join(response.streaming_content)
+
+    def test_exportar_excel_en_cache(self):
+        self.client.get(reverse('exportar_excel'))
+
+        # Autenticación (4) + versión de datos (2) + archivo en cache + acceso LRU + auditoría
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('exportar_excel'))
+            b''.join(response.streaming_content)
@@ -0,0 +1,134 @@
+"""
+Tests para el esquema de columnas de la carga masiva
+Cubre: alias de headers (HDU y exportación), valores por defecto, conversiones
+y errores iguales a los del diccionario por fila, pickling y lectura de filas crudas
+"""
+import io
+import pickle
+import openpyxl
+import pytest
+from decimal import Decimal
+from calificaciones.utils.esquema_carga import (
+    CAMPOS_VALORES,
+    EsquemaCarga,
+    campo_de_header,
+    fila_desde_registro,
+)
+from calificaciones.utils.lectores import leer_filas
+
+
+class TestCampoDeHeader:
+    """Tests para la resolución header -> campo"""
+
+    def test_nombre_canonico(self):
+        assert campo_de_header('factor_8') == 'factor_8'
+
+    def test_encabezados_de_exportacion(self):
+        """Test: Los encabezados de exportar_excel vuelven a su campo"""
+        assert campo_de_header('Código Instrumento') == 'codigo_instrumento'
+        assert campo_de_header('N° DJ') == 'numero_dj'
+        assert campo_de_header('Origen Tipo Soc') == 'tipo_sociedad'
+
+    def test_nombre_homologado_del_hdu(self):
+        """Test: El nombre de la hoja 'Homologación columnas' resuelve al factor"""
+        assert campo_de_header('Con crédito por IDPC generados a contar del 01.01.2017') == 'factor_8'
+
+    def test_header_desconocido(self):
+        assert campo_de_header('columna libre') is None
+
+
+class TestEsquemaCarga:
+    """Tests para EsquemaCarga"""
+
+    def test_valores_tipados_en_orden(self):
+        esquema = EsquemaCarga(['codigo_instrumento', 'ejercicio', 'factor_8', 'monto'])
+
+        valores = dict(zip(CAMPOS_VALORES, esquema.valores(['INST001', '2025', '0.1', '1500'])))
+
+        assert valores['ejercicio'] == 2025
+        assert valores['factor_8'] == Decimal('0.1')
+        assert valores['monto'] == Decimal('1500')
+
+    def test_valores_por_defecto_sin_columna(self):
+        """Test: Sin la columna se usa el mismo valor por defecto que el proceso original"""
+        valores = dict(zip(CAMPOS_VALORES, EsquemaCarga(['codigo_instrumento']).valores(['INST001'])))
+
+        assert valores['monto'] is None
+        assert valores['metodo_ingreso'] == 'MONTO'
+        assert valores['numero_dj'] == ''
+        assert valores['secuencia'] == 0
+        assert valores['valor_historico'] == Decimal('0')
+        assert valores['mercado'] is None
+        assert valores['factor_37'] == Decimal('0')
+
+    def test_celdas_vacias(self):
+        esquema = EsquemaCarga(['monto', 'secuencia', 'factor_8'])
+
+        valores = dict(zip(CAMPOS_VALORES, esquema.valores([None, '', None])))
+
+        assert (valores['monto'], valores['secuencia'], valores['factor_8']) == (None, 0, Decimal('0'))
+
+    def test_primer_error_de_la_fila(self):
+        """Test: Un valor inválido lanza la misma excepción, en el mismo orden de evaluación"""
+        esquema = EsquemaCarga(['ejercicio', 'secuencia'])
+
+        with pytest.raises(ValueError, match="'uno'"):
+            esquema.valores(['dos mil', 'uno'])
+
+    def test_requerido_y_obtener(self):
+        esquema = EsquemaCarga(['Código Instrumento', 'otra'])
+
+        assert esquema.requerido(['INST001', 'x'], 'codigo_instrumento') == 'INST001'
+        assert esquema.obtener(['INST001', 'x'], 'origen', 'BOLSA') == 'BOLSA'
+        assert esquema.ignoradas == ['otra']
+        with pytest.raises(KeyError):
+            esquema.requerido(['INST001', 'x'], 'fecha_informe')
+
+    def test_header_repetido_prevalece_el_ultimo(self):
+        esquema = EsquemaCarga(['factor_8', 'factor_8'])
+
+        assert esquema.obtener(['0.1', '0.2'], 'factor_8') == '0.2'
+
+    def test_pickle(self):
+        """Test: El esquema viaja a los procesos del pool"""
+        esquema = pickle.loads(pickle.dumps(EsquemaCarga(['N° DJ', 'factor_9'])))
+
+        assert esquema.indices == {'numero_dj': 0, 'factor_9': 1}
+        assert esquema.valores(['1949', '0.2'])[CAMPOS_VALORES.index('factor_9')] == Decimal('0.2')
+
+    def test_fila_desde_registro_reutiliza_esquema(self):
+        esquema, fila = fila_desde_registro({'codigo_instrumento': 'INST001', 'factor_8': '0.1'})
+        otro, _ = fila_desde_registro({'codigo_instrumento': 'INST002', 'factor_8': '0.2'})
+
+        assert otro is esquema
+        assert fila == ['INST001', '0.1']
+
+
+class TestLeerFilas:
+    """Tests para leer_filas"""
+
+    def test_csv_completa_filas_cortas_y_omite_lineas_en_blanco(self):
+        archivo = io.BytesIO(b'codigo_instrumento,fecha_informe,factor_8\nINST001,2025-01-15\n\nINST002,2025-01-15,0.3\n')
+
+        esquema, filas = leer_filas(archivo, 'carga.csv')
+
+        assert esquema.headers == ['codigo_instrumento', 'fecha_informe', 'factor_8']
+        assert list(filas) == [['INST001', '2025-01-15', None], ['INST002', '2025-01-15', '0.3']]
+
+    def test_excel_filtra_filas_sin_codigo(self):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(['Código Instrumento', 'Fecha Informe'])
+        ws.append(['INST001', '2025-01-15'])
+        ws.append([None, '2025-01-15'])
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+
+        esquema, filas = leer_filas(buffer, 'carga.xlsx')
+
+        assert [esquema.requerido(fila, 'codigo_instrumento') for fila in filas] == ['INST001']
+
+    def test_formato_no_soportado(self):
+        with pytest.raises(ValueError):
+            leer_filas(io.BytesIO(b''), 'carga.txt')
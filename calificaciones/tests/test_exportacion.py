@@ -0,0 +1,406 @@
+"""
+Tests para la exportación de calificaciones
+Cubre: CSV y Excel generados como archivo (contenido, filtros, consultas
+constantes, reparto en varias hojas, auditoría por descarga), bloques de
+salida de _lineas_csv y la cola con cache de archivos (cola_exportaciones):
+reutilización, versión de datos, modo asíncrono y presupuesto de disco LRU
+"""
+import csv
+import io
+import os
+import shutil
+import tempfile
+import openpyxl
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.utils import timezone
+from django.contrib.auth.models import User
+from django.urls import reverse
+from calificaciones import views
+from calificaciones.models import (
+    CalificacionTributaria,
+    InstrumentoFinanciero,
+    LogAuditoria,
+    PerfilUsuario,
+    Rol,
+    TrabajoExportacion,
+)
+from calificaciones.utils import cola_exportaciones
+from calificaciones.utils.cola_exportaciones import (
+    clave_exportacion,
+    ejecutar_exportacion,
+    escribir_csv,
+    escribir_excel,
+    filas_exportacion,
+    liberar_espacio,
+    reclamar_exportacion,
+    version_datos,
+)
+from calificaciones.utils.consulta_calificaciones import CalificacionQuery
+
+
+def leer_csv(response):
+    """Consume la respuesta y retorna sus filas."""
+    contenido = b''.join(response.streaming_content).decode('utf-8')
+    return list(csv.reader(io.StringIO(contenido)))
+
+
+def leer_excel(response):
+    """Consume la respuesta y retorna el libro."""
+    return openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+
+
+class ExportacionTestCase(TestCase):
+    """
+    Usuario con permiso de consulta y tres calificaciones activas. Los archivos
+    se generan dentro de la solicitud (sin workers) en un MEDIA_ROOT temporal.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root, EXPORTACION_ASINCRONA=False)
+        self.override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+        instrumento = InstrumentoFinanciero.objects.create(
+            codigo_instrumento='INST001', nombre_instrumento='Instrumento Uno'
+        )
+        for n in range(3):
+            CalificacionTributaria.objects.create(
+                instrumento=instrumento,
+                usuario_creador=self.user,
+                fecha_informe=date(2025, 1, 15),
+                numero_dj=str(n),
+                mercado='ACN' if n else 'CFI',
+                ejercicio=2025,
+                factor_8=Decimal('0.10000000'),
+            )
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+
+@pytest.mark.django_db
+class TestExportarCsv(ExportacionTestCase):
+    """Tests para exportar_csv"""
+
+    def test_archivo_csv(self):
+        """Test: El CSV se envía por bloques con encabezados y una fila por calificación"""
+        response = self.client.get(reverse('exportar_csv'))
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        assert response['Content-Disposition'].startswith('attachment; filename="calificaciones_')
+        filas = leer_csv(response)
+        encabezados, datos = filas[0], filas[1:]
+        assert encabezados[:4] == ['ID', 'Código Instrumento', 'Nombre Instrumento', 'Fecha Informe']
+        assert len(encabezados) == 45
+        assert len(datos) == 3
+        fila = dict(zip(encabezados, datos[-1]))
+        assert fila['Código Instrumento'] == 'INST001'
+        assert fila['Fecha Informe'] == '2025-01-15'
+        assert fila['Factor 8'] == '0.10000000'
+        assert fila['Factor 9'] == ''  # Cero: celda vacía
+        assert fila['Secuencia'] == ''
+        assert fila['Usuario Creador'] == 'analista'
+
+    def test_aplica_filtros(self):
+        response = self.client.get(reverse('exportar_csv'), {'mercado': 'cfi'})
+
+        datos = leer_csv(response)[1:]
+
+        assert [fila[4] for fila in datos] == ['CFI']
+
+    def test_auditoria_por_descarga(self):
+        """Test: Cada descarga (generada o reutilizada) queda en auditoría con las filas exportadas"""
+        exportaciones = LogAuditoria.objects.filter(detalles__startswith='Exportación CSV')
+
+        leer_csv(self.client.get(reverse('exportar_csv')))
+        leer_csv(self.client.get(reverse('exportar_csv')))
+
+        assert list(exportaciones.values_list('detalles', flat=True)) == [
+            'Exportación CSV: 3 registros con filtros aplicados'
+        ] * 2
+
+
+@pytest.mark.django_db
+class TestExportarExcel(ExportacionTestCase):
+    """Tests para exportar_excel"""
+
+    def test_libro_por_bloques(self):
+        """Test: El XLSX se envía por bloques con valores numéricos y celdas vacías"""
+        response = self.client.get(reverse('exportar_excel'))
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Disposition'].startswith('attachment; filename="calificaciones_')
+        wb = leer_excel(response)
+        assert wb.sheetnames == ['Calificaciones']
+        filas = list(wb.active.iter_rows(values_only=True))
+        encabezados, datos = filas[0], filas[1:]
+        assert len(encabezados) == 45
+        assert len(datos) == 3
+        fila = dict(zip(encabezados, datos[-1]))
+        assert fila['Factor 8'] == 0.1
+        assert fila['Factor 9'] is None
+        assert fila['Fecha Informe'] == '2025-01-15'
+        assert fila['Usuario Creador'] == 'analista'
+
+    def test_reparte_filas_en_varias_hojas(self):
+        """Test: Al superar el límite de filas por hoja se continúa en otra con los mismos encabezados"""
+        with patch.object(cola_exportaciones, 'MAX_FILAS_HOJA_EXCEL', 3):
+            response = self.client.get(reverse('exportar_excel'))
+
+        wb = leer_excel(response)
+
+        assert wb.sheetnames == ['Calificaciones', 'Calificaciones (2)']
+        hojas = [list(ws.iter_rows(values_only=True)) for ws in wb.worksheets]
+        assert [len(filas) for filas in hojas] == [3, 2]
+        assert hojas[1][0] == hojas[0][0]
+        assert sorted(fila[7] for filas in hojas for fila in filas[1:]) == ['0', '1', '2']
+
+    def test_una_consulta_de_datos(self):
+        """Test: El libro se escribe con una sola consulta, sin consultas por fila"""
+        with self.assertNumQueries(1):
+            exportadas = escribir_excel(filas_exportacion(CalificacionQuery({}), vacio=None), io.BytesIO())
+
+        assert exportadas == 3
+
+    def test_auditoria_con_filas_exportadas(self):
+        self.client.get(reverse('exportar_excel'), {'mercado': 'ACN'})
+
+        exportacion = LogAuditoria.objects.get(detalles__startswith='Exportación Excel')
+        assert exportacion.detalles == 'Exportación Excel: 2 registros con filtros aplicados'
+
+
+class TestLineasCsv:
+    """Tests para _lineas_csv"""
+
+    def test_encabezados_solos_y_bloques(self, monkeypatch):
+        """Test: La primera línea sale sola y el resto se agrupa en bloques"""
+        monkeypatch.setattr(views, 'TAMANO_BLOQUE_CSV', 20)
+        filas = [['encabezado']] + [['fila', n] for n in range(10)]
+
+        bloques = list(views._lineas_csv(filas))
+
+        assert bloques[0] == 'encabezado\r\n'
+        assert all(len(bloque) < 40 for bloque in bloques)
+        assert len(bloques) < len(filas)
+        assert ''.join(bloques) == 'encabezado\r\n' + ''.join(f'fila,{n}\r\n' for n in range(10))
+
+
+@pytest.mark.django_db
+class TestCacheExportaciones(ExportacionTestCase):
+    """Tests para la cola y cache de archivos de exportación"""
+
+    def test_solicitud_identica_reutiliza_el_archivo(self):
+        """Test: Mismos filtros (otro orden/mayúsculas) y datos sin cambios: no se vuelve a generar"""
+        leer_csv(self.client.get(reverse('exportar_csv'), {'mercado': 'acn', 'ejercicio': '2025'}))
+
+        with patch.object(cola_exportaciones, 'ejecutar_exportacion') as ejecutar:
+            filas = leer_csv(self.client.get(reverse('exportar_csv'), {'ejercicio': '2025', 'mercado': 'ACN'}))
+
+        ejecutar.assert_not_called()
+        assert len(filas) == 3
+        trabajo = TrabajoExportacion.objects.get()
+        assert trabajo.descargas == 2
+        assert os.path.exists(trabajo.archivo.path)
+
+    def test_formato_y_filtros_distintos_no_comparten_archivo(self):
+        self.client.get(reverse('exportar_csv'))
+        self.client.get(reverse('exportar_excel'))
+        self.client.get(reverse('exportar_csv'), {'mercado': 'CFI'})
+
+        assert TrabajoExportacion.objects.count() == 3
+
+    def test_datos_modificados_generan_archivo_nuevo(self):
+        """Test: Una modificación (incluida una eliminación lógica) cambia la versión de los datos"""
+        leer_csv(self.client.get(reverse('exportar_csv')))
+        version = version_datos()
+        calificacion = CalificacionTributaria.objects.filter(mercado='CFI').get()
+        calificacion.activo = False
+        calificacion.save()
+
+        filas = leer_csv(self.client.get(reverse('exportar_csv')))
+
+        assert version_datos() != version
+        assert len(filas) == 3  # Encabezados + 2 activas
+        assert TrabajoExportacion.objects.count() == 2
+
+    def test_nombre_de_instrumento_cambia_la_version(self):
+        version = version_datos()
+        instrumento = InstrumentoFinanciero.objects.get()
+        instrumento.nombre_instrumento = 'Instrumento Renombrado'
+        instrumento.save()
+
+        assert version_datos() != version
+
+    def test_archivo_descartado_se_regenera(self):
+        response = self.client.get(reverse('exportar_excel'))
+        response.close()
+        trabajo = TrabajoExportacion.objects.get()
+        os.remove(trabajo.archivo.path)
+
+        wb = leer_excel(self.client.get(reverse('exportar_excel')))
+
+        assert wb.active.max_row == 4
+        trabajo.refresh_from_db()
+        assert trabajo.estado == 'COMPLETADO' and trabajo.intentos == 1
+
+    @override_settings(EXPORTACION_ASINCRONA=True)
+    def test_modo_asincrono(self):
+        """Test: La vista encola el trabajo; el worker genera el archivo y la descarga lo envía"""
+        response = self.client.get(reverse('exportar_excel'), {'mercado': 'ACN'})
+
+        assert response.status_code == 202
+        trabajo = response.context['trabajo']
+        assert trabajo.estado == 'PENDIENTE'
+        progreso = self.client.get(reverse('progreso_exportacion', args=[trabajo.id])).json()
+        assert progreso == {'estado': 'PENDIENTE', 'filas_exportadas': 0, 'url_descarga': None}
+        assert self.client.get(reverse('descargar_exportacion', args=[trabajo.id])).status_code == 404
+        # Una solicitud idéntica espera el mismo trabajo
+        assert self.client.get(reverse('exportar_excel'), {'mercado': 'acn'}).context['trabajo'] == trabajo
+
+        call_command('procesar_exportaciones', '--una-vez', stdout=io.StringIO())
+
+        progreso = self.client.get(reverse('progreso_exportacion', args=[trabajo.id])).json()
+        assert progreso['estado'] == 'COMPLETADO'
+        assert progreso['filas_exportadas'] == 2
+        wb = leer_excel(self.client.get(progreso['url_descarga']))
+        assert wb.active.max_row == 3
+        assert self.client.get(reverse('exportar_excel'), {'mercado': 'acn'}).status_code == 200
+
+    @override_settings(EXPORTACION_ASINCRONA=True)
+    def test_trabajo_fallido_se_reencola(self):
+        self.client.get(reverse('exportar_csv'))
+        with patch.object(cola_exportaciones, 'escribir_csv', side_effect=OSError('disco lleno')):
+            call_command('procesar_exportaciones', '--una-vez', stdout=io.StringIO(), stderr=io.StringIO())
+        trabajo = TrabajoExportacion.objects.get()
+        assert trabajo.estado == 'FALLIDO'
+        assert trabajo.error == 'disco lleno'
+
+        response = self.client.get(reverse('exportar_csv'))
+
+        assert response.status_code == 202
+        trabajo.refresh_from_db()
+        assert trabajo.estado == 'PENDIENTE' and trabajo.error == ''
+
+    def crear_calificacion(self, numero_dj):
+        CalificacionTributaria.objects.create(
+            instrumento=InstrumentoFinanciero.objects.get(),
+            usuario_creador=self.user,
+            fecha_informe=date(2025, 1, 15),
+            numero_dj=numero_dj,
+            mercado='ACN',
+            ejercicio=2025,
+        )
+
+    @override_settings(EXPORTACION_ASINCRONA=True)
+    def test_datos_modificados_antes_de_generar_cambian_la_clave(self):
+        """Test: El trabajo se completa con la versión y la clave de los datos que contiene el archivo"""
+        trabajo = self.client.get(reverse('exportar_csv')).context['trabajo']
+        self.crear_calificacion('99')
+
+        call_command('procesar_exportaciones', '--una-vez', stdout=io.StringIO())
+
+        trabajo.refresh_from_db()
+        version = version_datos()
+        assert trabajo.version_datos == version
+        assert trabajo.clave == clave_exportacion(CalificacionQuery({}), 'CSV', version)
+        response = self.client.get(reverse('exportar_csv'))
+        assert response.status_code == 200
+        assert len(leer_csv(response)) == 5  # Encabezados + 4 calificaciones
+        assert TrabajoExportacion.objects.count() == 1
+
+    @override_settings(EXPORTACION_ASINCRONA=True)
+    def test_clave_de_la_version_exportada_ya_solicitada(self):
+        """Test: Si otro trabajo ya tiene la clave de la versión exportada, se completa con una clave propia"""
+        anterior = self.client.get(reverse('exportar_csv')).context['trabajo']
+        self.crear_calificacion('99')
+        actual = self.client.get(reverse('exportar_csv')).context['trabajo']
+
+        trabajo = ejecutar_exportacion(reclamar_exportacion('worker-test', trabajo_id=anterior.id))
+
+        assert trabajo.estado == 'COMPLETADO'
+        assert trabajo.version_datos == version_datos()
+        assert trabajo.clave not in (anterior.clave, actual.clave)
+        actual.refresh_from_db()
+        assert actual.estado == 'PENDIENTE'
+
+    @override_settings(EXPORTACION_ASINCRONA=True)
+    def test_datos_modificados_durante_la_generacion(self):
+        """Test: Si la versión cambia mientras se escribe el archivo, se vuelve a generar"""
+        self.client.get(reverse('exportar_csv'))
+        versiones = iter(['v1', 'v2', 'v2'])
+
+        with patch.object(cola_exportaciones, 'version_datos', side_effect=lambda: next(versiones)), \
+                patch.object(cola_exportaciones, 'escribir_csv', wraps=escribir_csv) as escribir:
+            call_command('procesar_exportaciones', '--una-vez', stdout=io.StringIO())
+
+        trabajo = TrabajoExportacion.objects.get()
+        assert escribir.call_count == 2
+        assert (trabajo.estado, trabajo.version_datos) == ('COMPLETADO', 'v2')
+        with open(trabajo.archivo.path, encoding='utf-8') as archivo:
+            assert len(list(csv.reader(archivo))) == 4
+
+    @override_settings(EXPORTACION_ASINCRONA=True)
+    def test_datos_que_no_dejan_de_cambiar(self):
+        """Test: Tras MAX_GENERACIONES lecturas con datos cambiando, el trabajo falla"""
+        self.client.get(reverse('exportar_csv'))
+        versiones = iter(range(100))
+
+        with patch.object(cola_exportaciones, 'version_datos', side_effect=lambda: str(next(versiones))):
+            call_command('procesar_exportaciones', '--una-vez', stdout=io.StringIO(), stderr=io.StringIO())
+
+        trabajo = TrabajoExportacion.objects.get()
+        assert trabajo.estado == 'FALLIDO'
+        assert 'Los datos cambiaron' in trabajo.error
+
+
+@pytest.mark.django_db
+class TestLiberarEspacio(ExportacionTestCase):
+    """Tests para el presupuesto de disco (LRU)"""
+
+    def generar(self, **filtros):
+        leer_csv(self.client.get(reverse('exportar_csv'), filtros))
+        return TrabajoExportacion.objects.latest('id')
+
+    def test_descarta_los_menos_usados(self):
+        """Test: Se eliminan archivo y registro de los menos usados recientemente"""
+        antiguo = self.generar(mercado='ACN')
+        usado = self.generar(mercado='CFI')
+        reciente = self.generar()
+        ahora = timezone.now()
+        TrabajoExportacion.objects.filter(pk=antiguo.pk).update(ultimo_acceso=ahora - timedelta(hours=2))
+        TrabajoExportacion.objects.filter(pk=usado.pk).update(ultimo_acceso=ahora)
+        TrabajoExportacion.objects.filter(pk=reciente.pk).update(ultimo_acceso=ahora - timedelta(hours=1))
+
+        descartados = liberar_espacio(max_bytes=usado.tamano + reciente.tamano)
+
+        assert descartados == 1
+        assert set(TrabajoExportacion.objects.values_list('pk', flat=True)) == {usado.pk, reciente.pk}
+        assert not os.path.exists(antiguo.archivo.path)
+        assert os.path.exists(usado.archivo.path)
+
+    def test_conserva_el_mas_reciente_aunque_supere_el_presupuesto(self):
+        self.generar(mercado='ACN')
+        ultimo = self.generar()
+
+        assert liberar_espacio(max_bytes=1) == 1
+        assert list(TrabajoExportacion.objects.values_list('pk', flat=True)) == [ultimo.pk]
+
+    @override_settings(EXPORTACION_CACHE_MAX_MB=0)
+    def test_se_aplica_al_completar(self):
+        self.generar(mercado='ACN')
+        ultimo = self.generar()
+
+        assert list(TrabajoExportacion.objects.values_list('pk', flat=True)) == [ultimo.pk]
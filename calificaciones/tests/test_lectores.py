@@ -0,0 +1,161 @@
+"""
+Tests para los lectores de archivos de carga masiva
+Cubre: lectura Excel/CSV en streaming, CSV comprimido, filtrado y estimación de filas
+"""
+import gzip
+import io
+import types
+import openpyxl
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from calificaciones.forms import CargaMasivaForm
+from calificaciones.utils import lectores
+from calificaciones.utils.lectores import (
+    _filas_csv,
+    _filas_excel,
+    contar_filas,
+    leer_filas,
+)
+
+
+def excel_en_memoria(filas):
+    """Crea un .xlsx en memoria con header + filas."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['codigo_instrumento', 'fecha_informe', 'factor_8'])
+    for fila in filas:
+        ws.append(fila)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+class TestLectorExcel:
+    """Tests para _filas_excel"""
+
+    def test_retorna_generador(self):
+        """Test: El lector entrega el esquema y las filas crudas de forma perezosa"""
+        esquema, filas = _filas_excel(excel_en_memoria([['INST001', '2025-01-15', 0.1]]))
+
+        assert esquema.headers == ['codigo_instrumento', 'fecha_informe', 'factor_8']
+        assert isinstance(filas, types.GeneratorType)
+        assert next(filas) == ('INST001', '2025-01-15', 0.1)
+
+    def test_filtra_filas_sin_codigo(self):
+        """Test: Las filas sin codigo_instrumento se descartan"""
+        archivo = excel_en_memoria([
+            ['INST001', '2025-01-15', 0.1],
+            [None, '2025-01-15', 0.2],
+            ['INST002', '2025-01-15', 0.3],
+        ])
+
+        _, filas = _filas_excel(archivo)
+
+        assert [fila[0] for fila in filas] == ['INST001', 'INST002']
+
+    def test_archivo_sin_filas(self):
+        """Test: Un Excel sin header no produce filas"""
+        wb = openpyxl.Workbook()
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+
+        _, filas = _filas_excel(buffer)
+
+        assert list(filas) == []
+
+
+class TestLectorCsv:
+    """Tests para _filas_csv y leer_filas"""
+
+    def test_caracter_multibyte_partido_entre_bloques(self, monkeypatch):
+        """Test: Un carácter UTF-8 cortado en el borde de un bloque se decodifica bien"""
+        monkeypatch.setattr(lectores, 'TAMANO_BLOQUE', 3)
+        archivo = io.BytesIO('codigo_instrumento,observaciones\nINST001,Año señal\n'.encode('utf-8'))
+
+        esquema, filas = _filas_csv(archivo)
+
+        assert esquema.headers == ['codigo_instrumento', 'observaciones']
+        assert isinstance(filas, types.GeneratorType)
+        assert list(filas) == [['INST001', 'Año señal']]
+
+    def test_campo_entre_comillas_con_salto_de_linea(self):
+        """Test: Saltos de línea dentro de comillas y finales CRLF se respetan"""
+        archivo = io.BytesIO(b'codigo_instrumento,observaciones\r\nINST001,"linea 1\nlinea 2"\r\nINST002,x')
+
+        filas = list(_filas_csv(archivo)[1])
+
+        assert filas[0][1] == 'linea 1\nlinea 2'
+        assert filas[1] == ['INST002', 'x']
+
+    def test_filas_cortas_se_completan(self):
+        """Test: Las filas con menos celdas que el header se completan con None; las líneas en blanco se omiten"""
+        archivo = io.BytesIO(b'codigo_instrumento,fecha_informe,factor_8\nINST001\n\nINST002,2025-01-15\n')
+
+        _, filas = _filas_csv(archivo)
+
+        assert list(filas) == [['INST001', None, None], ['INST002', '2025-01-15', None]]
+
+    def test_lee_desde_chunks_del_archivo_subido(self):
+        """Test: Usa UploadedFile.chunks() cuando está disponible"""
+        subido = SimpleUploadedFile('carga.csv', b'codigo_instrumento\nINST001\n')
+
+        _, filas = leer_filas(subido, 'carga.csv')
+
+        assert list(filas) == [['INST001']]
+
+    def test_csv_gz_se_descomprime_al_vuelo(self):
+        """Test: Un .csv.gz se lee igual que el CSV original"""
+        contenido = b'codigo_instrumento,factor_8\nINST001,0.1\nINST002,0.2\n'
+        archivo = io.BytesIO(gzip.compress(contenido))
+
+        assert contar_filas(archivo, 'carga.csv.gz') == 2
+        _, filas = leer_filas(archivo, 'carga.csv.gz')
+
+        assert [fila[0] for fila in filas] == ['INST001', 'INST002']
+
+    def test_csv_gz_invalido(self):
+        """Test: Un .gz corrupto se reporta como error de formato"""
+        with pytest.raises(ValueError, match='Archivo comprimido inválido'):
+            leer_filas(io.BytesIO(b'no es gzip'), 'carga.csv.gz')
+
+    def test_utf8_invalido_es_error_de_formato(self):
+        """Test: Bytes que no son UTF-8 se reportan como ValueError"""
+        with pytest.raises(ValueError):
+            list(leer_filas(io.BytesIO(b'codigo_instrumento\nINST\xff\n'), 'carga.csv')[1])
+
+    def test_formato_no_soportado(self):
+        with pytest.raises(ValueError, match='Formato de archivo no soportado'):
+            leer_filas(io.BytesIO(b''), 'carga.txt')
+
+    def test_formulario_acepta_csv_gz(self):
+        """Test: El formulario de carga acepta .csv.gz y rechaza otros .gz"""
+        valido = CargaMasivaForm(files={'archivo': SimpleUploadedFile('carga.csv.gz', b'x')})
+        invalido = CargaMasivaForm(files={'archivo': SimpleUploadedFile('carga.txt.gz', b'x')})
+
+        assert valido.is_valid()
+        assert not invalido.is_valid()
+
+
+class TestContarFilas:
+    """Tests para contar_filas"""
+
+    def test_contar_filas_excel(self):
+        """Test: Excel usa la dimensión de la hoja y deja el archivo al inicio"""
+        archivo = excel_en_memoria([['INST001', '2025-01-15', 0.1]] * 3)
+
+        assert contar_filas(archivo, 'carga.xlsx') == 3
+        _, filas = leer_filas(archivo, 'carga.xlsx')
+        assert len(list(filas)) == 3
+
+    def test_contar_filas_csv_sin_salto_final(self):
+        """Test: CSV cuenta la última línea aunque no termine en salto de línea"""
+        archivo = io.BytesIO(b"codigo_instrumento,factor_8\nINST001,0.1\nINST002,0.2")
+
+        assert contar_filas(archivo, 'carga.csv') == 2
+        assert archivo.tell() == 0
+
+    def test_contar_filas_archivo_corrupto(self):
+        """Test: Un archivo ilegible no rompe la estimación"""
+        assert contar_filas(io.BytesIO(b"no es un excel"), 'carga.xlsx') is None
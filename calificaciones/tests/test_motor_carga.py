@@ -0,0 +1,830 @@
+"""
+Tests para el motor de ingesta masiva por lotes
+Cubre: creación, actualización, regla de prioridad, filas sin cambios, errores por fila,
+consultas por lote, paridad del modo multiproceso, simulación (dry run),
+confirmación por transacciones con checkpoint, bloqueo de claves entre cargas
+concurrentes, log muestreado por lote y carga con encabezados homologados
+"""
+import io
+import logging
+import shutil
+import tempfile
+import threading
+import pytest
+from decimal import Decimal
+from unittest.mock import patch
+from django.test import TestCase, Client, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from calificaciones.models import (
+    CalificacionTributaria,
+    CargaMasiva,
+    InstrumentoFinanciero,
+    PerfilUsuario,
+    Rol
+)
+from calificaciones.utils import log_carga, motor_carga
+from calificaciones.utils.bloqueo_carga import ESPACIO_CALIFICACION, ESPACIO_INSTRUMENTO, clave_bloqueo
+from calificaciones.utils.log_carga import detener_cola_log, iniciar_cola_log
+from calificaciones.utils.motor_carga import MotorCargaMasiva, filas_colapsadas
+
+
+def registro_base(**kwargs):
+    """Fila de carga masiva válida (formato CSV: todos los valores como texto)"""
+    registro = {
+        'codigo_instrumento': 'INST001',
+        'fecha_informe': '2025-01-15',
+        'origen': 'BOLSA',
+        'mercado': 'ACN',
+        'tipo_sociedad': 'A',
+        'secuencia': '1',
+        'numero_dividendo': '0',
+        'ejercicio': '2025',
+        'numero_dj': '1949',
+        'factor_8': '0.1',
+        'factor_9': '0.2',
+    }
+    registro.update(kwargs)
+    return registro
+
+
+@pytest.mark.django_db
+class TestMotorCargaMasiva(TestCase):
+    """Tests para MotorCargaMasiva"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+
+    def test_crea_instrumentos_y_calificaciones(self):
+        """Test: Filas nuevas crean instrumento y calificación"""
+        registros = [
+            registro_base(),
+            registro_base(codigo_instrumento='INST002', nombre_instrumento='Bono Dos'),
+        ]
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert resultado.creados == 2
+        assert resultado.actualizados == 0
+        assert resultado.errores == []
+        assert InstrumentoFinanciero.objects.get(codigo_instrumento='INST002').nombre_instrumento == 'Bono Dos'
+        calificacion = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST001')
+        assert calificacion.factor_8 == Decimal('0.1')
+        assert calificacion.fuente_origen == 'MASIVA'
+
+    def test_actualiza_registro_existente(self):
+        """Test: Una clave existente se actualiza en lugar de duplicarse"""
+        MotorCargaMasiva(usuario=self.user).procesar([registro_base()])
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar([registro_base(factor_8='0.5')])
+
+        assert resultado.creados == 0
+        assert resultado.actualizados == 1
+        assert CalificacionTributaria.objects.count() == 1
+        assert CalificacionTributaria.objects.get().factor_8 == Decimal('0.5')
+
+    def test_diferencias_por_campo_de_filas_actualizadas(self):
+        """Test: Las filas actualizadas registran solo los campos que cambiaron"""
+        MotorCargaMasiva(usuario=self.user).procesar([registro_base(), registro_base(codigo_instrumento='INST002')])
+        anterior = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST001')
+
+        cambios = []
+        resultado = MotorCargaMasiva(usuario=self.user).procesar([
+            registro_base(factor_8='0.5', mercado='CFI'),
+            registro_base(codigo_instrumento='INST002', factor_8='0.10'),  # Mismo valor con otra escala
+            registro_base(codigo_instrumento='INST003'),
+        ], checkpoint=lambda fila, parcial: cambios.append(parcial.cambios))
+
+        assert resultado.actualizados == 1
+        assert dict(cambios[0].conteo_campos) == {'factor_8': 1, 'mercado': 1}
+        assert sorted(cambios[0].diferencias, key=lambda d: d.campo) == [
+            (1, anterior.id, 'factor_8', Decimal('0.10000000'), Decimal('0.5')),
+            (1, anterior.id, 'mercado', 'ACN', 'CFI'),
+        ]
+
+    def test_comparar_campos_decimales_escalados(self):
+        """Test: Los decimales se comparan por valor exacto (escala, nulos y el menor cambio posible)"""
+        anteriores = [
+            CalificacionTributaria(pk=1, factor_8=Decimal('0.10000000'), factor_9=None, monto=Decimal('10')),
+            CalificacionTributaria(pk=2, factor_8=Decimal('0.00000001'), factor_9=Decimal('0'), mercado='ACN'),
+        ]
+        nuevos = [
+            CalificacionTributaria(factor_8=Decimal('0.1'), factor_9=Decimal('0'), monto=Decimal('10.0000')),
+            CalificacionTributaria(factor_8=Decimal('0.00000002'), factor_9=Decimal('0'), mercado='CFI'),
+        ]
+
+        conteo, diferencias = motor_carga.comparar_campos([3, 7], anteriores, nuevos)
+
+        assert conteo == {'factor_9': 1, 'factor_8': 1, 'mercado': 1}
+        assert diferencias == [
+            (3, 1, 'factor_9', None, Decimal('0')),
+            (7, 2, 'mercado', 'ACN', 'CFI'),
+            (7, 2, 'factor_8', Decimal('0.00000001'), Decimal('0.00000002')),
+        ]
+
+    def test_regla_prioridad_corredora_sobre_bolsa(self):
+        """Test: Un registro de CORREDORA no se sobrescribe con datos de BOLSA"""
+        MotorCargaMasiva(usuario=self.user).procesar([registro_base(origen='CORREDORA')])
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar([registro_base(factor_8='0.9')])
+
+        assert resultado.omitidos == 1
+        assert resultado.errores == [
+            "Fila 1: OMITIDO - Registro existente de Corredora tiene prioridad sobre Bolsa. "
+            "Instrumento: INST001, Fecha: 2025-01-15"
+        ]
+        assert CalificacionTributaria.objects.get().factor_8 == Decimal('0.1')
+
+    def test_prioridad_dentro_del_mismo_archivo(self):
+        """Test: La regla de prioridad considera filas anteriores del mismo lote"""
+        registros = [
+            registro_base(origen='CORREDORA'),
+            registro_base(factor_8='0.9'),
+            registro_base(origen='CORREDORA', factor_8='0.3'),
+        ]
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert (resultado.creados, resultado.actualizados, resultado.omitidos) == (1, 1, 1)
+        assert CalificacionTributaria.objects.get().factor_8 == Decimal('0.3')
+
+    def test_fila_sin_cambios_no_se_reescribe(self):
+        """Test: Una fila con la misma huella de contenido se cuenta como sin cambios"""
+        MotorCargaMasiva(usuario=self.user).procesar([registro_base(), registro_base(numero_dj='1922')])
+        antes = CalificacionTributaria.objects.get(numero_dj='1949').fecha_modificacion
+
+        # factor_8 equivalente (0.10 == 0.1) no cuenta como cambio
+        registros = [registro_base(factor_8='0.10'), registro_base(numero_dj='1922', factor_9='0.3')]
+        resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert (resultado.sin_cambios, resultado.actualizados, resultado.exitosos) == (1, 1, 2)
+        assert CalificacionTributaria.objects.get(numero_dj='1949').fecha_modificacion == antes
+        assert CalificacionTributaria.objects.get(numero_dj='1922').factor_9 == Decimal('0.3')
+
+    def test_recarga_identica_sin_escrituras(self):
+        """Test: Re-cargar filas idénticas no ejecuta UPDATE"""
+        registros = [registro_base(numero_dj=str(n)) for n in range(5)]
+        MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        # Transacción de commit y savepoint del lote (SAVEPOINT x2) + lock de escritura (SQLite)
+        # + instrumentos + existentes + RELEASE x2
+        with self.assertNumQueries(7):
+            resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert resultado.sin_cambios == 5
+
+    def test_huella_se_actualiza_en_save_manual(self):
+        """Test: Editar una calificación fuera de la carga masiva recalcula su huella"""
+        MotorCargaMasiva(usuario=self.user).procesar([registro_base()])
+        calificacion = CalificacionTributaria.objects.get()
+        calificacion.factor_8 = Decimal('0.4')
+        calificacion.save()
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar([registro_base()])
+
+        assert (resultado.sin_cambios, resultado.actualizados) == (0, 1)
+        assert CalificacionTributaria.objects.get().factor_8 == Decimal('0.1')
+
+    def test_errores_por_fila(self):
+        """Test: Cada fila inválida genera el mismo mensaje que el proceso fila a fila"""
+        registros = [
+            registro_base(factor_8='0.6', factor_9='0.6', numero_dj='1'),
+            {'fecha_informe': '2025-01-15'},
+            registro_base(secuencia='abc', numero_dj='2'),
+            registro_base(numero_dj='3'),
+            registro_base(factor_12='1.5', numero_dj='4'),
+        ]
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert resultado.creados == 1
+        assert resultado.fallidos == 4
+        assert resultado.errores[0] == (
+            "Fila 1: {'__all__': ['La suma de los factores 8 al 16 no puede superar 1.']}"
+        )
+        assert resultado.errores[1] == "Fila 2: Campo requerido faltante - 'codigo_instrumento'"
+        assert resultado.errores[2].startswith("Fila 3: Valor inválido - invalid literal for int()")
+        assert resultado.errores[3] == (
+            "Fila 5: {'__all__': ['El factor_12 debe estar entre 0 y 1. Valor recibido: 1.5']}"
+        )
+        # Código y columna para CargaMasivaError
+        assert [(e.fila, e.codigo, e.columna) for e in resultado.errores_fila] == [
+            (1, 'REGLA_B', ''),
+            (2, 'CAMPO_FALTANTE', 'codigo_instrumento'),
+            (3, 'VALOR_INVALIDO', ''),
+            (5, 'REGLA_A', 'factor_12'),
+        ]
+
+    def test_consultas_constantes_por_lote(self):
+        """Test: El número de consultas no crece con el número de filas del lote"""
+        MotorCargaMasiva(usuario=self.user).procesar(
+            [registro_base(numero_dj=str(n)) for n in range(5)]
+        )
+        registros = [registro_base(numero_dj=str(n), factor_8='0.4') for n in range(10)]
+
+        # SAVEPOINT x2 (commit + lote) + lock de escritura (SQLite) + instrumentos + existentes
+        # + bulk_create + staging de actualizadas (CREATE + DELETE + carga + UPDATE ... FROM) + RELEASE x2
+        with self.assertNumQueries(12):
+            resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert (resultado.creados, resultado.actualizados) == (5, 5)
+
+    def test_actualizacion_solo_escribe_columnas_modificadas(self):
+        """Test: El UPDATE de las filas actualizadas solo asigna las columnas que cambiaron en el bloque"""
+        MotorCargaMasiva(usuario=self.user).procesar([registro_base(numero_dj=str(n)) for n in range(3)])
+        registros = [registro_base(numero_dj='0', factor_8='0.4'), registro_base(numero_dj='1', mercado='CFI')]
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert resultado.actualizados == 2
+        update = next(
+            q['sql'] for q in consultas.captured_queries if q['sql'].startswith('UPDATE') and ' FROM ' in q['sql']
+        )
+        asignadas = update.split(' SET ')[1].split(' FROM ')[0]
+        for columna in ('factor_8', 'mercado', 'huella', 'usuario_creador_id', 'fecha_modificacion'):
+            assert f'"{columna}" = ' in asignadas
+        assert '"factor_9" = ' not in asignadas
+        assert CalificacionTributaria.objects.get(numero_dj='0').factor_8 == Decimal('0.4')
+        assert CalificacionTributaria.objects.get(numero_dj='1').mercado == 'CFI'
+
+    def test_filas_sin_codigo_crean_instrumentos_en_lote(self):
+        """Test: Las filas sin código crean un instrumento cada una con un solo bulk_create"""
+        InstrumentoFinanciero.objects.create(codigo_instrumento='BC', nombre_instrumento='Bono Corto', tipo_instrumento='BONO')
+        registros = [
+            registro_base(codigo_instrumento='', nombre_instrumento='Bono Corporativo', numero_dj=str(n))
+            for n in range(5)
+        ]
+
+        # SAVEPOINT x2 + lock de escritura (SQLite) + prefijos de código + bulk_create instrumentos
+        # + existentes + bulk_create + RELEASE x2
+        with self.assertNumQueries(9):
+            resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert resultado.creados == 5
+        codigos = set(
+            CalificacionTributaria.objects.values_list('instrumento__codigo_instrumento', flat=True)
+        )
+        assert codigos == {'BC1', 'BC2', 'BC3', 'BC4', 'BC5'}
+
+    def test_error_de_escritura_se_atribuye_a_la_fila(self):
+        """Test: Si la escritura del lote falla, solo la fila culpable queda como fallida"""
+        registros = [
+            registro_base(numero_dj='1'),
+            registro_base(numero_dj=None),
+            registro_base(numero_dj='2'),
+        ]
+
+        resultado = MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        assert (resultado.creados, resultado.fallidos) == (2, 1)
+        assert resultado.errores[0].startswith("Fila 2: Error de integridad de datos")
+        assert CalificacionTributaria.objects.count() == 2
+
+
+@pytest.mark.django_db
+class TestMotorCargaMasivaParalelo(TestCase):
+    """Tests para el parseo/validación en varios procesos (un solo escritor)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        MotorCargaMasiva(usuario=self.user).procesar([
+            registro_base(codigo_instrumento='INST003', origen='CORREDORA'),
+            registro_base(codigo_instrumento='INST004'),
+        ])
+
+    def ejecutar(self, procesos):
+        """Procesa el archivo de prueba y revierte; retorna (resultado, filas finales)."""
+        registros = []
+        for n in range(40):
+            registros.append(registro_base(
+                codigo_instrumento=f'INST{n % 5:03d}', numero_dj=str(n % 4), factor_8=f'0.{n % 2}'
+            ))
+        registros += [
+            registro_base(codigo_instrumento='INST003'),  # Omitido por prioridad
+            registro_base(codigo_instrumento='INST004', factor_8='0.3'),  # Actualizado
+            registro_base(factor_8='0.9', factor_9='0.9', numero_dj='90'),  # REGLA B
+            registro_base(secuencia='x', numero_dj='91'),  # Valor inválido
+            {'fecha_informe': '2025-01-15'},  # Sin código
+            registro_base(fecha_informe='15/01/2025'),  # Fecha inválida
+        ]
+        with transaction.atomic():
+            resultado = MotorCargaMasiva(usuario=self.user, tamano_lote=7, procesos=procesos).procesar(registros)
+            filas = sorted(
+                CalificacionTributaria.objects.values_list(
+                    'instrumento__codigo_instrumento', 'numero_dj', 'origen', 'factor_8', 'huella'
+                )
+            )
+            transaction.set_rollback(True)
+        return resultado, filas
+
+    def test_resultado_identico_al_serial(self):
+        """Test: Con un pool de procesos contadores, errores y datos coinciden con el serial"""
+        serial, filas_serial = self.ejecutar(procesos=1)
+        paralelo, filas_paralelo = self.ejecutar(procesos=2)
+
+        contadores = lambda r: (r.procesados, r.creados, r.actualizados, r.sin_cambios, r.omitidos, r.fallidos)
+        assert contadores(paralelo) == contadores(serial)
+        assert paralelo.errores == serial.errores
+        assert filas_paralelo == filas_serial
+        assert serial.omitidos == 1 and serial.fallidos == 4
+        assert serial.actualizados and serial.sin_cambios
+
+
+@pytest.mark.django_db
+class TestMotorCargaMasivaStaging(TestCase):
+    """Tests para la escritura vía tabla de staging + INSERT ... ON CONFLICT"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        MotorCargaMasiva(usuario=self.user).procesar([
+            registro_base(codigo_instrumento='INST003', origen='CORREDORA'),
+            registro_base(codigo_instrumento='INST004'),
+            registro_base(codigo_instrumento='INST005'),
+        ])
+
+    def ejecutar(self, staging):
+        """Procesa el archivo de prueba y revierte; retorna (resultado, filas finales)."""
+        registros = []
+        for n in range(30):
+            registros.append(registro_base(
+                codigo_instrumento=f'INST{n % 5:03d}', numero_dj=str(n % 3), factor_8=f'0.{n % 2}'
+            ))
+        registros += [
+            registro_base(codigo_instrumento='INST003'),  # Omitido por prioridad
+            registro_base(codigo_instrumento='INST004', factor_8='0.3'),  # Actualizado
+            registro_base(codigo_instrumento='INST005'),  # Sin cambios
+            registro_base(codigo_instrumento='INST006', origen='BOLSA', numero_dj='7'),  # Creado
+            registro_base(codigo_instrumento='INST006', origen='CORREDORA', numero_dj='7'),  # Actualiza la anterior
+            registro_base(codigo_instrumento='INST006', origen='BOLSA', numero_dj='7'),  # Omitido (misma clave)
+            registro_base(factor_8='0.9', factor_9='0.9', numero_dj='90'),  # REGLA B
+            registro_base(secuencia='x', numero_dj='91'),  # Valor inválido
+            registro_base(numero_dj='12345678901'),  # DJ demasiado larga
+            {'fecha_informe': '2025-01-15'},  # Sin código
+        ]
+        with transaction.atomic():
+            resultado = MotorCargaMasiva(usuario=self.user, tamano_lote=9, staging=staging).procesar(registros)
+            filas = sorted(
+                CalificacionTributaria.objects.values_list(
+                    'instrumento__codigo_instrumento', 'numero_dj', 'origen', 'fuente_origen',
+                    'factor', 'factor_8', 'huella', 'usuario_creador',
+                )
+            )
+            transaction.set_rollback(True)
+        return resultado, filas
+
+    def test_resultado_identico_al_proceso_por_lotes(self):
+        """Test: Con staging contadores, errores y datos coinciden con bulk_create / bulk_update"""
+        lotes, filas_lotes = self.ejecutar(staging=False)
+        staging, filas_staging = self.ejecutar(staging=True)
+
+        contadores = lambda r: (r.procesados, r.creados, r.actualizados, r.sin_cambios, r.omitidos, r.fallidos)
+        assert contadores(staging) == contadores(lotes)
+        assert staging.errores == lotes.errores
+        assert staging.errores_fila == lotes.errores_fila
+        assert filas_staging == filas_lotes
+        assert lotes.omitidos == 2 and lotes.fallidos == 4
+        assert lotes.creados and lotes.actualizados and lotes.sin_cambios
+
+    def test_consultas_constantes_por_lote(self):
+        """Test: La escritura con staging no hace consultas por fila"""
+        registros = [registro_base(codigo_instrumento='INST004', numero_dj=str(n)) for n in range(10)]
+
+        # SAVEPOINT x2 + lock de escritura (SQLite) + instrumentos + CREATE + DELETE + carga
+        # + clasificación + upsert + RELEASE x2
+        with self.assertNumQueries(11):
+            resultado = MotorCargaMasiva(usuario=self.user, staging=True).procesar(registros)
+
+        assert resultado.creados == 10
+        assert CalificacionTributaria.objects.get(numero_dj='3').huella
+
+    def test_error_de_escritura_se_atribuye_a_la_fila(self):
+        """Test: Si el upsert del lote falla, solo la fila culpable queda como fallida"""
+        registros = [
+            registro_base(numero_dj='1'),
+            registro_base(numero_dj=None),
+            registro_base(numero_dj='2'),
+        ]
+
+        resultado = MotorCargaMasiva(usuario=self.user, staging=True).procesar(registros)
+
+        assert (resultado.creados, resultado.fallidos) == (2, 1)
+        assert resultado.errores[0].startswith("Fila 2: Error de integridad de datos")
+
+    def test_diferencias_identicas_al_proceso_por_lotes(self):
+        """Test: Con staging el diff por campo coincide con el del escritor por defecto"""
+        registros = [
+            registro_base(codigo_instrumento='INST004', factor_8='0.3'),
+            registro_base(codigo_instrumento='INST005', mercado='CFI', factor_9='0.25'),
+        ]
+        cambios = []
+        for staging in (False, True):
+            with transaction.atomic():
+                MotorCargaMasiva(usuario=self.user, staging=staging).procesar(
+                    registros, checkpoint=lambda fila, parcial: cambios.append(parcial.cambios)
+                )
+                transaction.set_rollback(True)
+        lotes, staging = cambios
+
+        assert staging.diferencias == lotes.diferencias
+        assert dict(lotes.conteo_campos) == {'factor_8': 1, 'mercado': 1, 'factor_9': 1}
+
+
+@pytest.mark.django_db
+class TestFilasColapsadas(TestCase):
+    """Tests para el colapso de claves repetidas dentro del archivo"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        self.registros = [
+            registro_base(factor_8='0.1'),
+            registro_base(codigo_instrumento='INST002'),
+            registro_base(factor_8='0.2'),
+            registro_base(factor_8='0.3', origen='CORREDORA'),
+            registro_base(factor_8='0.4'),  # Bolsa después de Corredora: no prevalece
+            registro_base(codigo_instrumento='INST002', fecha_informe='2025-01-15', numero_dj='1949'),
+            registro_base(codigo_instrumento=''),  # Sin código: cada fila es un instrumento nuevo
+            registro_base(codigo_instrumento=''),
+        ]
+
+    def test_prevalece_la_ultima_fila_segun_prioridad(self):
+        """Test: Gana la última fila de cada clave, salvo Bolsa después de Corredora"""
+        assert filas_colapsadas(self.registros) == {1: 4, 3: 4, 5: 4, 2: 6}
+
+    def test_solo_se_escribe_la_fila_que_prevalece(self):
+        """Test: Las filas colapsadas no llegan a la BD y se informan con su propio código"""
+        resultado = MotorCargaMasiva(usuario=self.user).procesar(
+            self.registros, colapsadas=filas_colapsadas(self.registros)
+        )
+
+        assert (resultado.creados, resultado.actualizados, resultado.colapsados) == (4, 0, 4)
+        assert resultado.exitosos == 4
+        assert resultado.exitosos + resultado.colapsados == resultado.procesados == 8
+        assert [(e.fila, e.codigo) for e in resultado.errores_fila] == [
+            (1, 'COLAPSADO'), (2, 'COLAPSADO'), (3, 'COLAPSADO'), (5, 'COLAPSADO'),
+        ]
+        assert resultado.errores[0].endswith('prevalece la fila 4')
+        calificacion = CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST001')
+        assert (calificacion.origen, calificacion.factor_8) == ('CORREDORA', Decimal('0.3'))
+
+    def test_mismo_estado_final_que_fila_a_fila(self):
+        """Test: Con o sin colapso, las calificaciones finales son las mismas"""
+        def ejecutar(colapsadas):
+            with transaction.atomic():
+                MotorCargaMasiva(usuario=self.user, tamano_lote=3).procesar(self.registros, colapsadas=colapsadas)
+                filas = sorted(
+                    CalificacionTributaria.objects.values_list(
+                        'instrumento__nombre_instrumento', 'numero_dj', 'origen', 'factor_8', 'huella'
+                    )
+                )
+                transaction.set_rollback(True)
+            return filas
+
+        assert ejecutar(filas_colapsadas(self.registros)) == ejecutar(None)
+
+
+@pytest.mark.django_db
+class TestMotorCargaMasivaSimulacion(TestCase):
+    """Tests para el modo simulación (dry run)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        MotorCargaMasiva(usuario=self.user).procesar([
+            registro_base(codigo_instrumento='INST003', origen='CORREDORA'),
+            registro_base(codigo_instrumento='INST004'),
+            registro_base(codigo_instrumento='INST005'),
+        ])
+        self.registros = [
+            registro_base(codigo_instrumento='INST003'),  # Omitido por prioridad
+            registro_base(codigo_instrumento='INST004', factor_8='0.3'),  # Actualizado
+            registro_base(codigo_instrumento='INST005'),  # Sin cambios
+            registro_base(codigo_instrumento='NUEVO1'),  # Creado (instrumento nuevo)
+            registro_base(codigo_instrumento='NUEVO1', factor_8='0.2'),  # Actualiza la fila anterior
+            registro_base(codigo_instrumento='NUEVO2', factor_8='0.9', factor_9='0.9'),  # REGLA B
+            {'fecha_informe': '2025-01-15'},  # Sin código
+        ]
+
+    def test_simulacion_no_escribe(self):
+        """Test: La simulación no crea instrumentos ni modifica calificaciones"""
+        # Instantánea de lectura (savepoint + rollback) y dos SELECT: instrumentos y existentes
+        with self.assertNumQueries(5):
+            MotorCargaMasiva(usuario=self.user, simulacion=True).procesar(self.registros)
+
+        assert not InstrumentoFinanciero.objects.filter(codigo_instrumento__startswith='NUEVO').exists()
+        assert CalificacionTributaria.objects.get(instrumento__codigo_instrumento='INST004').factor_8 == Decimal('0.1')
+
+    def test_contadores_iguales_a_carga_real(self):
+        """Test: La simulación predice los contadores de la carga real"""
+        simulacion = MotorCargaMasiva(usuario=self.user, simulacion=True).procesar(self.registros)
+        real = MotorCargaMasiva(usuario=self.user).procesar(self.registros)
+
+        contadores = lambda r: (r.procesados, r.creados, r.actualizados, r.sin_cambios, r.omitidos, r.fallidos)
+        assert contadores(simulacion) == contadores(real) == (7, 1, 2, 1, 1, 2)
+        assert simulacion.errores == real.errores
+
+
+@pytest.mark.django_db
+class TestMotorCargaMasivaCheckpoint(TestCase):
+    """Tests para la confirmación por transacciones y la reanudación desde checkpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        self.registros = [registro_base(codigo_instrumento=f'INST{n:03d}') for n in range(1, 6)]
+
+    def test_checkpoint_por_transaccion(self):
+        """Test: checkpoint recibe la última fila y el parcial de cada transacción"""
+        avances = []
+        motor = MotorCargaMasiva(usuario=self.user, tamano_lote=2, filas_por_commit=4)
+
+        resultado = motor.procesar(
+            self.registros, checkpoint=lambda fila, parcial: avances.append((fila, parcial.creados))
+        )
+
+        assert avances == [(4, 4), (5, 1)]
+        assert resultado.creados == 5
+
+    def test_interrupcion_conserva_transacciones_confirmadas_y_reanuda(self):
+        """Test: Si falla una transacción solo se revierte esa; desde_fila continúa tras el checkpoint"""
+        confirmadas = []
+
+        def checkpoint(fila, parcial):
+            if confirmadas:
+                raise RuntimeError('worker detenido')
+            confirmadas.append(fila)
+
+        with pytest.raises(RuntimeError):
+            MotorCargaMasiva(usuario=self.user, tamano_lote=2, filas_por_commit=2).procesar(
+                self.registros, checkpoint=checkpoint
+            )
+        assert confirmadas == [2]
+        assert CalificacionTributaria.objects.count() == 2
+        assert not InstrumentoFinanciero.objects.filter(codigo_instrumento='INST003').exists()
+
+        resultado = MotorCargaMasiva(usuario=self.user, tamano_lote=2, filas_por_commit=2).procesar(
+            self.registros, desde_fila=confirmadas[-1]
+        )
+
+        assert (resultado.procesados, resultado.creados) == (3, 3)
+        assert CalificacionTributaria.objects.count() == 5
+
+
+@pytest.mark.django_db
+class TestBloqueoClaves(TestCase):
+    """Tests para las claves que bloquea cada transacción"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        InstrumentoFinanciero.objects.create(codigo_instrumento='INST001', nombre_instrumento='Existente')
+
+    def test_bloquea_claves_e_instrumentos_nuevos(self):
+        """Test: Se bloquean las claves de las filas, los códigos que la carga crearía y las bases generadas"""
+        registros = [
+            registro_base(),
+            registro_base(codigo_instrumento='INST002', numero_dj='22'),
+            registro_base(codigo_instrumento='', nombre_instrumento='Bono Corporativo'),
+            registro_base(fecha_informe='no es fecha'),
+        ]
+        bloqueadas = []
+
+        with patch.object(motor_carga, 'bloqueo_por_clave', return_value=True), \
+                patch.object(motor_carga, 'bloquear_claves', side_effect=bloqueadas.append):
+            MotorCargaMasiva(usuario=self.user).procesar(registros)
+
+        fecha = CalificacionTributaria._meta.get_field('fecha_informe').to_python('2025-01-15')
+        assert bloqueadas == [{
+            clave_bloqueo(ESPACIO_CALIFICACION, 'INST001', fecha, '1949'),
+            clave_bloqueo(ESPACIO_CALIFICACION, 'INST002', fecha, '22'),
+            clave_bloqueo(ESPACIO_INSTRUMENTO, 'INST002'),
+            clave_bloqueo(ESPACIO_INSTRUMENTO, 'BC'),
+        }]
+
+    def test_instrumento_sin_codigo_bloquea_su_base(self):
+        """Test: Guardar un instrumento sin código bloquea la base antes de generar el código"""
+        with patch('calificaciones.utils.bloqueo_carga.bloquear_claves') as bloquear:
+            instrumento = InstrumentoFinanciero.objects.create(nombre_instrumento='Bono Corporativo')
+
+        bloquear.assert_called_once_with([clave_bloqueo(ESPACIO_INSTRUMENTO, 'BC')])
+        assert instrumento.codigo_instrumento == 'BC'
+
+    def test_clave_en_rango_bigint(self):
+        clave = clave_bloqueo(ESPACIO_CALIFICACION, 'INST001', '2025-01-15', '1949')
+
+        assert clave == clave_bloqueo(ESPACIO_CALIFICACION, 'INST001', '2025-01-15', '1949')
+        assert -2 ** 63 <= clave < 2 ** 63
+        assert clave != clave_bloqueo(ESPACIO_INSTRUMENTO, 'INST001', '2025-01-15', '1949')
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCargasConcurrentes(TransactionTestCase):
+    """Tests de cargas simultáneas desde varios hilos (una conexión por hilo)"""
+
+    FILAS = 60
+    RONDAS = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+
+    def _cargar_en_paralelo(self, archivos):
+        """Procesa cada archivo en su propio hilo; retorna los resultados en orden de archivo."""
+        resultados = [None] * len(archivos)
+        errores = []
+        inicio = threading.Barrier(len(archivos))
+
+        def cargar(indice, registros):
+            try:
+                inicio.wait()
+                motor = MotorCargaMasiva(usuario=self.user, tamano_lote=10, filas_por_commit=20)
+                resultados[indice] = motor.procesar(registros)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=cargar, args=item) for item in enumerate(archivos)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        assert errores == []
+        return resultados
+
+    def test_cargas_solapadas_se_serializan(self):
+        """Test: Dos cargas con las mismas claves dejan el mismo estado final en cualquier orden"""
+        for ronda in range(self.RONDAS):
+            CalificacionTributaria.objects.all().delete()
+            bolsa = [
+                registro_base(numero_dj=str(n), origen='BOLSA', factor_8='0.1') for n in range(self.FILAS)
+            ]
+            corredora = [
+                registro_base(numero_dj=str(n), origen='CORREDORA', factor_8='0.2') for n in range(self.FILAS)
+            ]
+
+            de_bolsa, de_corredora = self._cargar_en_paralelo([bolsa, corredora])
+
+            assert de_bolsa.fallidos == de_corredora.fallidos == 0
+            assert de_bolsa.creados + de_corredora.creados == self.FILAS
+            # Cada clave: creada por una carga y actualizada u omitida (prioridad) por la otra
+            assert de_corredora.actualizados + de_bolsa.omitidos == self.FILAS
+            calificaciones = CalificacionTributaria.objects.all()
+            assert calificaciones.count() == self.FILAS
+            assert {(c.origen, c.factor_8) for c in calificaciones} == {('CORREDORA', Decimal('0.2'))}
+
+    def test_cargas_sin_claves_en_comun(self):
+        """Test: Cargas de instrumentos distintos crean todas sus filas"""
+        archivos = [
+            [registro_base(codigo_instrumento=f'INST{i}', numero_dj=str(n)) for n in range(self.FILAS)]
+            for i in range(3)
+        ]
+
+        resultados = self._cargar_en_paralelo(archivos)
+
+        assert [r.creados for r in resultados] == [self.FILAS] * 3
+        assert CalificacionTributaria.objects.count() == self.FILAS * 3
+        assert InstrumentoFinanciero.objects.count() == 3
+
+
+@pytest.mark.django_db
+class TestLogCarga(TestCase):
+    """Tests para el log de la ingesta: resumen por lote, muestreo y QueueHandler"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        self.registros = [registro_base(numero_dj=str(n)) for n in range(1, 26)]
+
+    def test_resumen_por_lote_y_filas_muestreadas(self):
+        """Test: En INFO se emite un resumen por lote y solo las filas muestreadas"""
+        with self.assertLogs('calificaciones.utils.motor_carga', level='INFO') as logs:
+            MotorCargaMasiva(usuario=self.user, tamano_lote=10, muestreo_log=10).procesar(self.registros)
+
+        resumenes = [linea for linea in logs.output if 'Bulk upload rows' in linea]
+        assert resumenes == [
+            f'INFO:calificaciones.utils.motor_carga:Bulk upload rows {desde}-{hasta}: '
+            f'{hasta - desde + 1} created, 0 updated, 0 unchanged, 0 skipped, 0 collapsed, 0 failed'
+            for desde, hasta in [(1, 10), (11, 20), (21, 25)]
+        ]
+        muestreadas = [linea for linea in logs.output if 'Sampled' in linea]
+        assert len(muestreadas) == 2
+        assert 'Row 10 created successfully' in muestreadas[0]
+
+    def test_detalle_completo_en_debug(self):
+        """Test: En DEBUG se registra cada fila y un error siempre se registra"""
+        self.registros.append(registro_base(factor_8='0.9', factor_9='0.9', numero_dj='90'))
+        with self.assertLogs('calificaciones.utils.motor_carga', level='DEBUG') as logs:
+            MotorCargaMasiva(usuario=self.user, muestreo_log=10).procesar(self.registros)
+
+        assert sum('created successfully' in linea for linea in logs.output) == 25
+        assert not any('Sampled' in linea for linea in logs.output)
+        assert any(linea.startswith('WARNING') and 'row 26' in linea for linea in logs.output)
+
+    def test_cola_escribe_desde_otro_hilo(self):
+        """Test: Con la cola, los handlers de los ancestros (aunque se agreguen después) escriben desde el listener"""
+        hilos = []
+
+        class HandlerPrueba(logging.Handler):
+            def emit(self, record):
+                hilos.append((threading.current_thread(), self.format(record)))
+
+        padre = logging.getLogger('calificaciones.tests')
+        logger = logging.getLogger('calificaciones.tests.log_carga')
+        logger.setLevel(logging.INFO)
+
+        iniciar_cola_log('calificaciones.tests.log_carga')
+        handler = HandlerPrueba()
+        padre.addHandler(handler)  # Agregado con la cola ya activa
+        try:
+            logging.getLogger('calificaciones.tests.log_carga.motor').info("Bulk upload rows %s-%s", 1, 10)
+        finally:
+            detener_cola_log('calificaciones.tests.log_carga')
+            padre.removeHandler(handler)
+
+        assert hilos == [(hilos[0][0], 'Bulk upload rows 1-10')]
+        assert hilos[0][0] is not threading.current_thread()
+        assert logger.propagate and not logger.handlers  # Logger restaurado
+
+    def test_proceso_hijo_descarta_la_cola_heredada(self):
+        """Test: El pool de procesos quita el QueueHandler heredado por fork y restaura la propagación"""
+        logger = logging.getLogger('calificaciones.tests.log_carga')
+        iniciar_cola_log('calificaciones.tests.log_carga')
+        listener = log_carga._listeners['calificaciones.tests.log_carga'][0]
+        try:
+            log_carga.descartar_colas_heredadas()
+
+            assert logger.propagate and not logger.handlers
+        finally:
+            listener.stop()
+
+
+@pytest.mark.django_db
+class TestCargaMasivaView(TestCase):
+    """Tests de integración de la vista carga_masiva con el motor por lotes"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client = Client()
+        self.user = User.objects.create_user(username='analista', password='testpass123')
+        rol = Rol.objects.create(nombre_rol='Analista Financiero', descripcion='Rol de prueba')
+        PerfilUsuario.objects.create(usuario=self.user, rol=rol)
+        self.client.login(username='analista', password='testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_carga_csv_registra_estadisticas(self):
+        """Test: La carga de un CSV deja contadores y errores en CargaMasiva"""
+        contenido = (
+            "codigo_instrumento,fecha_informe,origen,numero_dj,factor_8,factor_9\n"
+            "INST001,2025-01-15,BOLSA,1949,0.1,0.2\n"
+            "INST002,2025-01-15,BOLSA,1949,0.7,0.7\n"
+        )
+        archivo = SimpleUploadedFile('carga.csv', contenido.encode('utf-8'), content_type='text/csv')
+
+        response = self.client.post(reverse('carga_masiva'), {'archivo': archivo})
+        call_command('procesar_cargas', una_vez=True, stdout=io.StringIO())
+
+        assert response.status_code == 302
+        carga = CargaMasiva.objects.get()
+        assert carga.estado == 'PARCIAL'
+        assert (carga.registros_procesados, carga.registros_exitosos, carga.registros_fallidos) == (2, 1, 1)
+        assert carga.errores_detalle.startswith('Fila 2:')
+
+    def test_carga_csv_con_encabezados_de_exportacion(self):
+        """Test: Un archivo con los encabezados de la exportación Excel se carga igual"""
+        contenido = (
+            "Código Instrumento,Fecha Informe,Origen,N° DJ,Factor 8,Factor 9\n"
+            "INST001,2025-01-15,BOLSA,1949,0.1,0.2\n"
+        )
+        archivo = SimpleUploadedFile('carga.csv', contenido.encode('utf-8'), content_type='text/csv')
+
+        self.client.post(reverse('carga_masiva'), {'archivo': archivo})
+        call_command('procesar_cargas', una_vez=True, stdout=io.StringIO())
+
+        calificacion = CalificacionTributaria.objects.get()
+        assert CargaMasiva.objects.get().estado == 'EXITOSO'
+        assert calificacion.numero_dj == '1949'
+        assert (calificacion.factor_8, calificacion.factor_9) == (Decimal('0.1'), Decimal('0.2'))
+
+    def test_dry_run_no_registra_carga(self):
+        """Test: Con dry_run la vista muestra la simulación sin crear carga ni calificaciones"""
+        contenido = (
+            "codigo_instrumento,fecha_informe,origen,numero_dj,factor_8,factor_9\n"
+            "INST001,2025-01-15,BOLSA,1949,0.1,0.2\n"
+            "INST002,2025-01-15,BOLSA,1949,0.7,0.7\n"
+        )
+        archivo = SimpleUploadedFile('carga.csv', contenido.encode('utf-8'), content_type='text/csv')
+
+        response = self.client.post(reverse('carga_masiva'), {'archivo': archivo, 'dry_run': 'on'})
+
+        assert response.status_code == 200
+        simulacion = response.context['simulacion']
+        assert (simulacion.creados, simulacion.fallidos) == (1, 1)
+        assert response.context['simulacion_errores'][0].startswith('Fila 2:')
+        assert not CargaMasiva.objects.exists()
+        assert not CalificacionTributaria.objects.exists()
+        assert not InstrumentoFinanciero.objects.exists()
@@ -0,0 +1,88 @@
+"""
+Tests para el validador de factores por lotes (REGLA A / REGLA B)
+Cubre: paridad con la validación Decimal fila a fila, mensajes y REGLA B de CalculadoraFactores
+"""
+import random
+from decimal import Decimal
+from calificaciones.utils.calculadora_factores import CalculadoraFactores
+from calificaciones.utils.validador_factores import (
+    CAMPOS_FACTORES,
+    MENSAJE_SUMA,
+    NO_EVALUADA,
+    evaluar_factores_lote,
+    validar_factores_fila,
+)
+
+
+def fila(**factores):
+    """30 factores en cero salvo los indicados (factor_8=..., etc.)"""
+    return [Decimal(str(factores.get(campo, 0))) for campo in CAMPOS_FACTORES]
+
+
+def mensajes_lote(filas):
+    """Mensajes de evaluar_factores_lote (sin las filas NO_EVALUADA, como la carga masiva)"""
+    mensajes, _ = evaluar_factores_lote(filas)
+    return [
+        validar_factores_fila(valores) if mensaje is NO_EVALUADA else mensaje
+        for mensaje, valores in zip(mensajes, filas)
+    ]
+
+
+class TestValidadorFactores:
+    """Tests para evaluar_factores_lote"""
+
+    def test_mensajes_iguales_a_clean(self):
+        """Test: Los mensajes por fila son los de CalificacionTributaria.clean()"""
+        filas = [
+            fila(factor_8='0.5', factor_9='0.5'),
+            fila(factor_8='0.6', factor_16='0.6'),
+            fila(factor_20='1.5', factor_30='-0.1'),
+            [None] * 30,
+        ]
+
+        assert mensajes_lote(filas) == [
+            None,
+            MENSAJE_SUMA,
+            'El factor_20 debe estar entre 0 y 1. Valor recibido: 1.5',
+            None,
+        ]
+
+    def test_regla_a_tiene_prioridad_sobre_regla_b(self):
+        """Test: Con ambos errores se reporta el de rango (como clean())"""
+        assert mensajes_lote([fila(factor_8='0.9', factor_9='1.2')]) == [
+            'El factor_9 debe estar entre 0 y 1. Valor recibido: 1.2'
+        ]
+
+    def test_mas_de_8_decimales_usa_decimal(self):
+        """Test: Valores fuera de la escala entera se validan con Decimal exacto"""
+        filas = [fila(factor_8='0.500000001', factor_9='0.5')]
+
+        mensajes, _ = evaluar_factores_lote(filas)
+
+        assert mensajes == [NO_EVALUADA]
+        assert mensajes_lote(filas) == [MENSAJE_SUMA]
+
+    def test_paridad_con_validacion_fila_a_fila(self):
+        """Test: En filas aleatorias el resultado coincide con la lógica Decimal"""
+        aleatorio = random.Random(20250115)
+        filas = [
+            [Decimal(aleatorio.randint(-10, 130)).scaleb(-2) for _ in CAMPOS_FACTORES]
+            for _ in range(500)
+        ]
+
+        assert mensajes_lote(filas) == [validar_factores_fila(f) for f in filas]
+
+
+class TestCalculadoraFactores:
+    """Tests para CalculadoraFactores.validar_suma_factores"""
+
+    def test_validar_suma_factores(self):
+        """Test: REGLA B conserva el mensaje y la suma de la calculadora"""
+        factores = {'factor_8': Decimal('0.6'), 'factor_9': Decimal('0.50000001')}
+
+        es_valido, mensaje, suma = CalculadoraFactores.validar_suma_factores(factores)
+
+        assert not es_valido
+        assert suma == Decimal('1.10000001')
+        assert mensaje == 'La suma de los factores 8-16 es 1.10000001, debe ser ≤ 1.00000000 (REGLA B)'
+
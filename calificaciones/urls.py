@@ -22,12 +22,20 @@ urlpatterns = [
     
     # Carga Masiva
     path('carga-masiva/', views.carga_masiva, name='carga_masiva'),
+    path('carga-masiva/<int:pk>/progreso/', views.progreso_carga_masiva, name='progreso_carga_masiva'),
+    path('carga-masiva/<int:pk>/reanudar/', views.reanudar_carga_masiva, name='reanudar_carga_masiva'),
+    path('carga-masiva/<int:pk>/revertir/', views.revertir_carga_masiva, name='revertir_carga_masiva'),
+    path('carga-masiva/<int:pk>/errores/', views.errores_carga_masiva, name='errores_carga_masiva'),
+    path('carga-masiva/<int:pk>/errores/csv/', views.exportar_errores_carga_masiva, name='exportar_errores_carga_masiva'),
+    path('carga-masiva/<int:pk>/diferencias/', views.exportar_diferencias_carga_masiva, name='exportar_diferencias_carga_masiva'),
     path('carga-masiva/plantilla/xlsx/', views.descargar_plantilla, {'formato': 'xlsx'}, name='descargar_plantilla'),
     path('carga-masiva/plantilla/csv/', views.descargar_plantilla, {'formato': 'csv'}, name='descargar_plantilla_csv'),
     
     # Exportación
     path('exportar/excel/', views.exportar_excel, name='exportar_excel'),
     path('exportar/csv/', views.exportar_csv, name='exportar_csv'),
+    path('exportar/<int:pk>/progreso/', views.progreso_exportacion, name='progreso_exportacion'),
+    path('exportar/<int:pk>/descargar/', views.descargar_exportacion, name='descargar_exportacion'),
     
     # Perfil de Usuario
     path('mi-perfil/', views.mi_perfil, name='mi_perfil'),
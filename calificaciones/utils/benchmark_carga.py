@@ -0,0 +1,319 @@
+"""
+Benchmark de rendimiento de la carga masiva
+
+Genera archivos sintéticos deterministas (CSV, XLSX y CSV.GZ) con una mezcla
+configurable de filas y los procesa con el mismo flujo que un worker
+(CargaMasiva -> TrabajoCarga -> ejecutar_trabajo), midiendo:
+- filas por segundo (tiempo de ejecutar_trabajo, sin generar ni copiar el archivo)
+- pico de RSS del proceso durante la carga (VmHWM de /proc, reiniciado por carga;
+  en otras plataformas ru_maxrss, que es el pico acumulado del proceso)
+- consultas SQL ejecutadas (execute_wrapper: cuenta todas, sin límite de log)
+
+Mezcla de filas (fracciones que suman 1):
+- crear: clave nueva
+- actualizar: clave precargada como BOLSA con otros factores
+- omitir: clave precargada como CORREDORA (regla de prioridad)
+- invalida: factor_8 fuera de rango (REGLA A)
+
+Los datos del benchmark usan instrumentos con prefijo PREFIJO_INSTRUMENTO; al
+terminar cada carga se eliminan solo las filas que creó esa ejecución (por id:
+la precarga, la carga y lo que la carga creó). Lo usa el comando
+benchmark_carga, que por defecto corre sobre una base de datos aislada.
+"""
+
+import csv
+import gzip
+import os
+import random
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+import openpyxl
+from django.core.files import File
+from django.db import connection
+
+from ..models import CalificacionTributaria, CargaMasiva, InstrumentoFinanciero, LogAuditoria
+from .cambios_carga import ids_creados
+from .cola_cargas import encolar_carga, ejecutar_trabajo, reclamar_trabajo
+
+FORMATOS = ['csv', 'xlsx', 'csv.gz']
+
+MEZCLA_POR_DEFECTO = {'crear': 0.6, 'actualizar': 0.25, 'omitir': 0.1, 'invalida': 0.05}
+
+PREFIJO_INSTRUMENTO = 'BENCH'
+
+# Instrumentos distintos del archivo (cada fila tiene su propia DJ: claves únicas)
+INSTRUMENTOS = 1000
+
+FECHA_INFORME = date(2025, 1, 15)
+
+# Tolerancia por defecto al comparar contra una línea base (15%)
+TOLERANCIA_POR_DEFECTO = 0.15
+
+# Métricas comparadas: (clave, True si más alto es mejor)
+METRICAS = [
+    ('filas_por_segundo', True),
+    ('pico_rss_mb', False),
+    ('consultas', False),
+]
+
+HEADERS = (
+    ['codigo_instrumento', 'nombre_instrumento', 'fecha_informe', 'origen', 'mercado',
+     'tipo_sociedad', 'secuencia', 'numero_dividendo', 'ejercicio', 'numero_dj']
+    + [f'factor_{i}' for i in range(8, 38)]
+)
+
+TAMANO_PRECARGA = 5000
+
+
+def parsear_mezcla(texto):
+    """'crear=0.6,actualizar=0.3,...' -> dict normalizado (las claves faltantes valen 0)."""
+    mezcla = dict.fromkeys(MEZCLA_POR_DEFECTO, 0.0)
+    for parte in filter(None, (p.strip() for p in texto.split(','))):
+        clave, _, valor = parte.partition('=')
+        if clave not in mezcla:
+            raise ValueError(f"Tipo de fila desconocido en la mezcla: {clave}")
+        mezcla[clave] = float(valor)
+    total = sum(mezcla.values())
+    if total <= 0:
+        raise ValueError("La mezcla debe tener al menos un tipo de fila con fracción positiva")
+    return {clave: valor / total for clave, valor in mezcla.items()}
+
+
+def tipos_de_fila(filas, mezcla, semilla):
+    """Tipo de cada fila (crear, actualizar, omitir, invalida), determinista según la semilla."""
+    rng = random.Random(semilla)
+    tipos = list(mezcla)
+    return rng.choices(tipos, weights=[mezcla[t] for t in tipos], k=filas)
+
+
+def _codigo(n):
+    return f'{PREFIJO_INSTRUMENTO}{n % INSTRUMENTOS:04d}'
+
+
+def _filas_archivo(tipos, semilla):
+    """Filas del archivo en el orden de HEADERS (valores como texto, igual que un CSV)."""
+    rng = random.Random(semilla + 1)
+    for n, tipo in enumerate(tipos):
+        factores = [f'0.0{rng.randint(1, 9)}' for _ in range(9)] + ['0'] * 21
+        if tipo == 'invalida':
+            factores[0] = '1.5'
+        yield [
+            _codigo(n), f'Instrumento {n % INSTRUMENTOS}', FECHA_INFORME.isoformat(), 'BOLSA', 'ACN',
+            'A', '1', '0', '2025', str(n + 1),
+        ] + factores
+
+
+def generar_archivo(ruta, formato, tipos, semilla):
+    """Escribe el archivo sintético en streaming (memoria constante)."""
+    filas = _filas_archivo(tipos, semilla)
+    if formato == 'xlsx':
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(HEADERS)
+        for fila in filas:
+            ws.append(fila)
+        wb.save(ruta)
+        return
+    abrir = gzip.open if formato == 'csv.gz' else open
+    with abrir(ruta, 'wt', encoding='utf-8', newline='') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(HEADERS)
+        escritor.writerows(filas)
+
+
+class BenchmarkFallido(Exception):
+    """El benchmark no puede correr o su carga no terminó; el mensaje indica el motivo."""
+
+
+class DatosBenchmark:
+    """Ids de las filas creadas por una ejecución del benchmark (lo único que limpiar_datos elimina)."""
+
+    def __init__(self):
+        self.instrumentos = set()
+        self.calificaciones = set()
+        self.carga = None
+
+
+def limpiar_datos(datos):
+    """
+    Elimina la carga del benchmark (con su archivo y su auditoría) y las
+    calificaciones e instrumentos que creó esta ejecución. Un instrumento al
+    que otro usuario agregó calificaciones se conserva.
+    """
+    if datos.carga is not None and datos.carga.pk is not None:
+        creadas, instrumentos = ids_creados(datos.carga)
+        datos.calificaciones |= creadas
+        datos.instrumentos |= instrumentos
+        LogAuditoria.objects.filter(accion='BULK_UPLOAD', registro_id=datos.carga.pk).delete()
+        datos.carga.archivo.delete(save=False)
+        datos.carga.delete()
+    CalificacionTributaria.objects.filter(pk__in=datos.calificaciones).delete()
+    InstrumentoFinanciero.objects.filter(
+        pk__in=datos.instrumentos, calificaciontributaria__isnull=True
+    ).delete()
+
+
+def precargar(tipos, datos):
+    """
+    Crea los instrumentos y las calificaciones existentes que la mezcla necesita
+    y registra sus ids en datos. BenchmarkFallido si ya existen instrumentos
+    con los códigos del benchmark (datos que no son de esta ejecución).
+    """
+    codigos = [_codigo(n) for n in range(min(INSTRUMENTOS, len(tipos)))]
+    if InstrumentoFinanciero.objects.filter(codigo_instrumento__in=codigos).exists():
+        raise BenchmarkFallido(
+            f"La base de datos ya tiene instrumentos con prefijo {PREFIJO_INSTRUMENTO}; "
+            f"el benchmark no modifica datos que no creó."
+        )
+    instrumentos = InstrumentoFinanciero.objects.bulk_create([
+        InstrumentoFinanciero(
+            codigo_instrumento=_codigo(n), nombre_instrumento=f'Instrumento {n}', tipo_instrumento='Acción'
+        )
+        for n in range(min(INSTRUMENTOS, len(tipos)))
+    ])
+    datos.instrumentos.update(instrumento.pk for instrumento in instrumentos)
+    existentes = (
+        CalificacionTributaria(
+            instrumento=instrumentos[n % INSTRUMENTOS],
+            fecha_informe=FECHA_INFORME,
+            numero_dj=str(n + 1),
+            origen='CORREDORA' if tipo == 'omitir' else 'BOLSA',
+            mercado='ACN',
+            factor_8=Decimal('0.5'),
+        )
+        for n, tipo in enumerate(tipos)
+        if tipo in ('actualizar', 'omitir')
+    )
+    lote = []
+    for calificacion in existentes:
+        lote.append(calificacion)
+        if len(lote) == TAMANO_PRECARGA:
+            datos.calificaciones.update(c.pk for c in CalificacionTributaria.objects.bulk_create(lote))
+            lote = []
+    if lote:
+        datos.calificaciones.update(c.pk for c in CalificacionTributaria.objects.bulk_create(lote))
+
+
+class _ContadorConsultas:
+    """execute_wrapper que cuenta las sentencias ejecutadas."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def _reiniciar_pico_rss():
+    # Linux: escribir 5 en clear_refs reinicia VmHWM (pico de RSS) del proceso
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5')
+    except OSError:
+        pass
+
+
+def pico_rss_mb():
+    """Pico de RSS del proceso en MB (None si la plataforma no lo informa)."""
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def ejecutar_benchmark(filas, formato, directorio, mezcla=None, semilla=42, staging=False, procesos=1):
+    """
+    Genera el archivo, precarga los datos de la mezcla y lo procesa como un
+    worker (staging y procesos se pasan al motor, sin tocar settings). Retorna
+    el dict de métricas de la carga; BenchmarkFallido si la carga no terminó.
+    """
+    mezcla = mezcla or MEZCLA_POR_DEFECTO
+    tipos = tipos_de_fila(filas, mezcla, semilla)
+    nombre = f'benchmark_{filas}.{formato}'
+    ruta = os.path.join(directorio, nombre)
+    generar_archivo(ruta, formato, tipos, semilla)
+
+    datos = DatosBenchmark()
+    try:
+        precargar(tipos, datos)
+        carga = datos.carga = CargaMasiva(usuario=None, archivo_nombre=nombre, estado='EN_COLA')
+        with open(ruta, 'rb') as archivo:
+            carga.archivo.save(nombre, File(archivo))
+        trabajo = reclamar_trabajo('benchmark', trabajo_id=encolar_carga(carga).id)
+        if trabajo is None:
+            raise BenchmarkFallido(f"El trabajo de la carga #{carga.id} fue reclamado por un worker de la cola")
+
+        contador = _ContadorConsultas()
+        _reiniciar_pico_rss()
+        with connection.execute_wrapper(contador):
+            inicio = time.perf_counter()
+            resultado = ejecutar_trabajo(trabajo, procesos=procesos, staging=staging)
+            segundos = time.perf_counter() - inicio
+        pico = pico_rss_mb()
+
+        if resultado is None:
+            carga.refresh_from_db()
+            raise BenchmarkFallido(
+                f"La carga #{carga.id} ({nombre}) no terminó: "
+                f"{carga.errores_detalle or 'el trabajo fue reclamado por otro worker'}"
+            )
+    finally:
+        limpiar_datos(datos)
+        os.remove(ruta)
+
+    return {
+        'formato': formato,
+        'filas': filas,
+        'segundos': round(segundos, 3),
+        'filas_por_segundo': round(filas / segundos, 1) if segundos else None,
+        'pico_rss_mb': round(pico, 1) if pico is not None else None,
+        'consultas': contador.total,
+        'esperado': {tipo: tipos.count(tipo) for tipo in mezcla},
+        'creados': resultado.creados,
+        'actualizados': resultado.actualizados,
+        'omitidos': resultado.omitidos,
+        'fallidos': resultado.fallidos,
+    }
+
+
+def comparar_resultados(actual, base, tolerancia=TOLERANCIA_POR_DEFECTO):
+    """
+    Compara dos ejecuciones (dicts con 'resultados') por (formato, filas).
+    Retorna una lista de dicts con la variación de cada métrica; regresion es
+    True si empeora más que la tolerancia (menos filas/s, más RSS o consultas).
+    """
+    indice_base = {(r['formato'], r['filas']): r for r in base.get('resultados', [])}
+    comparacion = []
+    for resultado in actual.get('resultados', []):
+        anterior = indice_base.get((resultado['formato'], resultado['filas']))
+        if anterior is None:
+            continue
+        for metrica, mayor_es_mejor in METRICAS:
+            valor, referencia = resultado.get(metrica), anterior.get(metrica)
+            if not valor or not referencia:
+                continue
+            variacion = (valor - referencia) / referencia
+            empeora = -variacion if mayor_es_mejor else variacion
+            comparacion.append({
+                'formato': resultado['formato'],
+                'filas': resultado['filas'],
+                'metrica': metrica,
+                'base': referencia,
+                'actual': valor,
+                'variacion': round(variacion, 4),
+                'regresion': empeora > tolerancia,
+            })
+    return comparacion
@@ -0,0 +1,91 @@
+"""
+Bloqueo de claves de la carga masiva
+
+Dos cargas simultáneas que tocan las mismas claves (instrumento, fecha_informe,
+numero_dj) no deben leer el mismo estado y escribir encima una de la otra, ni
+informar como error la violación de unicidad de la que llegó segunda. Cada
+transacción del motor bloquea las claves que va a escribir antes de leerlas:
+
+- PostgreSQL: un advisory lock de transacción (pg_advisory_xact_lock) por
+  clave, con el hash de 64 bits de la clave. Se incluyen los códigos de
+  instrumento que la transacción podría crear. Las cargas sin claves en común
+  avanzan en paralelo; las que se solapan se serializan por clave.
+- SQLite: la base admite un solo escritor, así que la transacción toma el
+  lock de escritura al empezar (en lugar de al primer INSERT) y, dentro del
+  proceso, un candado por base de datos serializa los hilos.
+
+Las claves de una transacción se bloquean todas al comienzo y en orden
+ascendente de hash: dos transacciones nunca esperan una por la otra en
+sentidos opuestos (sin deadlocks). Los locks se liberan al confirmar o
+revertir la transacción.
+"""
+
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from ..models import CalificacionTributaria
+
+# Espacios de claves (evitan colisiones entre tipos de clave con las mismas partes)
+ESPACIO_CALIFICACION = 'calificacion'
+ESPACIO_INSTRUMENTO = 'instrumento'
+
+_candados_sqlite = {}
+_candados_sqlite_guardia = threading.Lock()
+
+
+def bloqueo_por_clave():
+    """True si la base de datos bloquea por clave (si no, la transacción completa es exclusiva)."""
+    return connection.vendor == 'postgresql'
+
+
+def clave_bloqueo(espacio, *partes):
+    """Entero de 64 bits con signo (rango bigint de los advisory locks) para la clave."""
+    texto = '|'.join([espacio, *('' if parte is None else str(parte) for parte in partes)])
+    return int.from_bytes(hashlib.blake2b(texto.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def bloquear_claves(claves):
+    """
+    Bloquea las claves (de clave_bloqueo) hasta el final de la transacción en
+    curso, en orden ascendente. No hace nada fuera de PostgreSQL.
+    """
+    if not claves or not bloqueo_por_clave():
+        return
+    with connection.cursor() as cursor:
+        # unnest entrega los elementos en el orden del arreglo: se bloquean en orden
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(clave) FROM unnest(%s::bigint[]) AS clave',
+            [sorted(set(claves))],
+        )
+
+
+def _candado_sqlite():
+    nombre = connection.settings_dict['NAME']
+    with _candados_sqlite_guardia:
+        return _candados_sqlite.setdefault(nombre, threading.RLock())
+
+
+@contextmanager
+def transaccion_carga():
+    """
+    transaction.atomic() para una transacción del motor de carga. En SQLite la
+    transacción es exclusiva desde el comienzo; en PostgreSQL las claves se
+    bloquean después con bloquear_claves().
+    """
+    if connection.vendor != 'sqlite':
+        with transaction.atomic():
+            yield
+        return
+
+    with _candado_sqlite():
+        with transaction.atomic():
+            # Una escritura sin filas toma el lock RESERVED de SQLite: otra conexión
+            # espera aquí (timeout de la conexión) en vez de fallar al escribir
+            tabla = connection.ops.quote_name(CalificacionTributaria._meta.db_table)
+            pk = connection.ops.quote_name(CalificacionTributaria._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {tabla} SET {pk} = {pk} WHERE 0 = 1')
+            yield
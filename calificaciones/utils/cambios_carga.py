@@ -0,0 +1,327 @@
+"""
+Changesets inversos y reversión de cargas masivas
+
+Cada transacción de una carga guarda un CambioCarga con el changeset inverso
+que entrega el motor (CambiosCarga): ids de las calificaciones creadas y
+valores previos de las actualizadas. Se serializa en columnas (una lista por
+campo) con JSON + zlib, de modo que el changeset de 100.000 filas ocupa unos
+pocos MB. El diff por campo de las filas actualizadas (Diferencia) se guarda
+en el mismo formato y alimenta el reporte de diferencias de la carga
+(conteo_diferencias / iterar_diferencias).
+
+revertir_carga() deshace una carga completa con sentencias masivas sobre la
+tabla de staging (staging_carga): carga los valores previos y los ids creados
+con una sola operación (COPY / executemany), los restaura con un UPDATE ...
+FROM y elimina las filas creadas con un DELETE ... IN (SELECT ...). Como las
+escrituras de la carga (bulk_create / UPDATE ... FROM), no emite signals por fila:
+queda un único registro BULK_ROLLBACK en LogAuditoria. El UPDATE solo escribe
+las columnas que la carga modificó (conteo_campos de sus changesets), más
+usuario, huella y fecha, igual que el escritor del motor.
+
+La reversión corre en una transacción del motor (transaccion_carga) y bloquea
+las claves de las filas que va a tocar (bloquear_claves) antes de comprobar
+si fueron editadas: una carga simultánea sobre las mismas claves espera a que
+termine. Las filas editadas después de la carga (su huella o
+fecha_modificacion ya no son las que dejó la carga) no se restauran ni se
+eliminan: se informan en ResultadoReversion.omitidas. Los instrumentos creados
+por la carga que quedan sin calificaciones se eliminan con el ORM.
+
+Solo se puede revertir la última carga que escribió filas: revertir una
+anterior pisaría los cambios de las posteriores.
+"""
+
+import json
+import logging
+import zlib
+from collections import Counter, namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Q
+
+from ..models import CalificacionTributaria, CambioCarga, CargaMasiva, InstrumentoFinanciero, LogAuditoria
+from . import staging_carga
+from .bloqueo_carga import ESPACIO_CALIFICACION, bloquear_claves, bloqueo_por_clave, clave_bloqueo, transaccion_carga
+from .motor_carga import CAMPOS_ACTUALIZABLES, CAMPOS_CAMBIO, CAMPOS_DIFERENCIA, Diferencia
+
+logger = logging.getLogger(__name__)
+
+# Generaciones de la tabla de staging durante una reversión
+GENERACION_RESTAURAR = 1
+GENERACION_ELIMINAR = 2
+GENERACION_VERIFICAR = 3  # Estado que dejó la carga en cada fila (huella, fecha_modificacion)
+GENERACION_BLOQUEAR = 4  # Ids de todas las filas tocadas (sus claves se bloquean)
+
+# Ids de filas editadas después de la carga que se listan en la auditoría
+MAX_OMITIDAS_AUDITORIA = 50
+
+# Resultado de revertir_carga (omitidas: ids de las filas editadas después de la carga)
+ResultadoReversion = namedtuple(
+    'ResultadoReversion', ['restauradas', 'eliminadas', 'omitidas', 'instrumentos_eliminados']
+)
+
+
+class ReversionNoPermitida(Exception):
+    """La carga no se puede revertir; el mensaje se muestra al usuario."""
+
+
+def _comprimir(contenido):
+    return zlib.compress(json.dumps(contenido, default=_json_default, separators=(',', ':')).encode('utf-8'))
+
+
+def _json_default(valor):
+    # Representación exacta (DjangoJSONEncoder recorta los microsegundos)
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable en changeset: {type(valor).__name__}")
+
+
+def serializar_cambios(cambios):
+    """Comprime un CambiosCarga en formato columnar (zlib + JSON)."""
+    contenido = {
+        'campos': ['id'] + CAMPOS_CAMBIO,
+        'columnas': [list(columna) for columna in zip(*cambios.previos)],
+        'creados': list(cambios.creados),
+        'posteriores': [list(columna) for columna in zip(*cambios.posteriores)],
+        'instrumentos': list(cambios.instrumentos),
+    }
+    return _comprimir(contenido)
+
+
+def _descomprimir(datos):
+    return json.loads(zlib.decompress(bytes(datos)))
+
+
+def deserializar_cambios(datos):
+    """
+    Retorna (previos, creados): previos es una lista de dicts {attname: valor}
+    con los tipos del modelo; creados, la lista de ids creados.
+    """
+    return _previos(_descomprimir(datos))
+
+
+def _previos(contenido):
+    campos = [CalificacionTributaria._meta.get_field(nombre) for nombre in contenido['campos']]
+    columnas = [
+        [campo.to_python(valor) for valor in columna]
+        for campo, columna in zip(campos, contenido['columnas'])
+    ]
+    attnames = [campo.attname for campo in campos]
+    previos = [dict(zip(attnames, fila)) for fila in zip(*columnas)]
+    return previos, contenido['creados']
+
+
+def ids_creados(carga):
+    """(ids de calificaciones, ids de instrumentos) creados por la carga, según sus changesets."""
+    calificaciones, instrumentos = set(), set()
+    for datos in carga.cambios.values_list('datos', flat=True):
+        contenido = _descomprimir(datos)
+        calificaciones.update(contenido['creados'])
+        instrumentos.update(contenido.get('instrumentos', []))
+    return calificaciones, instrumentos
+
+
+def _posteriores(contenido):
+    """
+    {id: (huella, fecha_modificacion)} del estado que dejó la transacción en
+    cada fila escrita. Vacío en changesets guardados antes de registrarlo.
+    """
+    if not contenido.get('posteriores'):
+        return {}
+    ids, huellas, fechas = contenido['posteriores']
+    campo_fecha = CalificacionTributaria._meta.get_field('fecha_modificacion')
+    return {
+        pk: (huella, campo_fecha.to_python(fecha))
+        for pk, huella, fecha in zip(ids, huellas, fechas)
+    }
+
+
+def serializar_diferencias(diferencias):
+    """Comprime una lista de Diferencia en formato columnar (campo como índice)."""
+    indices = {campo: indice for indice, campo in enumerate(CAMPOS_DIFERENCIA)}
+    contenido = {
+        'campos': CAMPOS_DIFERENCIA,
+        'filas': [d.fila for d in diferencias],
+        'ids': [d.calificacion for d in diferencias],
+        'campo': [indices[d.campo] for d in diferencias],
+        'anteriores': [d.anterior for d in diferencias],
+        'nuevos': [d.nuevo for d in diferencias],
+    }
+    return _comprimir(contenido)
+
+
+def deserializar_diferencias(datos):
+    """Lista de Diferencia; los valores quedan como en el JSON (Decimal y fechas en texto)."""
+    contenido = json.loads(zlib.decompress(bytes(datos)))
+    campos = contenido['campos']
+    return [
+        Diferencia(fila, pk, campos[indice], anterior, nuevo)
+        for fila, pk, indice, anterior, nuevo in zip(
+            contenido['filas'], contenido['ids'], contenido['campo'],
+            contenido['anteriores'], contenido['nuevos'],
+        )
+    ]
+
+
+def guardar_cambios(carga, fila_hasta, cambios):
+    """Guarda el changeset de una transacción de la carga (nada si no escribió filas)."""
+    if not cambios:
+        return None
+    return CambioCarga.objects.create(
+        carga=carga,
+        fila_hasta=fila_hasta,
+        creados=len(cambios.creados),
+        actualizados=len(cambios.previos),
+        datos=serializar_cambios(cambios),
+        diferencias=serializar_diferencias(cambios.diferencias) if cambios.diferencias else None,
+        conteo_campos=dict(cambios.conteo_campos),
+    )
+
+
+def conteo_diferencias(carga):
+    """Filas modificadas por campo en toda la carga, en el orden de CAMPOS_DIFERENCIA."""
+    conteo = Counter()
+    for conteo_campos in carga.cambios.values_list('conteo_campos', flat=True):
+        conteo.update(conteo_campos)
+    return [(campo, conteo[campo]) for campo in CAMPOS_DIFERENCIA if conteo[campo]]
+
+
+def iterar_diferencias(carga):
+    """Diferencias de la carga en orden de fila, un changeset a la vez."""
+    cambios = carga.cambios.filter(diferencias__isnull=False).order_by('fila_hasta', 'id')
+    for datos in cambios.values_list('diferencias', flat=True).iterator():
+        yield from deserializar_diferencias(datos)
+
+
+def _campos_restaurar(cambios):
+    """
+    Columnas que restaura la reversión: las que la carga modificó en alguna
+    fila más usuario, huella y fecha. Un changeset con filas actualizadas y sin
+    conteo_campos (guardado antes de registrarlo) restaura todas.
+    """
+    modificados = set()
+    for actualizados, conteo_campos in cambios:
+        if actualizados and not conteo_campos:
+            return CAMPOS_CAMBIO
+        modificados.update(conteo_campos)
+    return [campo for campo in CAMPOS_ACTUALIZABLES if campo not in CAMPOS_DIFERENCIA or campo in modificados]
+
+
+def revertir_carga(carga, usuario=None, ip_address=None):
+    """
+    Restaura el estado previo a la carga: valores anteriores de las filas
+    actualizadas, eliminación de las creadas y de los instrumentos que creó
+    y quedaron sin calificaciones. Las filas editadas después de la carga se
+    omiten. Retorna un ResultadoReversion.
+    Lanza ReversionNoPermitida si la carga no se puede revertir.
+    """
+    with transaccion_carga():
+        carga = CargaMasiva.objects.select_for_update().get(pk=carga.pk)
+        if not carga.puede_revertirse:
+            raise ReversionNoPermitida(f"La carga #{carga.id} no tiene cambios que revertir.")
+        posteriores = CargaMasiva.objects.filter(pk__gt=carga.pk).exclude(estado='REVERTIDO').filter(
+            Q(cambios__isnull=False) | Q(estado__in=['EN_COLA', 'PROCESANDO'])
+        )
+        if posteriores.exists():
+            raise ReversionNoPermitida(
+                f"La carga #{carga.id} no es la última carga aplicada; revierta primero las posteriores."
+            )
+
+        # Estado más antiguo de cada fila (el primer changeset que la modificó)
+        # y estado en que la dejó la carga (el último)
+        previos = {}
+        creados = set()
+        posteriores = {}
+        instrumentos = set()
+        conteos = []
+        for datos, actualizados, conteo_campos in carga.cambios.order_by('id').values_list(
+            'datos', 'actualizados', 'conteo_campos'
+        ):
+            conteos.append((actualizados, conteo_campos))
+            contenido = _descomprimir(datos)
+            filas, ids = _previos(contenido)
+            for fila in filas:
+                previos.setdefault(fila['id'], fila)
+            creados.update(ids)
+            posteriores.update(_posteriores(contenido))
+            instrumentos.update(contenido.get('instrumentos', []))
+
+        restauradas = eliminadas = 0
+        omitidas = set()
+        if previos or creados:
+            with connection.cursor() as cursor:
+                staging_carga.preparar_staging(cursor)
+                vacias = [None] * len(staging_carga.CAMPOS_DESTINO)
+                if bloqueo_por_clave():
+                    # Mismas claves que bloquea el motor: una carga en curso sobre
+                    # estas filas termina antes de comprobar si fueron editadas
+                    staging_carga.cargar_staging(cursor, [
+                        [pk, GENERACION_BLOQUEAR, False] + vacias for pk in previos.keys() | creados
+                    ])
+                    bloquear_claves([
+                        clave_bloqueo(ESPACIO_CALIFICACION, *clave)
+                        for clave in staging_carga.claves_staging(cursor, GENERACION_BLOQUEAR)
+                    ])
+                if posteriores:
+                    staging_carga.cargar_staging(cursor, [
+                        staging_carga.fila_staging(
+                            pk, GENERACION_VERIFICAR, True,
+                            CalificacionTributaria(huella=huella, fecha_modificacion=fecha),
+                        )
+                        for pk, (huella, fecha) in posteriores.items()
+                    ])
+                    omitidas = staging_carga.filas_modificadas(cursor, GENERACION_VERIFICAR)
+
+                filas_staging = [
+                    staging_carga.fila_staging(pk, GENERACION_RESTAURAR, True, CalificacionTributaria(**fila))
+                    for pk, fila in previos.items()
+                    if pk not in creados and pk not in omitidas  # Creada por la misma carga: se elimina
+                ]
+                filas_staging += [
+                    [pk, GENERACION_ELIMINAR, False] + vacias for pk in creados if pk not in omitidas
+                ]
+                if filas_staging:
+                    staging_carga.cargar_staging(cursor, filas_staging)
+                    restauradas = staging_carga.restaurar_staging(
+                        cursor, _campos_restaurar(conteos), GENERACION_RESTAURAR
+                    )
+                    eliminadas = staging_carga.eliminar_staging(cursor, GENERACION_ELIMINAR)
+
+        instrumentos_eliminados = 0
+        if instrumentos:
+            instrumentos_eliminados, _ = InstrumentoFinanciero.objects.filter(
+                pk__in=instrumentos, calificaciontributaria__isnull=True
+            ).delete()
+
+        omitidas = sorted(omitidas)
+        carga.estado = 'REVERTIDO'
+        carga.save(update_fields=['estado'])
+        detalles = (
+            f"Carga masiva revertida ({carga.archivo_nombre}): "
+            f"{restauradas} restauradas, {eliminadas} eliminadas, "
+            f"{instrumentos_eliminados} instrumentos eliminados"
+        )
+        if omitidas:
+            listadas = ', '.join(map(str, omitidas[:MAX_OMITIDAS_AUDITORIA]))
+            detalles += (
+                f"; {len(omitidas)} omitidas por haber sido editadas después de la carga "
+                f"(ids: {listadas}{', ...' if len(omitidas) > MAX_OMITIDAS_AUDITORIA else ''})"
+            )
+        LogAuditoria.objects.create(
+            usuario=usuario,
+            accion="BULK_ROLLBACK",
+            tabla_afectada="CalificacionTributaria",
+            registro_id=carga.id,
+            ip_address=ip_address,
+            detalles=detalles,
+        )
+
+    logger.info(
+        f"Bulk upload rolled back - Carga: {carga.id}, File: {carga.archivo_nombre}, "
+        f"Restored: {restauradas}, Deleted: {eliminadas}, Skipped (edited): {len(omitidas)}, "
+        f"Instruments deleted: {instrumentos_eliminados}"
+    )
+    return ResultadoReversion(restauradas, eliminadas, omitidas, instrumentos_eliminados)
@@ -0,0 +1,76 @@
+"""
+Generación de códigos de instrumento
+
+Un instrumento sin codigo_instrumento recibe un código derivado de su nombre
+(iniciales / acrónimo, máx. 10 caracteres) con sufijo numérico si ya existe.
+generar_codigos_unicos() asigna códigos a un lote completo de nombres con
+una sola consulta por prefijo, en lugar de una consulta exists() por
+candidato; lo usan tanto la carga masiva como InstrumentoFinanciero.save().
+"""
+
+import uuid
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from ..models import InstrumentoFinanciero
+
+# Sufijos numéricos probados antes de recurrir a un sufijo aleatorio
+MAX_SUFIJO = 999
+
+# Base para nombres sin iniciales (un prefijo vacío coincidiría con todo el catálogo)
+BASE_SIN_NOMBRE = 'INST'
+
+# Artículos y preposiciones que no aportan iniciales en nombres largos
+PALABRAS_IGNORADAS = ['S.A.', 'S.A', 'SA', 'DE', 'DEL', 'LA', 'LAS', 'LOS', 'EL']
+
+
+def codigo_base(nombre):
+    """Iniciales del nombre (acrónimo de palabras clave si tiene más de 3 palabras)."""
+    palabras = (nombre or '').upper().split()
+
+    # Opción 1: Si tiene menos de 3 palabras, usar iniciales
+    if len(palabras) <= 3:
+        base = ''.join([p[0] for p in palabras if p])
+    else:
+        # Opción 2: Usar primeras 2-3 iniciales de palabras principales (excluir artículos/preposiciones)
+        palabras_clave = [p for p in palabras if p not in PALABRAS_IGNORADAS]
+        base = ''.join([p[0] for p in palabras_clave[:4] if p])
+
+    # Limitar a 10 caracteres
+    return base[:10] or BASE_SIN_NOMBRE
+
+
+def generar_codigos_unicos(nombres, excluir_pk=None):
+    """
+    Retorna un código único por nombre, en el mismo orden. Los códigos en uso
+    con cada prefijo se leen con una sola consulta; los códigos asignados
+    dentro del lote también cuentan como ocupados.
+    excluir_pk: instrumento que se está guardando (su propio código no choca).
+    """
+    bases = [codigo_base(nombre) for nombre in nombres]
+    if not bases:
+        return []
+
+    existentes = InstrumentoFinanciero.objects.filter(
+        reduce(or_, (Q(codigo_instrumento__startswith=base) for base in set(bases)))
+    )
+    if excluir_pk is not None:
+        existentes = existentes.exclude(pk=excluir_pk)
+    ocupados = set(existentes.values_list('codigo_instrumento', flat=True))
+
+    codigos = []
+    for base in bases:
+        codigo = base
+        contador = 1
+        while codigo in ocupados:
+            # Agregar sufijo numérico si existe duplicado
+            codigo = f"{base}{contador}"
+            contador += 1
+            if contador > MAX_SUFIJO:  # Límite de seguridad
+                codigo = f"{base[:6]}{str(uuid.uuid4())[:4].upper()}"
+                break
+        ocupados.add(codigo)
+        codigos.append(codigo)
+    return codigos
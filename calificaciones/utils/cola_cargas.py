@@ -0,0 +1,501 @@
+"""
+Cola de Trabajos de Carga Masiva (respaldada en base de datos)
+
+La vista carga_masiva solo guarda el archivo y encola un TrabajoCarga.
+Los workers (python manage.py procesar_cargas) drenan la cola:
+- Reclaman trabajos con SELECT ... FOR UPDATE SKIP LOCKED, por lo que varios
+  nodos pueden procesar la cola en paralelo sin tomar el mismo trabajo.
+- Mantienen un latido (ultimo_latido) por cada lote procesado; un trabajo
+  EN_CURSO sin latido durante SEGUNDOS_EXPIRACION se considera abandonado
+  (worker caído) y vuelve a ser reclamado.
+- Tras MAX_INTENTOS reclamos, el trabajo se marca FALLIDO.
+
+Cada transacción de filas confirmadas guarda, en la misma transacción, la
+última fila del archivo (CargaMasiva.fila_checkpoint), los contadores
+acumulados y los errores por fila (CargaMasivaError, con bulk_create).
+CargaMasiva.errores_detalle solo guarda un resumen acotado. Un trabajo retomado tras la caída de un worker, o una carga
+FALLIDA reanudada con reanudar_carga, continúa desde ese checkpoint.
+
+Al encolar, el SHA-256 del archivo (ArchivoCargado) se calcula sobre los mismos
+bloques que se copian al storage, sin una lectura aparte; en un .csv se cuentan
+además las filas (TrabajoCarga.filas_totales) en esa pasada. Si el mismo
+contenido ya se cargó y no falló ni se revirtió, se descarta la copia, no se
+crea trabajo y se informa la carga original (reintentos de corredoras no
+vuelven a procesar el archivo).
+"""
+
+import hashlib
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import ArchivoCargado, CargaMasiva, CargaMasivaError, LogAuditoria, TrabajoCarga
+from .cambios_carga import guardar_cambios
+from .lectores import ContadorLineas, contar_filas, leer_filas
+from .motor_carga import TAMANO_LOTE, MotorCargaMasiva, filas_colapsadas
+
+logger = logging.getLogger(__name__)
+
+# Un trabajo EN_CURSO sin latido durante este tiempo se vuelve a reclamar
+SEGUNDOS_EXPIRACION = 600
+
+# Reclamos máximos antes de marcar el trabajo como FALLIDO
+MAX_INTENTOS = 3
+
+# Estados de la carga original que no bloquean reenviar el mismo archivo
+ESTADOS_REENVIABLES = ("FALLIDO", "REVERTIDO")
+
+# Errores por fila copiados al resumen CargaMasiva.errores_detalle (el resto en CargaMasivaError)
+MAX_ERRORES_RESUMEN = 100
+
+
+class TrabajoPerdido(Exception):
+    """El trabajo fue reclamado por otro worker (latido expirado)."""
+
+
+def identificador_worker():
+    """Identificador único del proceso worker: host:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def encolar_carga(carga, ip_address=None, filas_totales=0):
+    """
+    Encola una CargaMasiva para procesamiento en segundo plano.
+    filas_totales: filas del archivo si ya se contaron (0: las estima el worker).
+    """
+    if carga.estado != "EN_COLA":
+        carga.estado = "EN_COLA"
+        carga.save(update_fields=["estado"])
+    trabajo = TrabajoCarga.objects.create(carga=carga, ip_address=ip_address, filas_totales=filas_totales)
+    logger.info(f"Bulk upload queued - Carga: {carga.id}, Trabajo: {trabajo.id}")
+    return trabajo
+
+
+class _ArchivoSubido(File):
+    """
+    Archivo subido que calcula su SHA-256 (y cuenta las filas de un CSV sin
+    comprimir) a medida que el storage lee sus bloques para guardarlo.
+    """
+
+    def __init__(self, archivo):
+        super().__init__(archivo, name=archivo.name)
+        self.hash = hashlib.sha256()
+        self.lineas = ContadorLineas() if archivo.name.endswith(".csv") else None
+
+    def chunks(self, chunk_size=None):
+        for bloque in super().chunks(chunk_size):
+            self.hash.update(bloque)
+            if self.lineas is not None:
+                self.lineas.agregar(bloque)
+            yield bloque
+
+
+def _guardar_archivo(archivo):
+    """
+    Copia el archivo subido al storage de CargaMasiva.archivo en una sola
+    pasada. Retorna (ruta, hash SHA-256, filas o 0 si no se contaron).
+    """
+    campo = CargaMasiva._meta.get_field("archivo")
+    # File no expone temporary_file_path: el storage copia por bloques en lugar de mover el temporal
+    subido = _ArchivoSubido(archivo)
+    ruta = campo.storage.save(campo.generate_filename(None, archivo.name), subido, max_length=campo.max_length)
+    filas = subido.lineas.filas() if subido.lineas is not None else 0
+    return ruta, subido.hash.hexdigest(), filas
+
+
+def encolar_archivo(archivo, usuario, ip_address=None):
+    """
+    Registra el archivo subido como CargaMasiva y lo encola, salvo que su
+    contenido (SHA-256) ya se haya cargado antes sin fallar.
+
+    Retorna (trabajo, None) si se encoló o (None, carga_original) si es duplicado.
+    Una carga original FALLIDA o REVERTIDA no bloquea el reenvío: el hash pasa
+    a la nueva carga.
+    """
+    ruta, hash_archivo, filas_totales = _guardar_archivo(archivo)
+    storage = CargaMasiva._meta.get_field("archivo").storage
+
+    try:
+        with transaction.atomic():
+            registro = (
+                ArchivoCargado.objects.select_for_update()
+                .select_related("carga_masiva")
+                .filter(hash_archivo=hash_archivo)
+                .first()
+            )
+            original = registro.carga_masiva if registro else None
+            if original is not None and original.estado not in ESTADOS_REENVIABLES:
+                logger.warning(
+                    f"Duplicate bulk upload rejected - User: {usuario.username}, "
+                    f"File: {archivo.name}, Original carga: {original.id}"
+                )
+                storage.delete(ruta)
+                return None, original
+
+            carga = CargaMasiva.objects.create(
+                usuario=usuario,
+                archivo_nombre=archivo.name,
+                archivo=ruta,
+                estado="EN_COLA",
+            )
+            if registro is None:
+                ArchivoCargado.objects.create(
+                    nombre_archivo=archivo.name,
+                    hash_archivo=hash_archivo,
+                    usuario=usuario,
+                    carga_masiva=carga,
+                )
+            else:
+                registro.nombre_archivo = archivo.name
+                registro.usuario = usuario
+                registro.carga_masiva = carga
+                registro.save(update_fields=["nombre_archivo", "usuario", "carga_masiva"])
+
+            return encolar_carga(carga, ip_address=ip_address, filas_totales=filas_totales), None
+    except IntegrityError:
+        # Otra solicitud registró el mismo archivo en paralelo
+        storage.delete(ruta)
+        registro = ArchivoCargado.objects.select_related("carga_masiva").get(hash_archivo=hash_archivo)
+        logger.warning(
+            f"Duplicate bulk upload rejected (concurrent) - User: {usuario.username}, "
+            f"File: {archivo.name}, Original carga: {registro.carga_masiva_id}"
+        )
+        return None, registro.carga_masiva
+
+
+def _descartar_agotados(limite):
+    """Marca FALLIDO los trabajos abandonados que ya agotaron sus intentos."""
+    agotados = list(
+        TrabajoCarga.objects.select_for_update(skip_locked=True, of=("self",))
+        .filter(estado="EN_CURSO", ultimo_latido__lt=limite, intentos__gte=MAX_INTENTOS)
+        .select_related("carga")
+    )
+    for trabajo in agotados:
+        logger.error(
+            f"Bulk upload job abandoned {trabajo.intentos} times, giving up - "
+            f"Trabajo: {trabajo.id}, File: {trabajo.carga.archivo_nombre}"
+        )
+        trabajo.estado = "FALLIDO"
+        trabajo.fecha_fin = timezone.now()
+        trabajo.save(update_fields=["estado", "fecha_fin"])
+        _marcar_interrumpida(
+            trabajo.carga,
+            f"El procesamiento se interrumpió {trabajo.intentos} veces (worker detenido).",
+        )
+
+
+def reclamar_trabajo(worker_id, trabajo_id=None):
+    """
+    Reclama el siguiente trabajo disponible (PENDIENTE o EN_CURSO abandonado).
+    Usa bloqueo de fila con SKIP LOCKED para que varios workers no tomen el mismo.
+    Retorna el TrabajoCarga reclamado o None si la cola está vacía.
+    """
+    ahora = timezone.now()
+    limite = ahora - timedelta(seconds=SEGUNDOS_EXPIRACION)
+
+    with transaction.atomic():
+        _descartar_agotados(limite)
+
+        disponibles = TrabajoCarga.objects.select_for_update(skip_locked=True).filter(
+            Q(estado="PENDIENTE") | Q(estado="EN_CURSO", ultimo_latido__lt=limite)
+        )
+        if trabajo_id is not None:
+            disponibles = disponibles.filter(pk=trabajo_id)
+        trabajo = disponibles.order_by("fecha_encolado", "id").first()
+        if trabajo is None:
+            return None
+
+        if trabajo.estado == "EN_CURSO":
+            logger.warning(
+                f"Reclaiming abandoned bulk upload job - Trabajo: {trabajo.id}, "
+                f"Previous worker: {trabajo.worker}"
+            )
+
+        trabajo.estado = "EN_CURSO"
+        trabajo.worker = worker_id
+        trabajo.intentos += 1
+        trabajo.fecha_inicio = ahora
+        trabajo.ultimo_latido = ahora
+        trabajo.filas_procesadas = 0
+        trabajo.save(update_fields=[
+            "estado", "worker", "intentos", "fecha_inicio", "ultimo_latido", "filas_procesadas",
+        ])
+
+    return trabajo
+
+
+def reanudar_carga(carga, ip_address=None):
+    """
+    Vuelve a encolar una carga FALLIDA con filas ya confirmadas para que continúe
+    desde su checkpoint. Retorna el TrabajoCarga o None si la carga no puede reanudarse.
+    """
+    with transaction.atomic():
+        carga = CargaMasiva.objects.select_for_update().get(pk=carga.pk)
+        trabajo = TrabajoCarga.objects.filter(carga=carga).first()
+        if not carga.puede_reanudarse or (trabajo is not None and trabajo.estado in ("PENDIENTE", "EN_CURSO")):
+            return None
+
+        carga.estado = "EN_COLA"
+        carga.save(update_fields=["estado"])
+        if trabajo is None:
+            trabajo = TrabajoCarga(carga=carga)
+        trabajo.estado = "PENDIENTE"
+        trabajo.ip_address = ip_address
+        trabajo.worker = ""
+        trabajo.intentos = 0
+        trabajo.fecha_inicio = None
+        trabajo.fecha_fin = None
+        trabajo.ultimo_latido = None
+        trabajo.save()
+
+    logger.info(
+        f"Bulk upload resumed - Carga: {carga.id}, Trabajo: {trabajo.id}, "
+        f"From row: {carga.fila_checkpoint + 1}"
+    )
+    return trabajo
+
+
+def _marcar_interrumpida(carga, mensaje):
+    """
+    Marca la carga FALLIDA con el motivo de la interrupción (seguido del resumen
+    de errores de las filas ya confirmadas) y, si hay checkpoint, indica desde
+    qué fila puede reanudarse.
+    """
+    carga.refresh_from_db()
+    if carga.fila_checkpoint:
+        mensaje += (
+            f" Las filas 1 a {carga.fila_checkpoint} quedaron confirmadas; "
+            f"puede reanudar la carga desde la fila {carga.fila_checkpoint + 1}."
+        )
+    else:
+        mensaje += " Vuelva a cargar el archivo."
+    carga.estado = "FALLIDO"
+    carga.errores_detalle = "\n".join(filter(None, [mensaje, resumen_errores(carga)]))
+    carga.save(update_fields=["estado", "errores_detalle"])
+
+
+def _confirmar_avance(trabajo, carga, fila, parcial):
+    """
+    Checkpoint de una transacción de la carga: latido del trabajo, última fila
+    confirmada, contadores acumulados, errores por fila y changeset inverso
+    (CambioCarga, para revertir la carga). Se ejecuta dentro de la misma
+    transacción que las filas, por lo que si el trabajo fue reclamado por otro
+    worker (TrabajoPerdido) las filas también se revierten.
+    """
+    _latido(trabajo, filas_procesadas=fila)
+    campos = {
+        "fila_checkpoint": fila,
+        "registros_procesados": F("registros_procesados") + parcial.procesados,
+        "registros_exitosos": F("registros_exitosos") + parcial.exitosos,
+        "registros_fallidos": F("registros_fallidos") + parcial.fallidos,
+        "registros_sin_cambios": F("registros_sin_cambios") + parcial.sin_cambios,
+        "registros_colapsados": F("registros_colapsados") + parcial.colapsados,
+    }
+    CargaMasiva.objects.filter(pk=carga.pk).update(**campos)
+    CargaMasivaError.objects.bulk_create(
+        [
+            CargaMasivaError(
+                carga_id=carga.pk, fila=error.fila, codigo=error.codigo,
+                columna=error.columna, mensaje=error.mensaje,
+            )
+            for error in parcial.errores_fila
+        ],
+        batch_size=1000,
+    )
+    guardar_cambios(carga, fila, parcial.cambios)
+
+
+def resumen_errores(carga):
+    """Primeros MAX_ERRORES_RESUMEN errores por fila de la carga, como texto para errores_detalle."""
+    errores = carga.errores.order_by("fila", "id")
+    mensajes = list(errores.values_list("mensaje", flat=True)[:MAX_ERRORES_RESUMEN])
+    if len(mensajes) == MAX_ERRORES_RESUMEN:
+        restantes = errores.count() - MAX_ERRORES_RESUMEN
+        if restantes:
+            mensajes.append(f"... y {restantes} errores más (ver detalle de errores de la carga).")
+    return "\n".join(mensajes)
+
+
+def _latido(trabajo, **campos):
+    """Actualiza latido y progreso; TrabajoPerdido si otro worker reclamó el trabajo."""
+    campos["ultimo_latido"] = timezone.now()
+    actualizados = TrabajoCarga.objects.filter(
+        pk=trabajo.pk, worker=trabajo.worker, estado="EN_CURSO"
+    ).update(**campos)
+    if not actualizados:
+        raise TrabajoPerdido(f"Trabajo {trabajo.pk} reclamado por otro worker")
+    for campo, valor in campos.items():
+        setattr(trabajo, campo, valor)
+
+
+def ejecutar_trabajo(trabajo, procesos=None, staging=None):
+    """
+    Procesa un trabajo ya reclamado y lo marca COMPLETADO, o FALLIDO si el
+    archivo no se pudo procesar (la carga queda FALLIDA con el motivo).
+    Retorna el ResultadoCarga (None si otro worker lo reclamó o si el archivo falló).
+    """
+    try:
+        resultado = procesar_carga(trabajo, procesos=procesos, staging=staging)
+    except TrabajoPerdido as e:
+        logger.warning(f"Bulk upload job lost, stopping - {e}")
+        return None
+    except Exception:
+        TrabajoCarga.objects.filter(pk=trabajo.pk, worker=trabajo.worker).update(
+            estado="FALLIDO", fecha_fin=timezone.now()
+        )
+        raise
+
+    if resultado is None:
+        TrabajoCarga.objects.filter(pk=trabajo.pk, worker=trabajo.worker).update(
+            estado="FALLIDO", fecha_fin=timezone.now()
+        )
+        return None
+
+    TrabajoCarga.objects.filter(pk=trabajo.pk, worker=trabajo.worker).update(
+        estado="COMPLETADO", fecha_fin=timezone.now(), ultimo_latido=timezone.now()
+    )
+    return resultado
+
+
+def procesar_carga(trabajo, procesos=None, staging=None):
+    """
+    Procesa el archivo de la carga asociada al trabajo y registra el resultado
+    en CargaMasiva y LogAuditoria. Retorna el ResultadoCarga (None si el archivo falló).
+    procesos: procesos de parseo/validación (default: settings.CARGA_MASIVA_PROCESOS).
+    staging: escritura vía tabla de staging (default: settings.CARGA_MASIVA_STAGING).
+    """
+    carga = trabajo.carga
+    carga.refresh_from_db()
+    usuario = carga.usuario
+    username = usuario.username if usuario else "-"
+    desde_fila = carga.fila_checkpoint
+
+    carga.estado = "PROCESANDO"
+    carga.save(update_fields=["estado"])
+
+    try:
+        with carga.archivo.open("rb") as archivo:
+            logger.debug(f"Processing file: {carga.archivo_nombre}")
+            # Contadas al guardar el archivo (CSV) o estimadas ahora (Excel, CSV.GZ)
+            filas_totales = trabajo.filas_totales or contar_filas(archivo, carga.archivo_nombre) or 0
+            _latido(trabajo, filas_totales=filas_totales, filas_procesadas=desde_fila, fila_inicio=desde_fila)
+
+            # Pre-pasada: filas que repiten una clave del archivo (solo se escribe la que prevalece)
+            esquema, filas = leer_filas(archivo, carga.archivo_nombre)
+            if esquema.ignoradas:
+                logger.info(
+                    f"Ignoring unknown columns - Carga: {carga.id}, "
+                    f"File: {carga.archivo_nombre}, Columns: {esquema.ignoradas}"
+                )
+            colapsadas = filas_colapsadas(filas, esquema=esquema)
+            archivo.seek(0)
+            if colapsadas:
+                logger.info(
+                    f"Collapsed duplicate keys in file - Carga: {carga.id}, "
+                    f"File: {carga.archivo_nombre}, Rows collapsed: {len(colapsadas)}"
+                )
+            esquema, filas = leer_filas(archivo, carga.archivo_nombre)
+            if desde_fila:
+                logger.info(
+                    f"Resuming bulk upload from checkpoint - Carga: {carga.id}, "
+                    f"File: {carga.archivo_nombre}, From row: {desde_fila + 1}"
+                )
+
+            # Procesar registros por lotes con lógica de UPDATE y reglas de prioridad.
+            # Archivos de un solo lote no justifican levantar procesos
+            if procesos is None:
+                procesos = settings.CARGA_MASIVA_PROCESOS
+            if staging is None:
+                staging = settings.CARGA_MASIVA_STAGING
+            if filas_totales - desde_fila <= TAMANO_LOTE:
+                procesos = 1
+            motor = MotorCargaMasiva(
+                usuario=usuario,
+                procesos=procesos,
+                filas_por_commit=settings.CARGA_MASIVA_FILAS_POR_COMMIT,
+                staging=staging,
+                muestreo_log=settings.CARGA_MASIVA_LOG_MUESTREO,
+            )
+            resultado = motor.procesar(
+                filas,
+                desde_fila=desde_fila,
+                checkpoint=lambda fila, parcial: _confirmar_avance(trabajo, carga, fila, parcial),
+                colapsadas=colapsadas,
+                esquema=esquema,
+            )
+
+        creados = resultado.creados
+        actualizados = resultado.actualizados
+        omitidos = resultado.omitidos
+        sin_cambios = resultado.sin_cambios
+        colapsados = resultado.colapsados
+        fallidos = resultado.fallidos
+
+        # Totales acumulados en los checkpoints (incluyen intentos anteriores si se reanudó)
+        carga.refresh_from_db()
+        exitosos = carga.registros_exitosos
+        carga.errores_detalle = resumen_errores(carga) or "Ningún error"
+
+        # Las filas colapsadas no se escriben, pero tampoco son errores
+        if exitosos + carga.registros_colapsados == carga.registros_procesados:
+            carga.estado = "EXITOSO"
+            logger.info(
+                f"Bulk upload completed successfully - User: {username}, "
+                f"File: {carga.archivo_nombre}, Created: {creados}, Updated: {actualizados}, "
+                f"Unchanged: {sin_cambios}, Collapsed: {colapsados}, Total: {exitosos}/{carga.registros_procesados}"
+            )
+        elif exitosos > 0:
+            carga.estado = "PARCIAL"
+            logger.warning(
+                f"Bulk upload partially completed - User: {username}, "
+                f"File: {carga.archivo_nombre}, Created: {creados}, Updated: {actualizados}, "
+                f"Unchanged: {sin_cambios}, Collapsed: {colapsados}, Skipped: {omitidos}, Failed: {fallidos}"
+            )
+        else:
+            carga.estado = "FALLIDO"
+            logger.error(
+                f"Bulk upload failed completely - User: {username}, "
+                f"File: {carga.archivo_nombre}, Total records: {carga.registros_procesados}, "
+                f"Failed: {carga.registros_fallidos}"
+            )
+
+        carga.save()
+
+        # Registrar en auditoría con detalles completos
+        LogAuditoria.objects.create(
+            usuario=usuario,
+            accion="BULK_UPLOAD",
+            tabla_afectada="CalificacionTributaria",
+            registro_id=carga.id,
+            ip_address=trabajo.ip_address,
+            detalles=(
+                f"Carga masiva completada: {creados} creados, {actualizados} actualizados, "
+                f"{sin_cambios} sin cambios, {colapsados} colapsados (clave repetida), "
+                f"{omitidos} omitidos (prioridad), {fallidos} fallidos"
+            ),
+        )
+        return resultado
+
+    except TrabajoPerdido:
+        raise
+    except ValueError as e:
+        logger.error(f"File format error - File: {carga.archivo_nombre}, Error: {str(e)}")
+        _marcar_interrumpida(carga, f"Error de formato: {str(e)}.")
+    except PermissionError as e:
+        logger.error(f"File access error - File: {carga.archivo_nombre}, Error: {str(e)}")
+        _marcar_interrumpida(carga, f"Error de acceso al archivo: {str(e)}.")
+    except Exception as e:
+        logger.error(
+            f"Critical error in bulk upload - User: {username}, "
+            f"File: {carga.archivo_nombre}, Error: {str(e)}",
+            exc_info=True,
+        )
+        _marcar_interrumpida(carga, f"Error al procesar el archivo: {str(e)}.")
+    return None
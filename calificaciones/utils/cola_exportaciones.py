@@ -0,0 +1,417 @@
+"""
+Cola y cache de exportaciones de calificaciones (respaldadas en base de datos)
+
+exportar_excel y exportar_csv no generan el archivo dentro de la solicitud:
+solicitar_exportacion() busca un TrabajoExportacion con la misma clave y, si no
+existe, lo encola. Los workers (python manage.py procesar_exportaciones) lo
+escriben en MEDIA_ROOT/exportaciones/ y lo marcan COMPLETADO.
+
+- Clave: SHA-256 de los filtros normalizados (CalificacionQuery.clave_cache),
+  el formato y la versión de los datos (version_datos). Una solicitud idéntica
+  con los datos sin cambios reutiliza el archivo generado, sin volver a leer
+  ni serializar las calificaciones; cualquier alta, baja o modificación cambia la versión y la
+  siguiente solicitud genera un archivo nuevo.
+- La versión se vuelve a calcular en el worker antes y después de leer las
+  filas: si cambió durante la lectura el archivo se regenera, y si difiere de
+  la versión de la solicitud el trabajo se completa con la clave de la versión
+  que realmente contiene el archivo.
+- Reclamo con SELECT ... FOR UPDATE SKIP LOCKED, latido y reintentos igual que
+  la cola de cargas (cola_cargas): un trabajo de un worker caído se vuelve a
+  reclamar.
+- Presupuesto de disco (settings.EXPORTACION_CACHE_MAX_MB): al completar un
+  trabajo se eliminan los archivos menos usados recientemente (ultimo_acceso)
+  hasta volver al presupuesto.
+"""
+
+import csv
+import hashlib
+import io
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+import openpyxl
+
+from ..models import CalificacionTributaria, InstrumentoFinanciero, TrabajoExportacion
+from .cola_cargas import MAX_INTENTOS, SEGUNDOS_EXPIRACION, TrabajoPerdido
+from .consulta_calificaciones import CalificacionQuery
+
+logger = logging.getLogger(__name__)
+
+TAMANO_CHUNK_EXPORTACION = 2000  # Filas por lectura del cursor del servidor (y por latido)
+MAX_FILAS_HOJA_EXCEL = 1048576  # Límite de filas de una hoja XLSX (incluye encabezados)
+MAX_GENERACIONES = 3  # Lecturas de las filas por trabajo si los datos cambian mientras se escribe el archivo
+
+EXTENSIONES = {'XLSX': 'xlsx', 'CSV': 'csv'}
+
+# Columnas de exportación de calificaciones: (encabezado, campo de values_list)
+COLUMNAS_EXPORTACION = (
+    [
+        ("ID", "id"),
+        ("Código Instrumento", "instrumento__codigo_instrumento"),
+        ("Nombre Instrumento", "instrumento__nombre_instrumento"),
+        ("Fecha Informe", "fecha_informe"),
+        ("Mercado", "mercado"),
+        ("Secuencia", "secuencia"),
+        ("Origen (Tipo Soc)", "tipo_sociedad"),
+        ("N° DJ", "numero_dj"),
+        ("Ejercicio", "ejercicio"),
+        ("Valor Histórico", "valor_historico"),
+        ("Monto", "monto"),
+    ]
+    + [(f"Factor {i}", f"factor_{i}") for i in range(8, 38)]
+    + [
+        ("Método Ingreso", "metodo_ingreso"),
+        ("Usuario Creador", "usuario_creador__username"),
+        ("Fecha Creación", "fecha_creacion"),
+        ("Observaciones", "observaciones"),
+    ]
+)
+
+
+# ----------------------------------------------------------------------
+# Archivos de exportación
+# ----------------------------------------------------------------------
+
+def filas_exportacion(consulta, vacio=""):
+    """
+    Filas de exportación de una CalificacionQuery (orden de COLUMNAS_EXPORTACION)
+    leídas como tuplas values_list en chunks de un cursor del servidor, sin
+    instancias del modelo. Valores vacíos o cero como vacio, fechas como texto.
+    """
+    campos = [campo for _, campo in COLUMNAS_EXPORTACION]
+    fecha_informe = campos.index("fecha_informe")
+    fecha_creacion = campos.index("fecha_creacion")
+    for valores in consulta.para_exportacion(campos).iterator(chunk_size=TAMANO_CHUNK_EXPORTACION):
+        fila = [valor or vacio for valor in valores]
+        if fila[fecha_informe]:
+            fila[fecha_informe] = fila[fecha_informe].strftime("%Y-%m-%d")
+        if fila[fecha_creacion]:
+            fila[fecha_creacion] = fila[fecha_creacion].strftime("%Y-%m-%d %H:%M:%S")
+        yield fila
+
+
+def escribir_excel(filas, archivo):
+    """
+    Escribe las filas en archivo como XLSX (openpyxl en modo solo escritura). Al
+    llegar a MAX_FILAS_HOJA_EXCEL filas continúa en una hoja nueva con los mismos
+    encabezados ("Calificaciones", "Calificaciones (2)", ...). Retorna las filas escritas.
+    """
+    encabezados = [encabezado for encabezado, _ in COLUMNAS_EXPORTACION]
+    filas_por_hoja = MAX_FILAS_HOJA_EXCEL - 1
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Calificaciones")
+    ws.append(encabezados)
+    hojas = 1
+    exportadas = 0
+    for fila in filas:
+        if exportadas and exportadas % filas_por_hoja == 0:
+            hojas += 1
+            ws = wb.create_sheet(f"Calificaciones ({hojas})")
+            ws.append(encabezados)
+        ws.append(fila)
+        exportadas += 1
+    wb.save(archivo)
+    return exportadas
+
+
+def escribir_csv(filas, archivo):
+    """Escribe encabezados y filas en archivo (binario) como CSV UTF-8. Retorna las filas escritas."""
+    texto = io.TextIOWrapper(archivo, encoding="utf-8", newline="")
+    writer = csv.writer(texto)
+    writer.writerow([encabezado for encabezado, _ in COLUMNAS_EXPORTACION])
+    exportadas = 0
+    for fila in filas:
+        writer.writerow(fila)
+        exportadas += 1
+    texto.flush()
+    texto.detach()  # El archivo sigue abierto para quien lo creó
+    return exportadas
+
+
+# ----------------------------------------------------------------------
+# Clave de cache
+# ----------------------------------------------------------------------
+
+def version_datos():
+    """
+    Sello de la versión de los datos exportables: cantidad, id máximo y última
+    modificación de calificaciones e instrumentos. Cambia con cualquier alta,
+    baja (lógica o física) o modificación, incluidas las de la carga masiva.
+    """
+    calificaciones = CalificacionTributaria.objects.aggregate(
+        n=Count("id"), max_id=Max("id"), modificacion=Max("fecha_modificacion")
+    )
+    instrumentos = InstrumentoFinanciero.objects.aggregate(
+        n=Count("id"), modificacion=Max("fecha_modificacion")
+    )
+    modificaciones = [
+        calificaciones["modificacion"].timestamp() if calificaciones["modificacion"] else 0,
+        instrumentos["modificacion"].timestamp() if instrumentos["modificacion"] else 0,
+    ]
+    return (
+        f"{calificaciones['n']}.{calificaciones['max_id'] or 0}.{modificaciones[0]:.6f}"
+        f"-{instrumentos['n']}.{modificaciones[1]:.6f}"
+    )
+
+
+def clave_exportacion(consulta, formato, version):
+    """Clave del archivo de exportación: filtros normalizados + formato + versión de los datos."""
+    contenido = f"{consulta.clave_cache()}|{formato}|{version}"
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def archivo_disponible(trabajo):
+    """True si el trabajo está COMPLETADO y su archivo sigue en disco."""
+    if trabajo.estado != "COMPLETADO" or not trabajo.archivo:
+        return False
+    return trabajo.archivo.storage.exists(trabajo.archivo.name)
+
+
+def registrar_acceso(trabajo):
+    """Marca el archivo como usado recientemente (orden LRU) y cuenta la descarga."""
+    ahora = timezone.now()
+    TrabajoExportacion.objects.filter(pk=trabajo.pk).update(ultimo_acceso=ahora, descargas=F("descargas") + 1)
+    trabajo.ultimo_acceso = ahora
+    trabajo.descargas += 1
+
+
+# ----------------------------------------------------------------------
+# Cola
+# ----------------------------------------------------------------------
+
+def solicitar_exportacion(consulta, formato, usuario):
+    """
+    Retorna (trabajo, disponible) para la exportación de la consulta en el formato dado.
+
+    disponible=True: el archivo ya está generado para los datos actuales y puede
+    enviarse. Si no, el trabajo queda PENDIENTE (nuevo, o reencolado si falló o
+    su archivo fue descartado) o sigue en curso para otra solicitud idéntica.
+    """
+    version = version_datos()
+    clave = clave_exportacion(consulta, formato, version)
+
+    trabajo = TrabajoExportacion.objects.filter(clave=clave).first()
+    if trabajo is None:
+        try:
+            with transaction.atomic():
+                trabajo = TrabajoExportacion.objects.create(
+                    clave=clave,
+                    formato=formato,
+                    filtros=consulta.filtros,
+                    version_datos=version,
+                    usuario=usuario,
+                )
+        except IntegrityError:
+            # Otra solicitud idéntica la encoló en paralelo
+            return TrabajoExportacion.objects.get(clave=clave), False
+        logger.info(f"Export queued - Trabajo: {trabajo.id}, Format: {formato}, Filters: {consulta!r}")
+        return trabajo, False
+
+    if archivo_disponible(trabajo):
+        return trabajo, True
+
+    if trabajo.estado in ("FALLIDO", "COMPLETADO"):
+        # Falló o su archivo ya no está: se vuelve a generar
+        actualizados = TrabajoExportacion.objects.filter(pk=trabajo.pk, estado=trabajo.estado).update(
+            estado="PENDIENTE", worker="", intentos=0, fecha_inicio=None, fecha_fin=None,
+            ultimo_latido=None, filas_exportadas=0, archivo="", tamano=0, error="",
+        )
+        trabajo.refresh_from_db()
+        if actualizados:
+            logger.info(f"Export requeued - Trabajo: {trabajo.id}, Format: {formato}, Filters: {consulta!r}")
+    return trabajo, False
+
+
+def _descartar_agotados(limite):
+    """Marca FALLIDO los trabajos abandonados que ya agotaron sus intentos."""
+    agotados = TrabajoExportacion.objects.select_for_update(skip_locked=True).filter(
+        estado="EN_CURSO", ultimo_latido__lt=limite, intentos__gte=MAX_INTENTOS
+    )
+    for trabajo in agotados:
+        logger.error(f"Export job abandoned {trabajo.intentos} times, giving up - Trabajo: {trabajo.id}")
+        trabajo.estado = "FALLIDO"
+        trabajo.fecha_fin = timezone.now()
+        trabajo.error = f"La generación se interrumpió {trabajo.intentos} veces (worker detenido)."
+        trabajo.save(update_fields=["estado", "fecha_fin", "error"])
+
+
+def reclamar_exportacion(worker_id, trabajo_id=None):
+    """
+    Reclama el siguiente trabajo de exportación disponible (PENDIENTE o EN_CURSO
+    abandonado) con SKIP LOCKED. Retorna el TrabajoExportacion o None si no hay.
+    """
+    ahora = timezone.now()
+    limite = ahora - timedelta(seconds=SEGUNDOS_EXPIRACION)
+
+    with transaction.atomic():
+        _descartar_agotados(limite)
+
+        disponibles = TrabajoExportacion.objects.select_for_update(skip_locked=True).filter(
+            Q(estado="PENDIENTE") | Q(estado="EN_CURSO", ultimo_latido__lt=limite)
+        )
+        if trabajo_id is not None:
+            disponibles = disponibles.filter(pk=trabajo_id)
+        trabajo = disponibles.order_by("fecha_encolado", "id").first()
+        if trabajo is None:
+            return None
+
+        if trabajo.estado == "EN_CURSO":
+            logger.warning(
+                f"Reclaiming abandoned export job - Trabajo: {trabajo.id}, Previous worker: {trabajo.worker}"
+            )
+
+        trabajo.estado = "EN_CURSO"
+        trabajo.worker = worker_id
+        trabajo.intentos += 1
+        trabajo.fecha_inicio = ahora
+        trabajo.ultimo_latido = ahora
+        trabajo.filas_exportadas = 0
+        trabajo.save(update_fields=[
+            "estado", "worker", "intentos", "fecha_inicio", "ultimo_latido", "filas_exportadas",
+        ])
+
+    return trabajo
+
+
+def _latido(trabajo, **campos):
+    """Actualiza latido y progreso; TrabajoPerdido si otro worker reclamó el trabajo."""
+    campos["ultimo_latido"] = timezone.now()
+    actualizados = TrabajoExportacion.objects.filter(
+        pk=trabajo.pk, worker=trabajo.worker, estado="EN_CURSO"
+    ).update(**campos)
+    if not actualizados:
+        raise TrabajoPerdido(f"Trabajo de exportación {trabajo.pk} reclamado por otro worker")
+    for campo, valor in campos.items():
+        setattr(trabajo, campo, valor)
+
+
+def _con_latido(trabajo, filas):
+    """Pasa las filas y registra el avance (latido) cada TAMANO_CHUNK_EXPORTACION."""
+    for n, fila in enumerate(filas, 1):
+        yield fila
+        if n % TAMANO_CHUNK_EXPORTACION == 0:
+            _latido(trabajo, filas_exportadas=n)
+
+
+def _escribir_archivo(trabajo, consulta, temporal):
+    """Escribe (desde el inicio) el archivo del trabajo en temporal. Retorna las filas escritas."""
+    temporal.seek(0)
+    temporal.truncate()
+    # Excel: celdas vacías (None); CSV: texto vacío
+    if trabajo.formato == "XLSX":
+        return escribir_excel(_con_latido(trabajo, filas_exportacion(consulta, vacio=None)), temporal)
+    return escribir_csv(_con_latido(trabajo, filas_exportacion(consulta)), temporal)
+
+
+def ejecutar_exportacion(trabajo):
+    """
+    Genera el archivo de un trabajo ya reclamado, lo guarda en MEDIA_ROOT y lo
+    marca COMPLETADO; luego aplica el presupuesto de disco. Retorna el trabajo
+    (None si otro worker lo reclamó). Si la generación falla lo marca FALLIDO y
+    relanza la excepción.
+
+    El archivo se escribe entre dos lecturas de version_datos() iguales, de modo
+    que corresponde a esa versión; si no es la de la solicitud, el trabajo se
+    completa con version_datos y clave de la versión exportada.
+    """
+    consulta = CalificacionQuery(trabajo.filtros)
+
+    try:
+        with tempfile.TemporaryFile() as temporal:
+            version = version_datos()
+            for _ in range(MAX_GENERACIONES):
+                exportadas = _escribir_archivo(trabajo, consulta, temporal)
+                actual = version_datos()
+                if actual == version:
+                    break
+                logger.warning(f"Data changed while exporting, regenerating - Trabajo: {trabajo.id}")
+                version = actual
+            else:
+                raise RuntimeError(
+                    f"Los datos cambiaron durante las {MAX_GENERACIONES} generaciones del archivo; "
+                    f"vuelva a solicitar la exportación."
+                )
+            temporal.seek(0)
+            nombre = f"calificaciones_{trabajo.clave[:16]}.{EXTENSIONES[trabajo.formato]}"
+            trabajo.archivo.save(nombre, File(temporal), save=False)
+    except TrabajoPerdido as e:
+        logger.warning(f"Export job lost, stopping - {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Export job failed - Trabajo: {trabajo.id}, Error: {str(e)}", exc_info=True)
+        TrabajoExportacion.objects.filter(pk=trabajo.pk, worker=trabajo.worker).update(
+            estado="FALLIDO", fecha_fin=timezone.now(), error=str(e)
+        )
+        raise
+
+    ahora = timezone.now()
+    tamano = trabajo.archivo.size
+    campos = dict(
+        estado="COMPLETADO", archivo=trabajo.archivo.name, tamano=tamano, filas_exportadas=exportadas,
+        fecha_fin=ahora, ultimo_latido=ahora, ultimo_acceso=ahora, version_datos=version,
+    )
+    if version != trabajo.version_datos:
+        # Los datos cambiaron desde la solicitud: la clave debe ser la de la versión exportada
+        campos["clave"] = clave_exportacion(consulta, trabajo.formato, version)
+    completar = TrabajoExportacion.objects.filter(pk=trabajo.pk, worker=trabajo.worker, estado="EN_CURSO")
+    try:
+        with transaction.atomic():
+            actualizados = completar.update(**campos)
+    except IntegrityError:
+        # Otro trabajo ya tiene la clave de esa versión: este archivo solo se
+        # entrega a quien espera este trabajo (clave propia que nadie solicita)
+        campos["clave"] = clave_exportacion(consulta, trabajo.formato, f"{version}|{trabajo.pk}")
+        actualizados = completar.update(**campos)
+    if not actualizados:
+        # Reclamado por otro worker mientras se escribía: su archivo prevalece
+        trabajo.archivo.delete(save=False)
+        logger.warning(f"Export job lost, discarding file - Trabajo: {trabajo.id}")
+        return None
+
+    trabajo.refresh_from_db()
+    logger.info(
+        f"Export completed - Trabajo: {trabajo.id}, Format: {trabajo.formato}, "
+        f"Records: {exportadas}, Size: {tamano} bytes"
+    )
+    liberar_espacio()
+    return trabajo
+
+
+def liberar_espacio(max_bytes=None):
+    """
+    Elimina los archivos de exportación menos usados recientemente hasta que
+    el total quede dentro de max_bytes (default: EXPORTACION_CACHE_MAX_MB). El
+    más reciente se conserva aunque supere el presupuesto por sí solo.
+    Retorna la cantidad de archivos eliminados.
+    """
+    if max_bytes is None:
+        max_bytes = settings.EXPORTACION_CACHE_MAX_MB * 1024 * 1024
+
+    completados = TrabajoExportacion.objects.filter(estado="COMPLETADO").order_by(
+        F("ultimo_acceso").desc(nulls_last=True), "-id"
+    ).values_list("pk", "archivo", "tamano")
+
+    total = 0
+    descartados = []
+    for posicion, (pk, nombre, tamano) in enumerate(completados.iterator()):
+        total += tamano
+        if posicion and total > max_bytes:
+            descartados.append((pk, nombre))
+
+    if not descartados:
+        return 0
+
+    almacenamiento = TrabajoExportacion._meta.get_field("archivo").storage
+    for pk, nombre in descartados:
+        # Solo se elimina el archivo si el registro sigue COMPLETADO (otro worker pudo regenerarlo)
+        if TrabajoExportacion.objects.filter(pk=pk, estado="COMPLETADO", archivo=nombre).delete()[0] and nombre:
+            almacenamiento.delete(nombre)
+    logger.info(f"Export cache evicted {len(descartados)} files (budget: {max_bytes} bytes)")
+    return len(descartados)
@@ -0,0 +1,83 @@
+"""
+GET condicional (ETag / Last-Modified) para vistas de solo lectura
+
+Las vistas calculan un validador barato (consultas agregadas MAX/COUNT, sin
+leer ni renderizar las filas) y responden 304 Not Modified si el cliente ya
+tiene esa versión:
+
+    etag, modificacion = validadores(request, *partes, ultima_modificacion=...)
+    no_modificada = respuesta_condicional(request, etag, modificacion)
+    if no_modificada:
+        return no_modificada
+    ...
+    return agregar_validadores(response, etag, modificacion)
+
+- Las páginas HTML son personales (usuario, rol, token CSRF del formulario de
+  cierre de sesión): su ETag incluye esa identidad y se marcan Cache-Control
+  private, no-cache (el navegador siempre revalida antes de reutilizar).
+- Con mensajes pendientes (messages framework) no se emiten validadores: la
+  página debe renderizarse para mostrarlos.
+- Django evalúa If-None-Match antes que If-Modified-Since. Last-Modified solo
+  se emite cuando la fecha es exacta (ultima_modificacion, p. ej. el archivo
+  de una exportación). El listado y el dashboard usan solo ETag: el máximo de
+  fecha_modificacion no cambia al eliminar filas ni cuando una fila sale del
+  conjunto filtrado, y revertir una carga puede incluso bajarlo, por lo que un
+  cliente que solo envía If-Modified-Since recibiría un 304 obsoleto.
+"""
+
+import hashlib
+
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def _identidad(request):
+    """Partes de la página que dependen del usuario (navbar, menús por rol, token CSRF)."""
+    get_token(request)  # Secreto CSRF de la página (se crea si el cliente aún no tiene cookie)
+    usuario = request.user
+    try:
+        rol = usuario.perfilusuario.rol_id
+    except Exception:
+        rol = None
+    return [usuario.pk, usuario.username, usuario.is_superuser, usuario.is_staff, rol, request.META.get("CSRF_COOKIE", "")]
+
+
+def validadores(request, *partes, ultima_modificacion=None, personal=True, debil=True):
+    """
+    Retorna (etag, ultima_modificacion) para la respuesta, o (None, None) si
+    hay mensajes pendientes. partes: valores que identifican el contenido
+    (ruta, estado de los datos); personal=True agrega la identidad del usuario.
+    debil=True: W/ (mismo contenido semántico, no los mismos bytes).
+    """
+    if len(messages.get_messages(request)):
+        return None, None
+    contenido = [*partes, *(_identidad(request) if personal else [])]
+    resumen = hashlib.sha256("|".join(map(str, contenido)).encode("utf-8")).hexdigest()[:32]
+    return f'{"W/" if debil else ""}"{resumen}"', ultima_modificacion
+
+
+def respuesta_condicional(request, etag, ultima_modificacion):
+    """304 (o 412) si el cliente ya tiene la versión vigente; None si hay que generar la respuesta."""
+    if etag is None:
+        return None
+    respuesta = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(ultima_modificacion.timestamp()) if ultima_modificacion else None,
+    )
+    if respuesta is not None:
+        agregar_validadores(respuesta, etag, ultima_modificacion)
+    return respuesta
+
+
+def agregar_validadores(response, etag, ultima_modificacion):
+    """Agrega ETag, Last-Modified y Cache-Control private, no-cache a la respuesta."""
+    if etag is None:
+        return response
+    response.headers["ETag"] = etag
+    if ultima_modificacion:
+        response.headers["Last-Modified"] = http_date(ultima_modificacion.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
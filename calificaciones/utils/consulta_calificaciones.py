@@ -0,0 +1,180 @@
+"""
+Consulta de calificaciones desde parámetros GET
+
+CalificacionQuery concentra los filtros que comparten listar_calificaciones,
+exportar_excel y exportar_csv (mercado, tipo_sociedad, ejercicio, código o
+nombre de instrumento, número de DJ y rango de fechas del informe):
+
+- normaliza los parámetros una vez (valores inválidos se ignoran con un
+  warning en lugar de romper la consulta),
+- arma el queryset filtrado de calificaciones activas,
+- proyecta solo las columnas de cada consumidor: only() para el listado
+  paginado, values_list() para las exportaciones,
+- entrega una clave de cache estable para el conjunto de filtros (mismos
+  filtros en otro orden, con otras mayúsculas o espacios: misma clave),
+- calcula con una sola consulta agregada el estado de las filas filtradas
+  (validador de GET condicional del listado).
+"""
+
+import hashlib
+import json
+import logging
+from urllib.parse import urlencode
+
+from django.db.models import Count, Max, Q
+from django.utils.dateparse import parse_date
+
+from ..models import CalificacionTributaria
+
+logger = logging.getLogger(__name__)
+
+# Parámetros GET reconocidos, en el orden en que se aplican
+FILTROS = [
+    'mercado',
+    'tipo_sociedad',
+    'ejercicio',
+    'codigo_instrumento',
+    'fecha_desde',
+    'fecha_hasta',
+    'numero_dj',
+]
+
+# Columnas que usa la tabla de listar.html (el resto de la fila queda diferida)
+CAMPOS_LISTADO = (
+    ['id', 'ejercicio', 'instrumento__codigo_instrumento', 'fecha_informe', 'secuencia',
+     'tipo_sociedad', 'fuente_origen', 'mercado']
+    + [f'factor_{i}' for i in range(8, 38)]
+)
+
+ORDEN = '-fecha_creacion'
+
+PREFIJO_CLAVE_CACHE = 'calificaciones'
+
+
+class CalificacionQuery:
+    """
+    Filtros de calificaciones normalizados desde un QueryDict (request.GET).
+
+    filtros: valores tal como llegaron (sin espacios), para repoblar el formulario.
+    activos: {filtro: valor normalizado} de los filtros aplicados.
+    """
+
+    def __init__(self, parametros):
+        self.filtros = {nombre: parametros.get(nombre, '').strip() for nombre in FILTROS}
+        self.activos = {}
+        for nombre, valor in self.filtros.items():
+            if not valor:
+                continue
+            normalizado = getattr(self, f'_normalizar_{nombre}', str.strip)(valor)
+            if normalizado is None:
+                logger.warning(f"Invalid {nombre} filter value: {valor}")
+                continue
+            self.activos[nombre] = normalizado
+
+    @classmethod
+    def desde_request(cls, request):
+        return cls(request.GET)
+
+    # ------------------------------------------------------------------
+    # Normalización (None = valor inválido, el filtro se ignora)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _normalizar_mercado(valor):
+        return valor.upper()  # Comparación iexact
+
+    @staticmethod
+    def _normalizar_tipo_sociedad(valor):
+        return valor.upper()  # Comparación iexact
+
+    @staticmethod
+    def _normalizar_ejercicio(valor):
+        try:
+            return int(valor)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _normalizar_codigo_instrumento(valor):
+        return valor.casefold()  # Búsqueda icontains
+
+    @staticmethod
+    def _normalizar_numero_dj(valor):
+        return valor.casefold()  # Búsqueda icontains
+
+    @staticmethod
+    def _normalizar_fecha(valor):
+        try:
+            return parse_date(valor)
+        except ValueError:
+            return None
+
+    _normalizar_fecha_desde = _normalizar_fecha
+    _normalizar_fecha_hasta = _normalizar_fecha
+
+    # ------------------------------------------------------------------
+    # Querysets
+    # ------------------------------------------------------------------
+
+    def queryset(self):
+        """Calificaciones activas con los filtros aplicados, más recientes primero."""
+        return self._filtrar(CalificacionTributaria.objects.filter(activo=True)).order_by(ORDEN)
+
+    def _filtrar(self, calificaciones):
+        activos = self.activos
+
+        if 'mercado' in activos:
+            calificaciones = calificaciones.filter(mercado__iexact=activos['mercado'])
+        if 'tipo_sociedad' in activos:
+            calificaciones = calificaciones.filter(tipo_sociedad__iexact=activos['tipo_sociedad'])
+        if 'ejercicio' in activos:
+            calificaciones = calificaciones.filter(ejercicio=activos['ejercicio'])
+        if 'codigo_instrumento' in activos:
+            calificaciones = calificaciones.filter(
+                Q(instrumento__codigo_instrumento__icontains=activos['codigo_instrumento'])
+                | Q(instrumento__nombre_instrumento__icontains=activos['codigo_instrumento'])
+            )
+        if 'fecha_desde' in activos:
+            calificaciones = calificaciones.filter(fecha_informe__gte=activos['fecha_desde'])
+        if 'fecha_hasta' in activos:
+            calificaciones = calificaciones.filter(fecha_informe__lte=activos['fecha_hasta'])
+        if 'numero_dj' in activos:
+            calificaciones = calificaciones.filter(numero_dj__icontains=activos['numero_dj'])
+        return calificaciones
+
+    def para_listado(self):
+        """Queryset del listado paginado: una consulta con el instrumento y solo CAMPOS_LISTADO."""
+        return self.queryset().select_related('instrumento').only(*CAMPOS_LISTADO)
+
+    def para_exportacion(self, campos):
+        """Tuplas values_list con las columnas de una exportación (sin instancias del modelo)."""
+        return self.queryset().values_list(*campos)
+
+    def validador(self):
+        """
+        Estado de las filas filtradas en una consulta agregada: {activas,
+        modificacion, instrumentos}. Incluye las eliminadas lógicamente (su
+        fecha_modificacion avanza al eliminarlas) y la última modificación de
+        sus instrumentos (código y nombre se muestran en el listado).
+        """
+        return self._filtrar(CalificacionTributaria.objects.all()).aggregate(
+            activas=Count('id', filter=Q(activo=True)),
+            modificacion=Max('fecha_modificacion'),
+            instrumentos=Max('instrumento__fecha_modificacion'),
+        )
+
+    # ------------------------------------------------------------------
+    # Identidad del conjunto de filtros
+    # ------------------------------------------------------------------
+
+    def querystring(self):
+        """Parámetros GET de los filtros aplicados (enlaces de exportación del listado)."""
+        return urlencode({nombre: self.filtros[nombre] for nombre in FILTROS if nombre in self.activos})
+
+    def clave_cache(self):
+        """Clave estable para el conjunto de filtros normalizados (apta para memcached)."""
+        contenido = json.dumps(self.activos, sort_keys=True, default=str)
+        return f"{PREFIJO_CLAVE_CACHE}:{hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]}"
+
+    def __repr__(self):
+        return f"CalificacionQuery({self.activos!r})"
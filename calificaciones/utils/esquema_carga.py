@@ -0,0 +1,167 @@
+"""
+Esquema de columnas de un archivo de carga masiva
+
+EsquemaCarga se construye una vez por archivo a partir de su fila de headers:
+resuelve cada header a un campo del modelo (nombre canónico, nombre de la
+hoja "Homologación columnas" del HDU o encabezado de la exportación Excel) y
+precompila, por índice de columna, el convertidor de cada campo. Con él una
+fila cruda (lista / tupla de celdas) se convierte en una tupla tipada sin
+diccionarios por fila ni claves factor_N armadas en cada fila.
+
+Las conversiones son las del proceso original: mismo valor por defecto si
+falta la columna y misma excepción ante un valor inválido, evaluando los
+campos en el mismo orden (el primer error de la fila es el que se informa).
+"""
+
+import re
+import unicodedata
+from decimal import Decimal
+from functools import lru_cache
+
+from .calculadora_factores import CalculadoraFactores
+from .validador_factores import CAMPOS_FACTORES
+
+CERO = Decimal('0')
+
+
+def _decimal_o_none(valor):
+    return Decimal(str(valor)) if valor else None
+
+
+def _decimal_o_cero(valor):
+    return Decimal(str(valor)) if valor else CERO
+
+
+def _entero_o_cero(valor):
+    return int(valor) if valor else 0
+
+
+def _factor(valor):
+    if not valor:
+        return CERO
+    try:
+        return Decimal(str(valor))
+    except (ValueError, TypeError):
+        return CERO
+
+
+def _crudo(valor):
+    return valor
+
+
+# (campo, convertidor, valor si el archivo no trae la columna), en orden de evaluación
+CONVERSIONES = [
+    ('monto', _decimal_o_none, None),
+    ('factor', _decimal_o_none, None),
+    ('metodo_ingreso', _crudo, 'MONTO'),
+    ('numero_dj', _crudo, ''),
+    ('observaciones', _crudo, ''),
+    ('secuencia', _entero_o_cero, 0),
+    ('numero_dividendo', _entero_o_cero, 0),
+    ('tipo_sociedad', _crudo, None),
+    ('valor_historico', _decimal_o_cero, CERO),
+    ('mercado', _crudo, None),
+    ('ejercicio', _entero_o_cero, 0),
+] + [(campo, _factor, CERO) for campo in CAMPOS_FACTORES]
+
+# Orden de la tupla de EsquemaCarga.valores()
+CAMPOS_VALORES = [campo for campo, _, _ in CONVERSIONES]
+
+# Columnas que identifican la fila (instrumento, clave y prioridad)
+CAMPOS_IDENTIFICACION = ['codigo_instrumento', 'nombre_instrumento', 'tipo_instrumento', 'fecha_informe', 'origen']
+
+CAMPOS_CONOCIDOS = set(CAMPOS_IDENTIFICACION) | set(CAMPOS_VALORES)
+
+# Encabezados de la exportación Excel (exportar_excel) que no coinciden con el
+# nombre del campo una vez normalizados: un archivo exportado se puede volver a cargar
+ALIAS_EXPORTACION = {
+    'n_dj': 'numero_dj',
+    'origen_tipo_soc': 'tipo_sociedad',
+}
+
+
+def normalizar_header(header):
+    """'N° DJ' -> 'n_dj', 'Código Instrumento' -> 'codigo_instrumento'."""
+    texto = unicodedata.normalize('NFKD', str(header or '')).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+
+
+def _alias_hdu():
+    # Nombres de la hoja "Homologación columnas" del HDU (ej: factor_8)
+    return {
+        normalizar_header(nombre): campo
+        for campo, nombre in CalculadoraFactores.obtener_nombres_factores().items()
+    }
+
+
+ALIAS_COLUMNAS = {**_alias_hdu(), **ALIAS_EXPORTACION}
+
+
+def campo_de_header(header):
+    """Campo del modelo para un header del archivo (None si no se reconoce)."""
+    normalizado = normalizar_header(header)
+    if normalizado in CAMPOS_CONOCIDOS:
+        return normalizado
+    return ALIAS_COLUMNAS.get(normalizado)
+
+
+class EsquemaCarga:
+    """
+    Mapa header -> campo de un archivo y convertidores precompilados por índice.
+    Las filas deben tener al menos una celda por header (los lectores completan
+    las filas cortas con None).
+    """
+
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self.ancho = len(self.headers)
+        self.indices = {}
+        self.ignoradas = []
+        for indice, header in enumerate(self.headers):
+            campo = campo_de_header(header)
+            if campo is None:
+                if header not in (None, ''):
+                    self.ignoradas.append(header)
+                continue
+            # Header repetido: prevalece la última columna, como en dict(zip(headers, fila))
+            self.indices[campo] = indice
+        self._conversiones = tuple(
+            (self.indices.get(campo), convertir, defecto) for campo, convertir, defecto in CONVERSIONES
+        )
+
+    def __reduce__(self):
+        # Los lotes viajan a los procesos del pool: se reconstruye desde los headers
+        return EsquemaCarga, (self.headers,)
+
+    def obtener(self, fila, campo, defecto=None):
+        """Celda del campo o defecto si el archivo no trae la columna."""
+        indice = self.indices.get(campo)
+        return defecto if indice is None else fila[indice]
+
+    def requerido(self, fila, campo):
+        """Celda del campo; KeyError(campo) si el archivo no trae la columna."""
+        indice = self.indices.get(campo)
+        if indice is None:
+            raise KeyError(campo)
+        return fila[indice]
+
+    def valores(self, fila):
+        """Tupla tipada de la fila en el orden de CAMPOS_VALORES."""
+        return tuple([
+            defecto if indice is None else convertir(fila[indice])
+            for indice, convertir, defecto in self._conversiones
+        ])
+
+    def registro(self, fila):
+        """Diccionario campo -> celda de las columnas reconocidas."""
+        return {campo: fila[indice] for campo, indice in self.indices.items()}
+
+
+@lru_cache(maxsize=64)
+def _esquema_de_claves(claves):
+    return EsquemaCarga(claves)
+
+
+def fila_desde_registro(registro):
+    """(EsquemaCarga, fila) para un registro diccionario (un esquema por conjunto de claves)."""
+    return _esquema_de_claves(tuple(registro)), list(registro.values())
@@ -0,0 +1,165 @@
+"""
+Lectores de archivos de carga masiva (Excel / CSV).
+
+leer_filas() entrega el EsquemaCarga del archivo y sus filas crudas (listas
+de celdas), que el motor de ingesta (motor_carga.MotorCargaMasiva) convierte
+sin armar un diccionario por fila.
+
+Las filas se entregan con un generador a medida que se parsean, de modo que
+el motor las consume por lotes y la memoria usada no depende del tamaño del
+archivo. Los CSV (.csv o .csv.gz) se decodifican bloque a bloque sin cargar
+el archivo completo.
+"""
+
+import codecs
+import csv
+import gzip
+import zlib
+
+import openpyxl
+
+from .esquema_carga import EsquemaCarga
+
+# Tamaño de bloque al leer el archivo subido / descomprimir .gz
+TAMANO_BLOQUE = 64 * 1024
+
+
+def _filas_excel(archivo):
+    """(EsquemaCarga, generador de filas crudas) de Excel; filtra filas sin codigo_instrumento."""
+    wb = openpyxl.load_workbook(archivo, read_only=True)
+    filas = wb.active.iter_rows(values_only=True)
+    headers = next(filas, None)
+    if headers is None:
+        wb.close()
+        return EsquemaCarga([]), iter(())
+    esquema = EsquemaCarga(headers)
+
+    def generar():
+        try:
+            indice = esquema.indices.get('codigo_instrumento')
+            if indice is None:
+                return
+            for row in filas:
+                # Filas más cortas que el header (celdas finales vacías): se completan con None
+                if len(row) < esquema.ancho:
+                    row = row + (None,) * (esquema.ancho - len(row))
+                if row[indice]:
+                    yield row
+        finally:
+            # En modo solo lectura el workbook mantiene el archivo abierto
+            wb.close()
+
+    return esquema, generar()
+
+
+def _bloques(archivo, comprimido=False):
+    """Genera bloques de bytes del archivo; descomprime gzip al vuelo si corresponde."""
+    if comprimido:
+        try:
+            with gzip.GzipFile(fileobj=archivo, mode="rb") as gz:
+                yield from iter(lambda: gz.read(TAMANO_BLOQUE), b"")
+        except (OSError, EOFError, zlib.error) as e:
+            raise ValueError(f"Archivo comprimido inválido: {e}") from e
+    elif hasattr(archivo, "chunks"):
+        yield from archivo.chunks(TAMANO_BLOQUE)
+    else:
+        yield from iter(lambda: archivo.read(TAMANO_BLOQUE), b"")
+
+
+def _lineas_utf8(bloques):
+    """
+    Decodifica bloques UTF-8 de forma incremental y genera líneas (con su salto).
+    Un carácter multibyte partido entre dos bloques se completa con el siguiente.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pendiente = ""
+    for bloque in bloques:
+        texto = pendiente + decoder.decode(bloque)
+        *lineas, pendiente = texto.split("\n")
+        for linea in lineas:
+            yield linea + "\n"
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+
+def _filas_csv(archivo, comprimido=False):
+    """
+    (EsquemaCarga, generador de filas crudas) de CSV (UTF-8) con los headers de
+    la primera fila. comprimido=True para .csv.gz (se descomprime al vuelo).
+    """
+    lector = csv.reader(_lineas_utf8(_bloques(archivo, comprimido)))
+    esquema = EsquemaCarga(next(lector, []))
+    relleno = [None] * esquema.ancho
+
+    def generar():
+        for row in lector:
+            if not row:
+                continue  # Línea en blanco
+            if len(row) < esquema.ancho:
+                row += relleno[len(row):]
+            yield row
+
+    return esquema, generar()
+
+
+class ContadorLineas:
+    """
+    Cuenta las filas de datos de un CSV (saltos de línea, sin header) a partir
+    de sus bloques de bytes, para estimar el total mientras se lee el archivo
+    por otro motivo (ej: al guardarlo en el storage).
+    """
+
+    def __init__(self):
+        self.lineas = 0
+        self.ultimo = b"\n"
+
+    def agregar(self, bloque):
+        if bloque:
+            self.lineas += bloque.count(b"\n")
+            self.ultimo = bloque[-1:]
+
+    def filas(self):
+        lineas = self.lineas + (self.ultimo != b"\n")  # Última línea sin salto final
+        return max(lineas - 1, 0)
+
+
+def contar_filas(archivo, nombre):
+    """
+    Estima las filas de datos del archivo (sin header) para reportar progreso.
+    Excel: dimensión declarada de la hoja; CSV / CSV.GZ: saltos de línea.
+    Deja el archivo en la posición inicial. Retorna None si no se puede estimar.
+    """
+    try:
+        if nombre.endswith(".xlsx"):
+            wb = openpyxl.load_workbook(archivo, read_only=True)
+            try:
+                max_row = wb.active.max_row
+            finally:
+                wb.close()
+            return max(max_row - 1, 0) if max_row else None
+        if nombre.endswith((".csv", ".csv.gz")):
+            contador = ContadorLineas()
+            for bloque in _bloques(archivo, comprimido=nombre.endswith(".gz")):
+                contador.agregar(bloque)
+            return contador.filas()
+        return None
+    except Exception:
+        # Archivo corrupto: el error real lo reporta el lector al procesar
+        return None
+    finally:
+        archivo.seek(0)
+
+
+def leer_filas(archivo, nombre):
+    """
+    (EsquemaCarga, generador de filas crudas) según la extensión del archivo.
+    El header se lee al llamar; ValueError si el formato no es soportado.
+    """
+    if nombre.endswith(".xlsx"):
+        return _filas_excel(archivo)
+    if nombre.endswith(".csv"):
+        return _filas_csv(archivo)
+    if nombre.endswith(".csv.gz"):
+        return _filas_csv(archivo, comprimido=True)
+    raise ValueError("Formato de archivo no soportado")
@@ -0,0 +1,137 @@
+"""
+Logging de la ingesta masiva
+
+Registrar cada fila creada o actualizada (un f-string y un logger.info por
+fila) cuesta CPU y volumen de log en archivos grandes. resumir_lote() emite
+una sola línea de resumen por lote con sus contadores y deja el detalle por
+fila:
+- completo en DEBUG,
+- muestreado en INFO (las filas múltiplo de muestreo; 0 = sin muestra).
+Los errores por fila se siguen registrando siempre (mensaje_error_fila).
+
+iniciar_cola_log() envía los logs de calificaciones.utils a través de un
+QueueHandler: el hilo que procesa la carga solo encola el registro y un
+QueueListener lo escribe desde su propio hilo. La activan solo los procesos
+que cargan datos (manage.py procesar_cargas con CARGA_MASIVA_LOG_COLA) y
+detener_cola_log() deja el logger como estaba. Mientras está activa, el
+listener entrega cada registro a los handlers de los loggers ancestros que
+existan al escribirlo (igual que la propagación normal: incluye handlers
+agregados después, y logging.lastResort si no hay ninguno); la configuración
+de logging (root incluido) no se modifica.
+"""
+
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Logger de la ingesta (motor, cola de cargas, changesets)
+LOGGER_CARGA = 'calificaciones.utils'
+
+# Filas exitosas registradas en INFO: una de cada MUESTREO_FILAS
+MUESTREO_FILAS = 100
+
+# Detalle por fila según el evento del motor (argumentos: fila, instrumento, origen)
+MENSAJES_FILA = {
+    'CREADO': "Row %s created successfully - Instrumento: %s, Origen: %s",
+    'ACTUALIZADO': "Row %s updated successfully - Instrumento: %s, Origen: %s",
+    'SIN_CAMBIOS': "Row %s unchanged, skipped - Instrumento: %s, Origen: %s",
+    'OMITIDO': "Row %s skipped due to priority rule: CORREDORA > BOLSA - Instrumento: %s, Origen: %s",
+}
+
+_listeners = {}
+
+
+def resumir_lote(logger, desde, hasta, resultado, muestreo=MUESTREO_FILAS):
+    """
+    Emite el resumen de un lote confirmado (filas desde-hasta) y el detalle
+    por fila de resultado.eventos según el nivel del logger.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(
+        "Bulk upload rows %s-%s: %s created, %s updated, %s unchanged, %s skipped, %s collapsed, %s failed",
+        desde, hasta, resultado.creados, resultado.actualizados, resultado.sin_cambios,
+        resultado.omitidos, resultado.colapsados, resultado.fallidos,
+    )
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for accion, i, codigo, origen in resultado.eventos:
+            logger.debug(MENSAJES_FILA[accion], i, codigo, origen)
+    elif muestreo:
+        for accion, i, codigo, origen in resultado.eventos:
+            if i % muestreo == 0:
+                logger.info("Sampled " + MENSAJES_FILA[accion], i, codigo, origen)
+
+
+class _Propagar(logging.Handler):
+    """Handler del QueueListener: entrega el registro a los ancestros del logger, como la propagación."""
+
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+
+    def handle(self, record):
+        if self.logger.parent is not None:
+            self.logger.parent.callHandlers(record)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
+
+
+def iniciar_cola_log(nombre=LOGGER_CARGA):
+    """
+    Agrega un QueueHandler al logger (en lugar de propagar en el hilo que
+    escribe) y arranca un QueueListener que entrega los registros a los
+    ancestros del logger. Los handlers propios del logger no se tocan.
+    Idempotente por logger. Retorna el QueueListener.
+    """
+    if nombre in _listeners:
+        return _listeners[nombre][0]
+
+    logger = logging.getLogger(nombre)
+    cola = queue.SimpleQueue()
+    listener = QueueListener(cola, _Propagar(logger))
+    listener.start()
+    if not _listeners:
+        atexit.register(detener_colas_log)  # Vacía las colas antes de terminar el proceso
+
+    handler = QueueHandler(cola)
+    _listeners[nombre] = (listener, handler, logger.propagate)
+    logger.addHandler(handler)
+    logger.propagate = False
+    return listener
+
+
+def detener_cola_log(nombre=LOGGER_CARGA):
+    """
+    Quita el QueueHandler y restaura la propagación del logger; detiene el
+    QueueListener tras escribir los registros pendientes.
+    """
+    estado = _listeners.pop(nombre, None)
+    if estado is None:
+        return
+    listener, handler, propagate = estado
+    logger = logging.getLogger(nombre)
+    logger.removeHandler(handler)
+    logger.propagate = propagate
+    listener.stop()
+
+
+def detener_colas_log():
+    for nombre in list(_listeners):
+        detener_cola_log(nombre)
+
+
+def descartar_colas_heredadas():
+    """
+    En un proceso hijo creado por fork (pool de procesos del motor): quita los
+    QueueHandler heredados, cuyo listener solo existe en el proceso padre, y
+    restaura la propagación.
+    """
+    for nombre, (_, handler, propagate) in list(_listeners.items()):
+        logger = logging.getLogger(nombre)
+        logger.removeHandler(handler)
+        logger.propagate = propagate
+    _listeners.clear()
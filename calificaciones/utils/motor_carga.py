@@ -0,0 +1,1116 @@
+"""
+Motor de Ingesta Masiva de Calificaciones Tributarias
+
+Procesa los registros de una carga masiva por lotes en lugar de fila a fila:
+- Convierte cada fila cruda con el EsquemaCarga del archivo (convertidores
+  precompilados por columna, ver esquema_carga); los registros diccionario
+  se convierten con un esquema por conjunto de claves.
+- Resuelve todos los códigos de instrumento del lote con una sola consulta
+  y crea los faltantes con bulk_create (también los de filas sin código,
+  con códigos generados para todo el lote).
+- Resuelve todas las claves (instrumento, fecha_informe, numero_dj) del lote
+  con una sola consulta.
+- Aplica la regla de prioridad CORREDORA > BOLSA en memoria.
+- Omite las filas cuya huella de contenido coincide con la almacenada
+  (re-cargas de archivos corregidos no reescriben filas idénticas).
+- Con filas_colapsadas() (pre-pasada sobre el archivo completo) las filas
+  que repiten una clave solo escriben la fila que prevalece; las demás se
+  informan como colapsadas sin llegar a la base de datos (no cuentan como
+  exitosas ni como fallidas).
+- Valida REGLA A / REGLA B de todo el lote con validador_factores (NumPy).
+- Crea las filas nuevas con bulk_create y actualiza las existentes con un
+  solo UPDATE ... FROM sobre la tabla de staging, limitado a las columnas
+  que cambiaron en el bloque; con staging=True carga el bloque completo en
+  la tabla temporal y lo fusiona con INSERT ... ON CONFLICT (ver staging_carga).
+
+Con simulacion=True (dry run) se ejecuta el mismo flujo sobre una
+instantánea de solo lectura sin escribir nada: ni calificaciones ni
+instrumentos nuevos (estos se representan en memoria).
+
+Los lotes se confirman en transacciones de filas_por_commit filas; al final
+de cada una se invoca checkpoint(fila, parcial) dentro de la misma
+transacción, de modo que el avance guardado nunca queda por delante de los
+datos confirmados. procesar(desde_fila=N) reanuda tras la fila N.
+Cada transacción bloquea al comenzar las claves de todos sus lotes (ver
+bloqueo_carga): cargas simultáneas con claves en común se serializan por
+clave y las demás avanzan en paralelo.
+parcial.cambios es el changeset inverso de la transacción (valores previos
+de las filas actualizadas, ids creados, huella y fecha de modificación que
+dejó la escritura e instrumentos creados) para poder revertir la carga, junto
+con el diff por campo de las filas actualizadas (comparar_campos: los
+decimales escalados a enteros y comparados como matrices int64 por bloque).
+
+El parseo y la validación de cada lote (preparar_lote) no usan la base de
+datos, por lo que pueden repartirse en varios procesos (procesos > 1); la
+escritura se hace siempre en este proceso y en orden de archivo.
+
+Cada lote confirmado emite una línea de resumen en el log; el detalle por
+fila es muestreado en INFO y completo en DEBUG (ver log_carga).
+
+Los contadores (creados, actualizados, omitidos, fallidos) y los mensajes de
+error por fila son idénticos a los del procesamiento fila a fila original.
+Si la escritura de un lote falla en la base de datos, el lote se revierte y
+se reprocesa fila a fila para atribuir el error a la fila correcta.
+"""
+
+import logging
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from copy import copy
+from itertools import islice
+
+import numpy as np
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from ..models import CalificacionTributaria, InstrumentoFinanciero
+from . import staging_carga
+from .bloqueo_carga import (
+    ESPACIO_CALIFICACION,
+    ESPACIO_INSTRUMENTO,
+    bloquear_claves,
+    bloqueo_por_clave,
+    clave_bloqueo,
+    transaccion_carga,
+)
+from .codigos_instrumento import codigo_base, generar_codigos_unicos
+from .esquema_carga import CAMPOS_VALORES, fila_desde_registro
+from .log_carga import MUESTREO_FILAS, descartar_colas_heredadas, resumir_lote
+from .validador_factores import CAMPOS_FACTORES, evaluar_factores_lote, regla_incumplida
+
+logger = logging.getLogger(__name__)
+
+# Filas por lote (una consulta de instrumentos + una de calificaciones por lote)
+TAMANO_LOTE = 1000
+
+# Filas por transacción confirmada (se redondea a lotes completos)
+FILAS_POR_COMMIT = 5000
+
+ORIGENES_VALIDOS = ['BOLSA', 'CORREDORA', 'MANUAL']
+
+# Campos que una fila de carga masiva sobrescribe en un registro existente
+CAMPOS_ACTUALIZABLES = [
+    'usuario_creador',
+    'monto',
+    'factor',
+    'metodo_ingreso',
+    'numero_dj',
+    'observaciones',
+    'origen',
+    'fuente_origen',
+    'secuencia',
+    'numero_dividendo',
+    'tipo_sociedad',
+    'valor_historico',
+    'mercado',
+    'ejercicio',
+] + [f'factor_{i}' for i in range(8, 38)] + ['huella', 'fecha_modificacion']
+
+# Campos guardados en el changeset inverso de una fila actualizada (además del id)
+CAMPOS_CAMBIO = ['instrumento', 'fecha_informe'] + CAMPOS_ACTUALIZABLES
+
+# Campos comparados en el diff de una fila actualizada (sin metadatos de la escritura)
+CAMPOS_DIFERENCIA = [
+    campo for campo in CAMPOS_ACTUALIZABLES
+    if campo not in ('usuario_creador', 'huella', 'fecha_modificacion')
+]
+
+# Generación de la tabla de staging con las filas actualizadas de un bloque (ver _escribir)
+GENERACION_ACTUALIZAR = 1
+
+# Las FK se resuelven por lote; validarlas en full_clean costaría una consulta por fila
+CAMPOS_EXCLUIDOS_VALIDACION = ['instrumento', 'usuario_creador']
+
+# Error de una fila con los datos que se guardan en CargaMasivaError
+ErrorFila = namedtuple('ErrorFila', ['fila', 'codigo', 'columna', 'mensaje'])
+
+# Cambio de un campo en una fila actualizada (calificacion: id de la calificación)
+Diferencia = namedtuple('Diferencia', ['fila', 'calificacion', 'campo', 'anterior', 'nuevo'])
+
+
+class CambiosCarga:
+    """
+    Changeset inverso de una carga (o de una transacción de ella):
+    previos: tuplas (id, *CAMPOS_CAMBIO) con los valores anteriores de cada
+    fila actualizada; creados: ids de las filas creadas.
+    posteriores: tuplas (id, huella, fecha_modificacion) del estado en que la
+    escritura dejó cada fila creada o actualizada (la reversión omite las
+    filas editadas después); instrumentos: ids de los instrumentos creados.
+    diferencias: Diferencia de cada campo modificado; conteo_campos: filas
+    modificadas por campo.
+    """
+
+    def __init__(self):
+        self.previos = []
+        self.creados = []
+        self.posteriores = []
+        self.instrumentos = []
+        self.diferencias = []
+        self.conteo_campos = Counter()
+
+    def __bool__(self):
+        return bool(self.previos or self.creados or self.instrumentos)
+
+    def registrar_previo(self, calificacion):
+        """Guarda los valores de una calificación antes de sobrescribirla."""
+        self.previos.append(
+            (calificacion.pk,) + tuple(getattr(calificacion, attname) for attname in _attnames_cambio())
+        )
+
+    def registrar_posterior(self, pk, huella, fecha_modificacion):
+        """Guarda el estado en que la carga dejó una fila creada o actualizada."""
+        self.posteriores.append((pk, huella, fecha_modificacion))
+
+    def registrar_diferencias(self, filas, anteriores, nuevos):
+        """
+        Agrega el diff de un bloque de filas actualizadas (ver comparar_campos).
+        Retorna {campo: filas modificadas} del bloque.
+        """
+        conteo, diferencias = comparar_campos(filas, anteriores, nuevos)
+        self.conteo_campos.update(conteo)
+        self.diferencias.extend(diferencias)
+        return conteo
+
+    def acumular(self, otro):
+        self.previos.extend(otro.previos)
+        self.creados.extend(otro.creados)
+        self.posteriores.extend(otro.posteriores)
+        self.instrumentos.extend(otro.instrumentos)
+        self.diferencias.extend(otro.diferencias)
+        self.conteo_campos.update(otro.conteo_campos)
+
+
+def _attnames_cambio():
+    return [CalificacionTributaria._meta.get_field(campo).attname for campo in CAMPOS_CAMBIO]
+
+
+# Decimal nulo en las matrices escaladas de comparar_campos (fuera del rango de
+# los DecimalField comparados: max_digits <= 18)
+NULO_ESCALADO = np.iinfo(np.int64).min
+
+
+def _escalar(valor, escala):
+    """Decimal (o el default entero 0) multiplicado por escala como int (None -> NULO_ESCALADO)."""
+    return NULO_ESCALADO if valor is None else int(valor * escala)
+
+
+def comparar_campos(filas, anteriores, nuevos):
+    """
+    Compara campo a campo (CAMPOS_DIFERENCIA) las calificaciones anteriores y
+    nuevas de un bloque. Los campos decimales (factores, monto, valor
+    histórico) se escalan a enteros (x 10^decimal_places) y se comparan como
+    matrices int64 filas x campos con una sola operación NumPy; el resto de
+    los campos se compara columna a columna.
+    Retorna ({campo: filas modificadas}, [Diferencia, ...] en orden de fila).
+    """
+    if not filas:
+        return {}, []
+    campos = [CalificacionTributaria._meta.get_field(campo) for campo in CAMPOS_DIFERENCIA]
+    decimales = [
+        (columna, campo.attname, 10 ** campo.decimal_places)
+        for columna, campo in enumerate(campos)
+        if campo.get_internal_type() == 'DecimalField'
+    ]
+    modificados = np.zeros((len(filas), len(campos)), dtype=bool)
+
+    # Decimal escalado: 0.1 y 0.10000000 (leído de la BD) son el mismo entero
+    previos = np.array(
+        [[_escalar(getattr(obj, attname), escala) for _, attname, escala in decimales] for obj in anteriores],
+        dtype=np.int64,
+    )
+    actuales = np.array(
+        [[_escalar(getattr(obj, attname), escala) for _, attname, escala in decimales] for obj in nuevos],
+        dtype=np.int64,
+    )
+    modificados[:, [columna for columna, _, _ in decimales]] = previos != actuales
+
+    columnas_decimales = {columna for columna, _, _ in decimales}
+    for columna, campo in enumerate(campos):
+        if columna not in columnas_decimales:
+            modificados[:, columna] = [
+                getattr(anterior, campo.attname) != getattr(nuevo, campo.attname)
+                for anterior, nuevo in zip(anteriores, nuevos)
+            ]
+
+    conteo = {
+        CAMPOS_DIFERENCIA[columna]: int(total)
+        for columna, total in enumerate(modificados.sum(axis=0))
+        if total
+    }
+    diferencias = [
+        Diferencia(
+            filas[fila],
+            anteriores[fila].pk,
+            CAMPOS_DIFERENCIA[columna],
+            getattr(anteriores[fila], campos[columna].attname),
+            getattr(nuevos[fila], campos[columna].attname),
+        )
+        for fila, columna in zip(*np.nonzero(modificados))
+    ]
+    return conteo, diferencias
+
+
+class ResultadoCarga:
+    """
+    Contadores y errores acumulados de una carga masiva.
+    errores: mensajes en orden de fila; errores_fila: los mismos como ErrorFila.
+    colapsados: filas reemplazadas por otra fila del archivo con la misma clave
+    (no se escriben: no cuentan en exitosos).
+    """
+
+    def __init__(self):
+        self.procesados = 0
+        self.creados = 0
+        self.actualizados = 0
+        self.omitidos = 0
+        self.sin_cambios = 0
+        self.colapsados = 0
+        self.fallidos = 0
+        self.errores = []
+        self.errores_fila = []
+        self.cambios = CambiosCarga()
+
+    @property
+    def exitosos(self):
+        return self.creados + self.actualizados + self.sin_cambios
+
+    def acumular(self, otro):
+        """Suma los contadores y errores de otro resultado (ej: un lote)."""
+        self.procesados += otro.procesados
+        self.creados += otro.creados
+        self.actualizados += otro.actualizados
+        self.omitidos += otro.omitidos
+        self.sin_cambios += otro.sin_cambios
+        self.colapsados += otro.colapsados
+        self.fallidos += otro.fallidos
+        self.errores.extend(otro.errores)
+        self.errores_fila.extend(otro.errores_fila)
+        self.cambios.acumular(otro.cambios)
+
+
+class _ResultadoLote(ResultadoCarga):
+    """Resultado de un lote: errores indexados por fila y eventos de log diferidos."""
+
+    def __init__(self):
+        super().__init__()
+        self.eventos = []
+        self.instrumentos_nuevos = {}
+
+    def registrar_error(self, fila, mensaje, codigo='ERROR', columna=''):
+        self.errores_fila.append(ErrorFila(fila, codigo, columna, mensaje))
+
+    def registrar_excepcion(self, fila, error):
+        """Registra la excepción de una fila con su mensaje, código y columna."""
+        self.registrar_error(fila, mensaje_error_fila(fila, error), *clasificar_error_fila(error))
+
+    def cerrar(self):
+        """Ordena los errores por número de fila (mismo orden que el proceso fila a fila)."""
+        self.errores_fila.sort(key=lambda error: error.fila)
+        self.errores = [error.mensaje for error in self.errores_fila]
+
+
+def mensaje_error_fila(fila, error):
+    """
+    Traduce la excepción de una fila a su mensaje (CargaMasivaError.mensaje).
+    Registra el warning/error correspondiente en el log.
+    """
+    if isinstance(error, ValidationError):
+        # Errores de validación del modelo (ej: suma de factores > 1)
+        error_msg = error.message if hasattr(error, 'message') else str(error)
+        logger.warning(f"Bulk upload row {fila} validation error: {error}")
+        return f"Fila {fila}: {error_msg}"
+    if isinstance(error, IntegrityError):
+        error_str = str(error).lower()
+        # Detectar si es un error de duplicado por unique_together
+        if 'unique' in error_str or 'duplicate' in error_str or 'already exists' in error_str:
+            logger.warning(f"Bulk upload row {fila} duplicate record: {error}")
+            return f"Fila {fila}: Error - Este registro ya existe en el sistema (Duplicado)."
+        logger.warning(f"Bulk upload row {fila} integrity error: {error}")
+        return f"Fila {fila}: Error de integridad de datos - {str(error)}"
+    if isinstance(error, KeyError):
+        logger.warning(f"Bulk upload row {fila} missing field: {error}")
+        return f"Fila {fila}: Campo requerido faltante - {str(error)}"
+    if isinstance(error, ValueError):
+        logger.warning(f"Bulk upload row {fila} invalid value: {error}")
+        return f"Fila {fila}: Valor inválido - {str(error)}"
+    logger.error(f"Bulk upload row {fila} unexpected error: {error}", exc_info=error)
+    return f"Fila {fila}: {str(error)}"
+
+
+def clasificar_error_fila(error):
+    """
+    Código (CargaMasivaError.CODIGOS) y columna de la excepción de una fila.
+    La columna queda vacía cuando el error no corresponde a un campo concreto.
+    """
+    if isinstance(error, ValidationError):
+        if hasattr(error, 'error_dict'):
+            campos = [campo for campo in error.error_dict if campo != NON_FIELD_ERRORS]
+            if campos:
+                return 'VALIDACION', campos[0]
+        for mensaje in error.messages:
+            regla = regla_incumplida(mensaje)
+            if regla is not None:
+                return regla
+        return 'VALIDACION', ''
+    if isinstance(error, IntegrityError):
+        error_str = str(error).lower()
+        if 'unique' in error_str or 'duplicate' in error_str or 'already exists' in error_str:
+            return 'DUPLICADO', ''
+        return 'INTEGRIDAD', ''
+    if isinstance(error, KeyError):
+        return 'CAMPO_FALTANTE', str(error.args[0]) if error.args else ''
+    if isinstance(error, ValueError):
+        return 'VALOR_INVALIDO', ''
+    return 'ERROR', ''
+
+
+class _FilaPreparada:
+    """
+    Fila parseada y validada sin acceso a base de datos (ver preparar_lote).
+    Los errores se guardan como excepciones para registrarlos en el mismo
+    punto del flujo que el proceso serial.
+    """
+
+    __slots__ = (
+        'numero', 'registro', 'codigo', 'nombre_instrumento', 'tipo_instrumento', 'error_codigo',
+        'origen', 'fecha_informe', 'fecha', 'dj', 'error_clave', 'valores', 'error_valores',
+        'error_validacion',
+    )
+
+    def __init__(self, numero, registro):
+        self.numero = numero
+        self.registro = registro  # Fila cruda del archivo (None si está colapsada)
+        self.codigo = None
+        self.nombre_instrumento = ''
+        self.tipo_instrumento = 'Otro'
+        self.error_codigo = None
+        self.origen = None
+        self.fecha_informe = None  # Valor original de la celda (mensajes y full_clean)
+        self.fecha = None
+        self.dj = None
+        self.error_clave = None
+        self.valores = None
+        self.error_valores = None
+        self.error_validacion = None
+
+
+def preparar_lote(lote, validar_campos=True):
+    """
+    Parsea y valida un lote de filas [(numero, esquema, fila)] sin consultar la BD:
+    código de instrumento, origen, clave (fecha, DJ), conversión de valores,
+    REGLA A / REGLA B (validador por lotes) y full_clean() de la fila.
+    Con validar_campos=False (simulación) se omite full_clean() y solo se
+    aplican REGLA A / REGLA B.
+
+    Es una función de módulo para poder ejecutarse en un ProcessPoolExecutor;
+    el escritor aplica después prioridad, huella y upsert en orden de archivo.
+    """
+    campo_fecha = CalificacionTributaria._meta.get_field('fecha_informe')
+    campo_dj = CalificacionTributaria._meta.get_field('numero_dj')
+    preparadas = []
+
+    for numero, esquema, cruda in lote:
+        fila = _FilaPreparada(numero, cruda)
+        preparadas.append(fila)
+        if cruda is None:
+            continue  # Fila colapsada (ver filas_colapsadas): no se parsea
+        try:
+            fila.codigo = esquema.requerido(cruda, 'codigo_instrumento')
+        except KeyError as e:
+            fila.error_codigo = e
+            continue
+        fila.nombre_instrumento = esquema.obtener(cruda, 'nombre_instrumento', '')
+        fila.tipo_instrumento = esquema.obtener(cruda, 'tipo_instrumento', 'Otro')
+
+        try:
+            # Determinar origen del archivo actual (por defecto BOLSA)
+            fila.origen = esquema.obtener(cruda, 'origen', 'BOLSA').upper()
+            if fila.origen not in ORIGENES_VALIDOS:
+                fila.origen = 'BOLSA'
+            fila.fecha_informe = esquema.requerido(cruda, 'fecha_informe')
+            fila.fecha = campo_fecha.to_python(fila.fecha_informe)
+            fila.dj = campo_dj.to_python(esquema.obtener(cruda, 'numero_dj', ''))
+        except Exception as e:
+            fila.error_clave = e
+            continue
+
+        try:
+            fila.valores = dict(zip(CAMPOS_VALORES, esquema.valores(cruda)))
+        except Exception as e:
+            fila.error_valores = e
+
+    # REGLA A / REGLA B de todo el lote
+    validables = [fila for fila in preparadas if fila.valores is not None]
+    mensajes_reglas, _ = evaluar_factores_lote(
+        [[fila.valores[campo] for campo in CAMPOS_FACTORES] for fila in validables]
+    )
+
+    if not validar_campos:
+        for fila, mensaje in zip(validables, mensajes_reglas):
+            if mensaje:
+                fila.error_validacion = ValidationError({NON_FIELD_ERRORS: [mensaje]})
+        return preparadas
+
+    # full_clean de la fila: el resultado solo depende de los valores de la fila
+    # (las FK y la unicidad no se validan), igual para una fila nueva o una actualización
+    for fila, mensaje in zip(validables, mensajes_reglas):
+        candidato = CalificacionTributaria(
+            fecha_informe=fila.fecha_informe,
+            origen=fila.origen,
+            fuente_origen='MASIVA',
+            **fila.valores,
+        )
+        candidato.aplicar_calculo_legacy()
+        candidato._mensaje_reglas_factores = mensaje
+        try:
+            candidato.full_clean(exclude=CAMPOS_EXCLUIDOS_VALIDACION, validate_unique=False)
+        except Exception as e:
+            fila.error_validacion = e
+        else:
+            # Valores normalizados por full_clean (to_python), como en el proceso serial
+            fila.valores = {campo: getattr(candidato, campo) for campo in fila.valores}
+
+    return preparadas
+
+
+def filas_colapsadas(registros, esquema=None):
+    """
+    Pre-pasada sobre el archivo completo: agrupa las filas por clave
+    (codigo_instrumento, fecha_informe, numero_dj) y aplica entre ellas la
+    regla de prioridad CORREDORA > BOLSA en orden de archivo. Retorna
+    {fila: fila_que_prevalece} con las filas que no deben escribirse.
+
+    Solo se parsean los campos de la clave y el origen: las filas cuya clave
+    no se puede leer, o sin código (cada una crea su propio instrumento), se
+    procesan normalmente. El resultado final coincide con aplicar las filas
+    una a una (gana la última, salvo Bolsa después de Corredora).
+    esquema: EsquemaCarga de las filas crudas (None: registros diccionario).
+    """
+    campo_codigo = InstrumentoFinanciero._meta.get_field('codigo_instrumento')
+    campo_fecha = CalificacionTributaria._meta.get_field('fecha_informe')
+    campo_dj = CalificacionTributaria._meta.get_field('numero_dj')
+    ganadoras = {}  # clave -> (fila, origen)
+    perdedoras = {}  # clave -> [filas]
+
+    for numero, fila in enumerate(registros, start=1):
+        esquema_fila = esquema
+        if esquema_fila is None:
+            esquema_fila, fila = fila_desde_registro(fila)
+        try:
+            codigo = campo_codigo.to_python(esquema_fila.requerido(fila, 'codigo_instrumento'))
+            fecha = campo_fecha.to_python(esquema_fila.requerido(fila, 'fecha_informe'))
+            dj = campo_dj.to_python(esquema_fila.obtener(fila, 'numero_dj', ''))
+            origen = esquema_fila.obtener(fila, 'origen', 'BOLSA').upper()
+        except Exception:
+            continue
+        if not codigo:
+            continue
+        if origen not in ORIGENES_VALIDOS:
+            origen = 'BOLSA'
+
+        clave = (codigo, fecha, dj)
+        anterior = ganadoras.get(clave)
+        if anterior is None:
+            ganadoras[clave] = (numero, origen)
+            continue
+        if anterior[1] == 'CORREDORA' and origen == 'BOLSA':
+            perdedoras.setdefault(clave, []).append(numero)
+        else:
+            perdedoras.setdefault(clave, []).append(anterior[0])
+            ganadoras[clave] = (numero, origen)
+
+    return {
+        fila: ganadoras[clave][0]
+        for clave, filas in perdedoras.items()
+        for fila in filas
+    }
+
+
+@contextmanager
+def _instantanea_lectura():
+    """
+    Transacción que siempre se revierte; en PostgreSQL además REPEATABLE READ
+    READ ONLY, para que toda la simulación vea una sola instantánea.
+    """
+    conexion = transaction.get_connection()
+    externa = not conexion.in_atomic_block
+    with transaction.atomic():
+        if externa and conexion.vendor == 'postgresql':
+            with conexion.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        yield
+        transaction.set_rollback(True)
+
+
+def _inicializar_proceso():
+    """
+    Inicializa Django en cada proceso del pool (necesario con spawn/forkserver)
+    y descarta la cola de log heredada por fork (su listener está en el padre).
+    """
+    import django
+    django.setup()
+    descartar_colas_heredadas()
+
+
+class MotorCargaMasiva:
+    """
+    Motor de ingesta por lotes para carga masiva.
+
+    Uso:
+        motor = MotorCargaMasiva(usuario=request.user)
+        resultado = motor.procesar(registros)  # registros: iterable de dicts
+
+    Con procesos > 1, el parseo y la validación de cada lote (preparar_lote)
+    se ejecutan en un ProcessPoolExecutor; este proceso sigue siendo el único
+    escritor y aplica los lotes en orden de archivo, por lo que el resultado
+    es idéntico al procesamiento serial.
+
+    Los lotes se agrupan en transacciones de filas_por_commit filas (cada
+    lote es un savepoint dentro de ella); checkpoint(fila, parcial) se invoca
+    antes de confirmar cada transacción para guardar el avance.
+
+    Con simulacion=True los contadores indican lo que haría la carga
+    (creados, actualizados, sin cambios, omitidos, fallidos) sin escribir.
+    La simulación valida parseo, prioridad y REGLA A / REGLA B, pero no el
+    formato de cada campo (full_clean), para responder dentro de la solicitud.
+
+    Con staging=True cada bloque se escribe a través de una tabla temporal
+    (COPY / executemany) y un upsert set-based en lugar de bulk_create y
+    UPDATE ... FROM; contadores y errores son los mismos. La simulación ignora
+    este modo.
+
+    muestreo_log: una de cada muestreo_log filas exitosas se registra en INFO
+    (todas en DEBUG); cada lote emite además una línea de resumen.
+    """
+
+    def __init__(self, usuario, tamano_lote=TAMANO_LOTE, procesos=1, simulacion=False,
+                 filas_por_commit=FILAS_POR_COMMIT, staging=False, muestreo_log=MUESTREO_FILAS):
+        self.usuario = usuario
+        self.tamano_lote = tamano_lote
+        self.lotes_por_commit = max(int(filas_por_commit or 0) // tamano_lote, 1)
+        self.procesos = max(int(procesos or 1), 1)
+        self.simulacion = simulacion
+        self.staging = staging and not simulacion
+        self.muestreo_log = muestreo_log
+        # Cache codigo_instrumento -> instrumento (solo instrumentos ya confirmados en BD)
+        self._instrumentos = {}
+        self._campo_codigo = InstrumentoFinanciero._meta.get_field('codigo_instrumento')
+        self._colapsadas = {}
+
+    def procesar(self, registros, progreso=None, desde_fila=0, checkpoint=None, colapsadas=None, esquema=None):
+        """
+        Procesa un iterable de registros por lotes y retorna un ResultadoCarga.
+        registros: filas crudas del EsquemaCarga esquema (lectores.leer_filas) o,
+        sin esquema, diccionarios header -> valor.
+        progreso(resultado) se invoca tras confirmar cada transacción.
+        checkpoint(fila, parcial) se invoca dentro de cada transacción, antes de
+        confirmarla, con la última fila incluida y el resultado de esa transacción;
+        si lanza una excepción, la transacción se revierte.
+        desde_fila: filas del archivo ya confirmadas en un intento anterior (se omiten).
+        colapsadas: {fila: fila_que_prevalece} de filas_colapsadas(); no se escriben.
+        """
+        self._colapsadas = colapsadas or {}
+        resultado = ResultadoCarga()
+        lotes = self._lotes_preparados(registros, desde_fila, esquema)
+
+        if self.simulacion:
+            with _instantanea_lectura():
+                for preparadas in lotes:
+                    resultado.acumular(self._simular_lote(preparadas))
+            return resultado
+
+        for primero in lotes:
+            grupo = [primero, *islice(lotes, self.lotes_por_commit - 1)]
+            parcial = ResultadoCarga()
+            with transaccion_carga():
+                self._bloquear_claves(grupo)
+                for preparadas in grupo:
+                    parcial.acumular(self._procesar_lote(preparadas))
+                if checkpoint is not None:
+                    checkpoint(preparadas[-1].numero, parcial)
+            # El changeset se entrega en checkpoint; no se retiene para todo el archivo
+            parcial.cambios = CambiosCarga()
+            resultado.acumular(parcial)
+            if progreso is not None:
+                progreso(resultado)
+
+        return resultado
+
+    def _lotes(self, registros, desde_fila=0, esquema=None):
+        """Divide los registros en rangos de filas [(numero, esquema, fila)] de tamano_lote."""
+        filas = islice(enumerate(registros, start=1), desde_fila, None)
+        # Las filas colapsadas viajan sin fila: no se parsean ni validan
+        colapsadas = self._colapsadas
+        if esquema is None:
+            filas = (
+                (i, None, None) if i in colapsadas else (i, *fila_desde_registro(registro))
+                for i, registro in filas
+            )
+        else:
+            filas = ((i, None, None) if i in colapsadas else (i, esquema, fila) for i, fila in filas)
+        while True:
+            lote = list(islice(filas, self.tamano_lote))
+            if not lote:
+                return
+            yield lote
+
+    def _lotes_preparados(self, registros, desde_fila=0, esquema=None):
+        """Genera los lotes preparados en orden de archivo (en paralelo si procesos > 1)."""
+        if self.procesos == 1:
+            for lote in self._lotes(registros, desde_fila, esquema):
+                yield preparar_lote(lote, validar_campos=not self.simulacion)
+            return
+
+        # Como máximo 2 lotes por proceso en vuelo: memoria acotada en archivos grandes
+        with ProcessPoolExecutor(max_workers=self.procesos, initializer=_inicializar_proceso) as pool:
+            pendientes = deque()
+            for lote in self._lotes(registros, desde_fila, esquema):
+                pendientes.append(pool.submit(preparar_lote, lote, not self.simulacion))
+                if len(pendientes) >= self.procesos * 2:
+                    yield pendientes.popleft().result()
+            while pendientes:
+                yield pendientes.popleft().result()
+
+    def _bloquear_claves(self, grupo):
+        """
+        Bloquea las claves (código, fecha, DJ) de los lotes de la transacción,
+        los códigos de instrumento que no existen en BD (los crearía la carga)
+        y, para las filas sin código, la base de los códigos que se generarán
+        (generar_codigos_unicos lee los códigos en uso con esa base sin
+        bloquearlos). Los instrumentos encontrados quedan en la cache del motor.
+        """
+        if not bloqueo_por_clave():
+            return
+        claves = set()
+        codigos = set()
+        for preparadas in grupo:
+            for fila in preparadas:
+                if fila.registro is None or fila.error_codigo is not None or fila.error_clave is not None:
+                    continue
+                codigo = self._campo_codigo.to_python(fila.codigo)
+                if not codigo:
+                    # Instrumento propio: sin clave de calificación en común, pero su código
+                    # generado puede chocar con el de otra carga que genera la misma base
+                    claves.add(clave_bloqueo(ESPACIO_INSTRUMENTO, codigo_base(fila.nombre_instrumento)))
+                    continue
+                codigos.add(codigo)
+                claves.add(clave_bloqueo(ESPACIO_CALIFICACION, codigo, fila.fecha, fila.dj))
+
+        desconocidos = codigos - self._instrumentos.keys()
+        if desconocidos:
+            for instrumento in InstrumentoFinanciero.objects.filter(codigo_instrumento__in=desconocidos):
+                self._instrumentos[instrumento.codigo_instrumento] = instrumento
+            claves.update(
+                clave_bloqueo(ESPACIO_INSTRUMENTO, codigo) for codigo in desconocidos - self._instrumentos.keys()
+            )
+        bloquear_claves(claves)
+
+    # ------------------------------------------------------------------
+    # Lotes
+    # ------------------------------------------------------------------
+
+    def _procesar_lote(self, lote):
+        """Procesa un lote completo en un savepoint; si falla la escritura, fila a fila."""
+        try:
+            with transaction.atomic():
+                resultado = self._procesar_bloque(lote)
+        except (IntegrityError, DataError) as e:
+            logger.warning(
+                f"Bulk write failed for rows {lote[0].numero}-{lote[-1].numero}, "
+                f"retrying row by row: {e}"
+            )
+            resultado = _ResultadoLote()
+            for fila in lote:
+                resultado_fila = self._procesar_fila_aislada(fila)
+                resultado.acumular(resultado_fila)
+                resultado.eventos.extend(resultado_fila.eventos)
+                self._instrumentos.update(resultado_fila.instrumentos_nuevos)
+        else:
+            self._instrumentos.update(resultado.instrumentos_nuevos)
+
+        resultado.cerrar()
+        self._emitir_eventos(lote, resultado)
+        return resultado
+
+    def _simular_lote(self, lote):
+        """Evalúa un lote sin escribir (sin savepoints: no hay escrituras que puedan fallar)."""
+        resultado = self._procesar_bloque(lote)
+        self._instrumentos.update(resultado.instrumentos_nuevos)
+        resultado.cerrar()
+        resultado.eventos = []
+        return resultado
+
+    def _procesar_fila_aislada(self, fila):
+        """Procesa una sola fila en su propio savepoint (camino de respaldo)."""
+        try:
+            with transaction.atomic():
+                return self._procesar_bloque([fila])
+        except (IntegrityError, DataError) as e:
+            resultado = _ResultadoLote()
+            resultado.procesados = 1
+            resultado.fallidos = 1
+            resultado.registrar_excepcion(fila.numero, e)
+            return resultado
+
+    def _procesar_bloque(self, lote):
+        """
+        Aplica un bloque de filas preparadas: resuelve instrumentos y existentes,
+        regla de prioridad, huella y escritura. Debe ejecutarse dentro de atomic().
+        """
+        resultado = _ResultadoLote()
+        resultado.procesados = len(lote)
+
+        # PASO 1: Instrumentos de todas las filas del bloque
+        pendientes = []
+        for fila in lote:
+            if fila.registro is None:
+                ganadora = self._colapsadas[fila.numero]
+                resultado.colapsados += 1
+                resultado.registrar_error(
+                    fila.numero,
+                    f"Fila {fila.numero}: COLAPSADO - La clave (instrumento, fecha, DJ) se repite en el archivo; "
+                    f"prevalece la fila {ganadora}",
+                    codigo='COLAPSADO',
+                )
+                continue
+            if fila.error_codigo is not None:
+                resultado.fallidos += 1
+                resultado.registrar_excepcion(fila.numero, fila.error_codigo)
+                continue
+            pendientes.append(fila)
+
+        instrumentos_fila = self._resolver_instrumentos(pendientes, resultado)
+
+        # PASO 2: Clave única de cada fila
+        preparadas = []
+        for fila in pendientes:
+            i = fila.numero
+            if fila.error_clave is not None:
+                resultado.fallidos += 1
+                resultado.registrar_excepcion(i, fila.error_clave)
+                continue
+            instrumento = instrumentos_fila[i]
+            # Instrumento nuevo de una simulación (sin pk): clave propia en memoria
+            id_instrumento = instrumento.pk if instrumento.pk is not None else ('nuevo', id(instrumento))
+            preparadas.append((fila, instrumento, (id_instrumento, fila.fecha, fila.dj)))
+
+        if self.staging:
+            self._fusionar_staging(preparadas, resultado)
+            return resultado
+
+        # PASO 3: Calificaciones existentes del bloque (una consulta)
+        estado = self._cargar_existentes([p[2] for p in preparadas])
+        existentes = dict(estado)
+
+        # PASO 4: Regla de prioridad, huella y resultado de la validación
+        claves_nuevas = set()
+        claves_modificadas = set()
+        filas_clave = {}  # Última fila que modificó cada clave (diff del bloque)
+        for fila, instrumento, clave in preparadas:
+            i, nuevo_origen = fila.numero, fila.origen
+            existente = estado.get(clave)
+            try:
+                if existente is not None:
+                    # REGLA DE PRIORIDAD - CORREDORA > BOLSA
+                    if existente.origen == 'CORREDORA' and nuevo_origen == 'BOLSA':
+                        resultado.omitidos += 1
+                        resultado.registrar_error(
+                            i,
+                            f"Fila {i}: OMITIDO - Registro existente de Corredora tiene prioridad sobre Bolsa. "
+                            f"Instrumento: {instrumento.codigo_instrumento}, Fecha: {fila.fecha_informe}",
+                            codigo='OMITIDO',
+                            columna='origen',
+                        )
+                        resultado.eventos.append(('OMITIDO', i, instrumento.codigo_instrumento, nuevo_origen))
+                        continue
+
+                if fila.error_valores is not None:
+                    raise fila.error_valores
+
+                if existente is not None:
+                    candidato = copy(existente)
+                    candidato.usuario_creador = self.usuario
+                    for campo, valor in fila.valores.items():
+                        setattr(candidato, campo, valor)
+                    candidato.origen = nuevo_origen
+                    candidato.fuente_origen = 'MASIVA'  # HDU 16: Marcar como carga masiva
+                else:
+                    candidato = CalificacionTributaria(
+                        instrumento=instrumento,
+                        usuario_creador=self.usuario,
+                        fecha_informe=fila.fecha_informe,
+                        origen=nuevo_origen,
+                        fuente_origen='MASIVA',  # HDU 16: Marcar como carga masiva
+                        **fila.valores,
+                    )
+
+                candidato.aplicar_calculo_legacy()
+
+                # Contenido idéntico al almacenado: sin escritura ni validación
+                huella_existente = existente.huella if existente is not None else ''
+                if self.simulacion and existente is not None and existente.pk is None:
+                    huella_existente = existente.calcular_huella()  # Fila creada en esta simulación
+                if huella_existente:
+                    if candidato.calcular_huella() == huella_existente:
+                        resultado.sin_cambios += 1
+                        resultado.eventos.append(('SIN_CAMBIOS', i, instrumento.codigo_instrumento, nuevo_origen))
+                        continue
+
+                # full_clean() ya ejecutado en preparar_lote
+                if fila.error_validacion is not None:
+                    raise fila.error_validacion
+                candidato.fecha_informe = fila.fecha
+                if not self.simulacion:
+                    candidato.huella = candidato.calcular_huella()
+            except Exception as e:
+                resultado.fallidos += 1
+                resultado.registrar_excepcion(i, e)
+                continue
+
+            estado[clave] = candidato
+            if existente is None:
+                claves_nuevas.add(clave)
+                resultado.creados += 1
+                resultado.eventos.append(('CREADO', i, instrumento.codigo_instrumento, nuevo_origen))
+            else:
+                claves_modificadas.add(clave)
+                filas_clave[clave] = i
+                resultado.actualizados += 1
+                resultado.eventos.append(('ACTUALIZADO', i, instrumento.codigo_instrumento, nuevo_origen))
+
+        # PASO 5: Escritura por lotes
+        if not self.simulacion:
+            claves_actualizadas = sorted(claves_modificadas - claves_nuevas, key=filas_clave.get)
+            modificados = resultado.cambios.registrar_diferencias(
+                [filas_clave[c] for c in claves_actualizadas],
+                [existentes[c] for c in claves_actualizadas],
+                [estado[c] for c in claves_actualizadas],
+            )
+            self._escribir(estado, claves_nuevas, claves_actualizadas, existentes, resultado.cambios, modificados)
+        return resultado
+
+    def _fusionar_staging(self, preparadas, resultado):
+        """
+        PASO 3 a 5 con tabla de staging: carga el bloque con una operación
+        masiva, lo clasifica y lo fusiona con SQL set-based por generación
+        (k-ésima aparición de cada clave en el bloque).
+        """
+        if not preparadas:
+            return
+
+        ahora = timezone.now()
+        apariciones = Counter()
+        filas = {}
+        candidatos = {}
+        filas_staging = []
+        for fila, instrumento, clave in preparadas:
+            apariciones[clave] += 1
+            candidato = CalificacionTributaria(
+                instrumento=instrumento,
+                usuario_creador=self.usuario,
+                fecha_informe=fila.fecha,
+                numero_dj=fila.dj,
+                origen=fila.origen,
+                fuente_origen='MASIVA',  # HDU 16: Marcar como carga masiva
+                fecha_creacion=ahora,
+                fecha_modificacion=ahora,
+            )
+            if fila.error_valores is None:
+                # La huella solo depende de los valores de la fila, no del registro existente
+                for campo, valor in fila.valores.items():
+                    setattr(candidato, campo, valor)
+                candidato.fecha_informe = fila.fecha
+                candidato.aplicar_calculo_legacy()
+                candidato.huella = candidato.calcular_huella()
+            else:
+                candidato.huella = None
+            valido = fila.error_valores is None and fila.error_validacion is None
+            filas[fila.numero] = (fila, instrumento)
+            candidatos[fila.numero] = candidato
+            filas_staging.append(staging_carga.fila_staging(fila.numero, apariciones[clave], valido, candidato))
+
+        with connection.cursor() as cursor:
+            staging_carga.preparar_staging(cursor)
+            staging_carga.cargar_staging(cursor, filas_staging)
+            for generacion in range(1, max(apariciones.values()) + 1):
+                estados = staging_carga.clasificar_staging(cursor, generacion)
+                filas_actualizadas = sorted(
+                    i for i, (estado_fila, _) in estados.items() if estado_fila == staging_carga.ACTUALIZAR
+                )
+                actualizadas = [estados[i][1] for i in filas_actualizadas]
+                if actualizadas:
+                    previas = CalificacionTributaria.objects.in_bulk(actualizadas)
+                    for pk in actualizadas:
+                        resultado.cambios.registrar_previo(previas[pk])
+                    resultado.cambios.registrar_diferencias(
+                        filas_actualizadas,
+                        [previas[pk] for pk in actualizadas],
+                        [candidatos[i] for i in filas_actualizadas],
+                    )
+                if actualizadas or any(estado_fila == staging_carga.CREAR for estado_fila, _ in estados.values()):
+                    escritas = staging_carga.fusionar_staging(cursor, generacion, CAMPOS_ACTUALIZABLES)
+                    resultado.cambios.creados.extend(set(escritas) - set(actualizadas))
+                    for pk, huella in escritas.items():
+                        resultado.cambios.registrar_posterior(pk, huella, ahora)
+                for i, (estado_fila, _) in estados.items():
+                    self._registrar_estado_staging(resultado, estado_fila, *filas[i])
+
+        resultado.eventos.sort(key=lambda evento: evento[1])
+
+    def _registrar_estado_staging(self, resultado, estado_fila, fila, instrumento):
+        """Contadores, error y evento de una fila clasificada en la tabla de staging."""
+        i, codigo = fila.numero, instrumento.codigo_instrumento
+        if estado_fila == staging_carga.OMITIR:
+            resultado.omitidos += 1
+            resultado.registrar_error(
+                i,
+                f"Fila {i}: OMITIDO - Registro existente de Corredora tiene prioridad sobre Bolsa. "
+                f"Instrumento: {codigo}, Fecha: {fila.fecha_informe}",
+                codigo='OMITIDO',
+                columna='origen',
+            )
+            resultado.eventos.append(('OMITIDO', i, codigo, fila.origen))
+        elif estado_fila == staging_carga.SIN_CAMBIOS:
+            resultado.sin_cambios += 1
+            resultado.eventos.append(('SIN_CAMBIOS', i, codigo, fila.origen))
+        elif estado_fila == staging_carga.FALLAR:
+            resultado.fallidos += 1
+            resultado.registrar_excepcion(i, fila.error_valores or fila.error_validacion)
+        elif estado_fila == staging_carga.CREAR:
+            resultado.creados += 1
+            resultado.eventos.append(('CREADO', i, codigo, fila.origen))
+        else:
+            resultado.actualizados += 1
+            resultado.eventos.append(('ACTUALIZADO', i, codigo, fila.origen))
+
+    # ------------------------------------------------------------------
+    # Acceso a datos (una consulta por bloque)
+    # ------------------------------------------------------------------
+
+    def _resolver_instrumentos(self, pendientes, resultado):
+        """
+        Retorna {fila: instrumento}. Busca todos los códigos desconocidos con una
+        consulta y crea los faltantes con bulk_create (defaults de la primera fila).
+        Las filas sin código reciben un instrumento nuevo cada una, con códigos
+        generados para todo el bloque (generar_codigos_unicos) en el mismo bulk_create.
+        """
+        instrumentos_fila = {}
+        defaults_por_codigo = {}
+        sin_codigo = []
+        for fila in pendientes:
+            codigo_norm = self._campo_codigo.to_python(fila.codigo)
+            if not codigo_norm:
+                sin_codigo.append(fila)
+            elif codigo_norm not in self._instrumentos:
+                defaults_por_codigo.setdefault(codigo_norm, {
+                    "nombre_instrumento": fila.nombre_instrumento,
+                    "tipo_instrumento": fila.tipo_instrumento,
+                })
+
+        encontrados = {}
+        if defaults_por_codigo:
+            encontrados = {
+                inst.codigo_instrumento: inst
+                for inst in InstrumentoFinanciero.objects.filter(
+                    codigo_instrumento__in=list(defaults_por_codigo)
+                )
+            }
+        faltantes = [
+            InstrumentoFinanciero(codigo_instrumento=codigo, **defaults)
+            for codigo, defaults in defaults_por_codigo.items()
+            if codigo not in encontrados
+        ]
+
+        # Código vacío: en la simulación el instrumento queda en memoria sin código
+        codigos_generados = (
+            [fila.codigo for fila in sin_codigo] if self.simulacion
+            else generar_codigos_unicos([fila.nombre_instrumento for fila in sin_codigo])
+        )
+        generados = {
+            fila.numero: InstrumentoFinanciero(
+                codigo_instrumento=codigo,
+                nombre_instrumento=fila.nombre_instrumento,
+                tipo_instrumento=fila.tipo_instrumento,
+            )
+            for fila, codigo in zip(sin_codigo, codigos_generados)
+        }
+
+        if faltantes or generados:
+            if not self.simulacion:
+                creados = InstrumentoFinanciero.objects.bulk_create(faltantes + list(generados.values()))
+                resultado.cambios.instrumentos.extend(inst.pk for inst in creados)
+            encontrados.update({inst.codigo_instrumento: inst for inst in faltantes})
+        resultado.instrumentos_nuevos = encontrados
+
+        for fila in pendientes:
+            if fila.numero in generados:
+                instrumento = generados[fila.numero]
+            else:
+                codigo_norm = self._campo_codigo.to_python(fila.codigo)
+                instrumento = self._instrumentos.get(codigo_norm) or resultado.instrumentos_nuevos[codigo_norm]
+            instrumentos_fila[fila.numero] = instrumento
+
+        return instrumentos_fila
+
+    def _cargar_existentes(self, claves):
+        """Retorna {clave: calificacion} para las claves del bloque con una sola consulta."""
+        # Claves de instrumentos nuevos en simulación: no pueden existir en BD
+        buscadas = {c for c in claves if isinstance(c[0], int)}
+        if not buscadas:
+            return {}
+        existentes = CalificacionTributaria.objects.filter(
+            instrumento_id__in={c[0] for c in buscadas},
+            fecha_informe__in={c[1] for c in buscadas},
+            numero_dj__in={c[2] for c in buscadas if c[2] is not None},
+        )
+        estado = {}
+        for obj in existentes:
+            clave = (obj.instrumento_id, obj.fecha_informe, obj.numero_dj)
+            if clave in buscadas:
+                estado[clave] = obj
+        return estado
+
+    def _escribir(self, estado, claves_nuevas, claves_actualizadas, existentes, cambios, modificados):
+        """
+        Escribe el estado final del bloque y registra el changeset inverso
+        (existentes: filas leídas antes de modificarlas). Las nuevas van con
+        bulk_create; las actualizadas se cargan en la tabla de staging y se
+        escriben con un solo UPDATE ... FROM por pk, solo con las columnas
+        modificadas en el bloque (modificados) más usuario, huella y fecha.
+        bulk_update armaría un CASE WHEN por columna sobre todas las filas.
+        """
+        if claves_nuevas:
+            nuevos = CalificacionTributaria.objects.bulk_create([estado[c] for c in claves_nuevas])
+            for obj in nuevos:
+                cambios.creados.append(obj.pk)
+                cambios.registrar_posterior(obj.pk, obj.huella, obj.fecha_modificacion)
+
+        if claves_actualizadas:
+            for c in claves_actualizadas:
+                cambios.registrar_previo(existentes[c])
+            ahora = timezone.now()
+            filas_staging = []
+            for c in claves_actualizadas:
+                obj = estado[c]
+                obj.fecha_modificacion = ahora  # auto_now no aplica fuera de save()
+                cambios.registrar_posterior(obj.pk, obj.huella, ahora)
+                filas_staging.append(staging_carga.fila_staging(obj.pk, GENERACION_ACTUALIZAR, True, obj))
+            campos = [
+                campo for campo in CAMPOS_ACTUALIZABLES
+                if campo not in CAMPOS_DIFERENCIA or campo in modificados
+            ]
+            with connection.cursor() as cursor:
+                staging_carga.preparar_staging(cursor)
+                staging_carga.cargar_staging(cursor, filas_staging)
+                staging_carga.restaurar_staging(cursor, campos, GENERACION_ACTUALIZAR)
+
+    # ------------------------------------------------------------------
+    # Logging
+    # ------------------------------------------------------------------
+
+    def _emitir_eventos(self, lote, resultado):
+        """Emite el resumen del lote y su detalle por fila (muestreado) una vez procesado."""
+        resumir_lote(logger, lote[0].numero, lote[-1].numero, resultado, self.muestreo_log)
+        resultado.eventos = []
@@ -0,0 +1,245 @@
+"""
+Fusión de cargas masivas mediante tabla de staging
+
+Alternativa a bulk_create + UPDATE ... FROM para el escritor de MotorCargaMasiva
+(staging=True): las filas preparadas de un bloque se cargan en una tabla
+temporal con una sola operación masiva (COPY en PostgreSQL, executemany en
+SQLite) y la regla de prioridad CORREDORA > BOLSA, la comparación de huellas
+y el upsert se resuelven con sentencias set-based sobre ella:
+
+- clasificar_staging(): un SELECT con LEFT JOIN a la tabla destino que indica
+  qué hará cada fila (crear, actualizar, sin cambios, omitir, fallar).
+- fusionar_staging(): un INSERT ... SELECT ... ON CONFLICT (instrumento,
+  fecha_informe, numero_dj) DO UPDATE ... WHERE con la misma regla.
+- restaurar_staging() / eliminar_staging(): UPDATE ... FROM y DELETE por id
+  (la columna fila lleva entonces el id de la calificación), para revertir
+  una carga y para las filas actualizadas del escritor por defecto;
+  filas_modificadas() detecta las editadas después de la carga y
+  claves_staging() entrega sus claves para bloquearlas.
+
+Las filas con la misma clave dentro de un bloque se reparten en generaciones
+(1ª aparición, 2ª aparición, ...) que se clasifican y fusionan en orden: cada
+fila ve el estado dejado por la anterior, igual que en el proceso fila a fila.
+"""
+
+import io
+
+from django.db import connection
+
+from ..models import CalificacionTributaria
+
+TABLA_STAGING = 'calificaciones_carga_staging'
+
+# Resultado de clasificar_staging() para cada fila
+CREAR = 'C'
+ACTUALIZAR = 'A'
+SIN_CAMBIOS = 'S'
+OMITIR = 'O'
+FALLAR = 'F'
+
+# Columnas de la tabla destino (todas menos la PK autoincremental)
+CAMPOS_DESTINO = [field for field in CalificacionTributaria._meta.concrete_fields if not field.primary_key]
+
+# Clave única del upsert: unique_together (instrumento, fecha_informe, numero_dj)
+CAMPOS_CLAVE = [
+    CalificacionTributaria._meta.get_field(nombre)
+    for nombre in CalificacionTributaria._meta.unique_together[0]
+]
+
+# Columnas que se cargan también para las filas con error (bastan para clasificarlas)
+NOMBRES_CLASIFICACION = {field.name for field in CAMPOS_CLAVE} | {'origen', 'huella'}
+
+
+def _nombre(nombre):
+    return connection.ops.quote_name(nombre)
+
+
+def _tipo_staging(field):
+    # Texto sin largo máximo: una fila con error (ej: DJ demasiado larga) no debe
+    # romper la carga de la tabla; solo las filas válidas llegan a la tabla destino
+    if field.get_internal_type() == 'CharField':
+        return 'text'
+    return field.db_type(connection)
+
+
+def preparar_staging(cursor):
+    """Crea la tabla temporal de staging (una por conexión) y la vacía."""
+    columnas = ', '.join(f'{_nombre(field.column)} {_tipo_staging(field)}' for field in CAMPOS_DESTINO)
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE IF NOT EXISTS {_nombre(TABLA_STAGING)} '
+        f'(fila bigint, generacion integer, valido boolean, {columnas})'
+    )
+    cursor.execute(f'DELETE FROM {_nombre(TABLA_STAGING)}')
+
+
+def fila_staging(numero, generacion, valido, calificacion):
+    """
+    Tupla de la tabla de staging para una fila. Las filas con error solo
+    llevan las columnas necesarias para clasificarlas (clave, origen, huella).
+    """
+    valores = [numero, generacion, valido]
+    for field in CAMPOS_DESTINO:
+        if valido or field.name in NOMBRES_CLASIFICACION:
+            valores.append(field.get_db_prep_save(getattr(calificacion, field.attname), connection))
+        else:
+            valores.append(None)
+    return valores
+
+
+def _texto_copy(valor):
+    """Valor en formato texto de COPY (NULL como \\N y caracteres de control escapados)."""
+    if valor is None:
+        return '\\N'
+    return (
+        str(valor)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def cargar_staging(cursor, filas):
+    """Inserta las filas en la tabla de staging con una sola operación masiva."""
+    columnas = ['fila', 'generacion', 'valido'] + [field.column for field in CAMPOS_DESTINO]
+    lista_columnas = ', '.join(_nombre(columna) for columna in columnas)
+
+    if connection.vendor != 'postgresql':
+        marcadores = ', '.join(['%s'] * len(columnas))
+        cursor.executemany(
+            f'INSERT INTO {_nombre(TABLA_STAGING)} ({lista_columnas}) VALUES ({marcadores})', filas
+        )
+        return
+
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    sql = f'COPY {_nombre(TABLA_STAGING)} ({lista_columnas}) FROM STDIN'
+    if is_psycopg3:
+        with cursor.cursor.copy(sql) as copia:
+            for fila in filas:
+                copia.write_row(fila)
+    else:
+        buffer = io.StringIO()
+        for fila in filas:
+            buffer.write('\t'.join(_texto_copy(valor) for valor in fila))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.cursor.copy_expert(sql, buffer)
+
+
+def clasificar_staging(cursor, generacion):
+    """
+    Retorna {fila: (CREAR | ACTUALIZAR | SIN_CAMBIOS | OMITIR | FALLAR, id)} para
+    una generación, en el mismo orden de reglas que el proceso fila a fila:
+    prioridad CORREDORA > BOLSA, huella idéntica, error de la fila, upsert.
+    id es el de la calificación existente (None si no existe).
+    """
+    tabla = _nombre(CalificacionTributaria._meta.db_table)
+    union = ' AND '.join(f'c.{_nombre(field.column)} = s.{_nombre(field.column)}' for field in CAMPOS_CLAVE)
+    cursor.execute(
+        f"""
+        SELECT s.fila, CASE
+            WHEN c.id IS NOT NULL AND c.origen = 'CORREDORA' AND s.origen = 'BOLSA' THEN '{OMITIR}'
+            WHEN c.id IS NOT NULL AND c.huella <> '' AND c.huella = s.huella THEN '{SIN_CAMBIOS}'
+            WHEN NOT s.valido THEN '{FALLAR}'
+            WHEN c.id IS NULL THEN '{CREAR}'
+            ELSE '{ACTUALIZAR}'
+        END, c.id
+        FROM {_nombre(TABLA_STAGING)} s
+        LEFT JOIN {tabla} c ON {union}
+        WHERE s.generacion = %s
+        """,
+        [generacion],
+    )
+    return {fila: (estado, pk) for fila, estado, pk in cursor.fetchall()}
+
+
+def fusionar_staging(cursor, generacion, campos_actualizables):
+    """
+    Upsert de las filas válidas de una generación. El WHERE del DO UPDATE
+    repite la regla de prioridad y la de huella de clasificar_staging().
+    Retorna {id: huella} de las filas creadas o actualizadas (RETURNING).
+    """
+    tabla = _nombre(CalificacionTributaria._meta.db_table)
+    columnas = ', '.join(_nombre(field.column) for field in CAMPOS_DESTINO)
+    clave = ', '.join(_nombre(field.column) for field in CAMPOS_CLAVE)
+    asignaciones = ', '.join(
+        f'{columna} = excluded.{columna}'
+        for columna in (
+            _nombre(CalificacionTributaria._meta.get_field(campo).column) for campo in campos_actualizables
+        )
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO {tabla} ({columnas})
+        SELECT {columnas} FROM {_nombre(TABLA_STAGING)}
+        WHERE generacion = %s AND valido
+        ON CONFLICT ({clave}) DO UPDATE SET {asignaciones}
+        WHERE NOT ({tabla}.origen = 'CORREDORA' AND excluded.origen = 'BOLSA')
+          AND ({tabla}.huella = '' OR {tabla}.huella <> excluded.huella)
+        RETURNING id, huella
+        """,
+        [generacion],
+    )
+    return dict(cursor.fetchall())
+
+
+def restaurar_staging(cursor, campos, generacion):
+    """
+    Copia los campos de las filas de staging de una generación sobre la
+    calificación cuyo id está en la columna fila (un solo UPDATE ... FROM).
+    Retorna el número de filas restauradas.
+    """
+    tabla = _nombre(CalificacionTributaria._meta.db_table)
+    asignaciones = ', '.join(
+        f'{columna} = s.{columna}'
+        for columna in (_nombre(CalificacionTributaria._meta.get_field(campo).column) for campo in campos)
+    )
+    cursor.execute(
+        f'UPDATE {tabla} SET {asignaciones} '
+        f'FROM {_nombre(TABLA_STAGING)} s WHERE {tabla}.id = s.fila AND s.generacion = %s',
+        [generacion],
+    )
+    return cursor.rowcount
+
+
+def claves_staging(cursor, generacion):
+    """
+    Claves (codigo_instrumento, fecha_informe, numero_dj) de las calificaciones
+    cuyo id está en la columna fila de una generación.
+    """
+    tabla = _nombre(CalificacionTributaria._meta.db_table)
+    instrumento = CalificacionTributaria._meta.get_field('instrumento')
+    tabla_instrumento = _nombre(instrumento.related_model._meta.db_table)
+    campo_fecha = CalificacionTributaria._meta.get_field('fecha_informe')
+    cursor.execute(
+        f'SELECT i.{_nombre("codigo_instrumento")}, c.{_nombre(campo_fecha.column)}, c.{_nombre("numero_dj")} '
+        f'FROM {_nombre(TABLA_STAGING)} s JOIN {tabla} c ON c.id = s.fila '
+        f'JOIN {tabla_instrumento} i ON i.id = c.{_nombre(instrumento.column)} WHERE s.generacion = %s',
+        [generacion],
+    )
+    return [(codigo, campo_fecha.to_python(fecha), dj) for codigo, fecha, dj in cursor.fetchall()]
+
+
+def filas_modificadas(cursor, generacion):
+    """
+    Ids (columna fila) de una generación cuya calificación ya no tiene la
+    huella o la fecha_modificacion cargadas en staging (editada después).
+    """
+    tabla = _nombre(CalificacionTributaria._meta.db_table)
+    cursor.execute(
+        f'SELECT s.fila FROM {_nombre(TABLA_STAGING)} s JOIN {tabla} c ON c.id = s.fila '
+        f'WHERE s.generacion = %s AND (c.huella <> s.huella OR c.fecha_modificacion <> s.fecha_modificacion)',
+        [generacion],
+    )
+    return {pk for (pk,) in cursor.fetchall()}
+
+
+def eliminar_staging(cursor, generacion):
+    """Elimina las calificaciones cuyos ids están en la columna fila de una generación."""
+    cursor.execute(
+        f'DELETE FROM {_nombre(CalificacionTributaria._meta.db_table)} '
+        f'WHERE id IN (SELECT fila FROM {_nombre(TABLA_STAGING)} WHERE generacion = %s)',
+        [generacion],
+    )
+    return cursor.rowcount
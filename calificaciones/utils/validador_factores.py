@@ -0,0 +1,144 @@
+"""
+Validador de Factores Tributarios por Lotes
+
+Aplica las reglas de integridad de CalificacionTributaria.clean() a muchas
+filas a la vez:
+- REGLA A: 0 <= factor_i <= 1 para los factores 8 a 37
+- REGLA B: suma(factores 8-16) <= 1
+
+Los factores (8 decimales) se escalan a enteros (factor * 10^8) en una matriz
+NumPy int64, por lo que las comparaciones y sumas son exactas y se evalúan
+para todo el lote con operaciones vectorizadas. Los mensajes son los mismos
+que produce clean().
+
+Una fila con valores no representables como entero escalado (más de 8
+decimales, NaN/infinito, tipos no Decimal) queda como NO_EVALUADA y se valida
+con la lógica Decimal original (validar_factores_fila).
+"""
+
+import re
+from decimal import Decimal
+
+import numpy as np
+
+CAMPOS_FACTORES = [f'factor_{i}' for i in range(8, 38)]
+
+# Factores 8-16 (REGLA B): primeras 9 columnas de la matriz
+COLUMNAS_CRITICAS = 9
+
+DECIMALES = 8
+ESCALA = 10 ** DECIMALES
+
+# Cota de los valores escalados: la suma de 9 columnas no desborda int64
+LIMITE_ESCALADO = 10 ** 17
+
+MENSAJE_SUMA = 'La suma de los factores 8 al 16 no puede superar 1.'
+
+# Marcador de fila que debe validarse con la lógica Decimal fila a fila
+NO_EVALUADA = object()
+
+# Reconoce los mensajes de mensaje_rango() (REGLA A) y extrae el campo
+PATRON_RANGO = re.compile(r'^El (factor_\d+) debe estar entre 0 y 1\.')
+
+
+def mensaje_rango(campo, valor):
+    """Mensaje de REGLA A para un factor fuera de rango."""
+    return f'El {campo} debe estar entre 0 y 1. Valor recibido: {valor}'
+
+
+def regla_incumplida(mensaje):
+    """
+    Identifica la regla de un mensaje de validación de factores.
+    Retorna ('REGLA_A', campo), ('REGLA_B', '') o None si no es de REGLA A/B.
+    """
+    if mensaje == MENSAJE_SUMA:
+        return 'REGLA_B', ''
+    coincidencia = PATRON_RANGO.match(mensaje)
+    if coincidencia:
+        return 'REGLA_A', coincidencia.group(1)
+    return None
+
+
+def validar_factores_fila(valores):
+    """
+    Valida REGLA A y REGLA B de una fila con Decimal (lógica original de clean()).
+    valores: secuencia de 30 factores (8 a 37), None si no viene.
+    Retorna el mensaje de error o None si la fila es válida.
+    """
+    # REGLA A: Validar rango individual de cada factor (0 <= factor <= 1)
+    for campo, valor in zip(CAMPOS_FACTORES, valores):
+        if valor is not None:
+            if valor < Decimal('0') or valor > Decimal('1'):
+                return mensaje_rango(campo, valor)
+
+    # REGLA B: Validar suma de factores 8-16 (límite crítico)
+    suma_factores_criticos = sum([
+        valor or Decimal('0')
+        for valor in valores[:COLUMNAS_CRITICAS]
+    ])
+    if suma_factores_criticos > Decimal('1'):
+        return MENSAJE_SUMA
+
+    return None
+
+
+def _escalar(valor):
+    """Retorna factor * 10^8 como int, o None si no es exacto en esa escala."""
+    if isinstance(valor, Decimal):
+        if not valor.is_finite() or valor.as_tuple().exponent < -DECIMALES:
+            return None
+        escalado = int(valor.scaleb(DECIMALES))
+    elif isinstance(valor, int) and not isinstance(valor, bool):
+        escalado = valor * ESCALA
+    else:
+        return None
+    return escalado if -LIMITE_ESCALADO < escalado < LIMITE_ESCALADO else None
+
+
+def evaluar_factores_lote(filas):
+    """
+    Evalúa REGLA A y REGLA B para un lote de filas de 30 factores.
+
+    Retorna (mensajes, sumas):
+    - mensajes[i]: mensaje de error, None si es válida, o NO_EVALUADA
+    - sumas[i]: suma de factores 8-16 escalada por 10^8 (None si NO_EVALUADA)
+    """
+    total = len(filas)
+    matriz = np.zeros((total, len(CAMPOS_FACTORES)), dtype=np.int64)
+    presentes = np.zeros(matriz.shape, dtype=bool)
+    exactas = np.ones(total, dtype=bool)
+
+    for i, valores in enumerate(filas):
+        for j, valor in enumerate(valores):
+            if valor is None:
+                continue
+            escalado = _escalar(valor)
+            if escalado is None:
+                exactas[i] = False
+                break
+            matriz[i, j] = escalado
+            presentes[i, j] = True
+
+    # REGLA A: primer factor fuera de [0, 1] de cada fila
+    fuera_de_rango = presentes & ((matriz < 0) | (matriz > ESCALA))
+    con_error_rango = fuera_de_rango.any(axis=1)
+    primer_error = fuera_de_rango.argmax(axis=1)
+
+    # REGLA B: factores ausentes suman 0
+    sumas = matriz[:, :COLUMNAS_CRITICAS].sum(axis=1)
+    excede_suma = sumas > ESCALA
+
+    mensajes = []
+    for i, valores in enumerate(filas):
+        if not exactas[i]:
+            mensajes.append(NO_EVALUADA)
+        elif con_error_rango[i]:
+            j = int(primer_error[i])
+            mensajes.append(mensaje_rango(CAMPOS_FACTORES[j], valores[j]))
+        elif excede_suma[i]:
+            mensajes.append(MENSAJE_SUMA)
+        else:
+            mensajes.append(None)
+
+    return mensajes, [int(s) if exactas[i] else None for i, s in enumerate(sumas)]
+
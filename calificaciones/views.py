@@ -11,15 +11,17 @@ Total de Rutas: 22 (100% preservadas)
 # IMPORTACIONES - Organizadas según PEP 8
 # ============================================================================
 
-# Biblioteca Estándar (6 imports)
+# Biblioteca Estándar (7 imports)
 import csv
 import io
 import json
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
+from itertools import chain
 
-# Núcleo de Django (12 imports)
+# Núcleo de Django (13 imports)
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
@@ -27,15 +29,16 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError, PermissionDenied
 from django.core.paginator import Paginator
 from django.db import IntegrityError
-from django.db.models import Count, Q
-from django.http import HttpResponse, JsonResponse
+from django.db.models import Count, Max, Q, Sum
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
 
 # Terceros (1 import)
 import openpyxl
 
-# Aplicación Local (4 imports)
+# Aplicación Local (6 imports)
 from .forms import (
     CalificacionTributariaForm,
     InstrumentoFinancieroForm,
@@ -50,13 +53,40 @@ from .models import (
     InstrumentoFinanciero,
     LogAuditoria,
     CargaMasiva,
+    CargaMasivaError,
     Rol,
     PerfilUsuario,
     IntentoLogin,
     CuentaBloqueada,
     ArchivoCargado,
+    TrabajoExportacion,
 )
 from .permissions import requiere_permiso
+from .utils.cambios_carga import (
+    ReversionNoPermitida,
+    conteo_diferencias,
+    iterar_diferencias,
+    revertir_carga,
+)
+from .utils.cola_cargas import (
+    ejecutar_trabajo,
+    encolar_archivo,
+    identificador_worker,
+    reanudar_carga,
+    reclamar_trabajo,
+)
+from .utils.cola_exportaciones import (
+    EXTENSIONES,
+    archivo_disponible,
+    ejecutar_exportacion,
+    reclamar_exportacion,
+    registrar_acceso,
+    solicitar_exportacion,
+)
+from .utils.condicional import agregar_validadores, respuesta_condicional, validadores
+from .utils.consulta_calificaciones import CalificacionQuery
+from .utils.lectores import leer_filas
+from .utils.motor_carga import MotorCargaMasiva, filas_colapsadas
 
 # ============================================================================
 # CONFIGURACIÓN DE LOGGING
@@ -76,14 +106,26 @@ FAILED_ATTEMPT_WINDOW_MINUTES = 15
 MAX_AUDIT_LOG_RECORDS = 1000
 MAX_LOGIN_HISTORY_RECORDS = 50
 RECENT_ACTIVITY_DAYS = 7
+MAX_ERRORES_SIMULACION = 100  # Errores mostrados en la vista previa de carga masiva
+ERRORES_CARGA_POR_PAGINA = 50  # Paginación del detalle de errores de una carga masiva
+
+# Exportaciones
+TAMANO_BLOQUE_CSV = 64 * 1024  # Caracteres por bloque enviado al cliente
+TAMANO_BLOQUE_ARCHIVO = 64 * 1024  # Bytes por bloque al enviar un archivo
+
+# Exportaciones de calificaciones (archivos generados por utils/cola_exportaciones)
+CONTENT_TYPES_EXPORTACION = {
+    "XLSX": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "CSV": "text/csv; charset=utf-8",
+}
 
 
 # ============================================================================
 # SECCIÓN 1: UTILIDADES Y FUNCIONES AUXILIARES
 # ============================================================================
 # Funciones: obtener_ip_cliente, verificar_cuenta_bloqueada,
-#            registrar_intento_login, verificar_intentos_fallidos,
-#            procesar_excel, procesar_csv
+#            registrar_intento_login, verificar_intentos_fallidos
+# (Lectores de archivos de carga masiva: utils/lectores.py)
 # Líneas: 52-250 (aprox. 200 líneas)
 # ============================================================================
 
@@ -208,29 +250,6 @@ def verificar_intentos_fallidos(username, ip_address):
     return False, intentos_fallidos
 
 
-def procesar_excel(archivo):
-    """Parsea Excel a lista de diccionarios. Filtra filas sin codigo_instrumento."""
-    wb = openpyxl.load_workbook(archivo)
-    sheet = wb.active
-    registros = []
-
-    headers = [cell.value for cell in sheet[1]]
-
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        registro = dict(zip(headers, row))
-        if registro.get("codigo_instrumento"):
-            registros.append(registro)
-
-    return registros
-
-
-def procesar_csv(archivo):
-    """Parsea CSV (UTF-8) a lista de diccionarios usando headers de primera fila."""
-    contenido = archivo.read().decode("utf-8")
-    reader = csv.DictReader(io.StringIO(contenido))
-    return list(reader)
-
-
 # ============================================================================
 # SECCIÓN 2: AUTENTICACIÓN Y SEGURIDAD
 # ============================================================================
@@ -435,6 +454,8 @@ def dashboard(request):
         - Requiere permiso: @requiere_permiso("consultar")
         - Charts implementados con Chart.js (CDN incluido en template)
         - Datos preparados para Doughnut chart (mercado) y Bar chart (cargas)
+        - GET condicional: ETag de _estado_dashboard; 304 sin calcular KPIs ni
+          renderizar (sin Last-Modified: ver utils/condicional)
     """
     from datetime import datetime
     from django.db.models import Count
@@ -443,6 +464,11 @@ def dashboard(request):
         f"Dashboard access - User: {request.user.username}, IP: {obtener_ip_cliente(request)}"
     )
 
+    etag, modificacion = validadores(request, *_estado_dashboard())
+    no_modificada = respuesta_condicional(request, etag, modificacion)
+    if no_modificada:
+        return no_modificada
+
     # ========== ZONA A: No requiere datos (solo enlaces estáticos) ==========
 
     # ========== ZONA B: KPIs y Datos de Charts ==========
@@ -556,7 +582,30 @@ def dashboard(request):
         "today": timezone.now(),
     }
 
-    return render(request, "calificaciones/dashboard.html", context)
+    response = render(request, "calificaciones/dashboard.html", context)
+    return agregar_validadores(response, etag, modificacion)
+
+
+def _estado_dashboard():
+    """
+    Validador del dashboard con consultas agregadas (MAX/COUNT): retorna las
+    partes del ETag. Cubre calificaciones, instrumentos, usuarios activos,
+    cargas, auditoría reciente y el día (gráfico de 7 días).
+    """
+    calificaciones = CalificacionTributaria.objects.aggregate(
+        activas=Count("id", filter=Q(activo=True)), max_id=Max("id"), modificacion=Max("fecha_modificacion")
+    )
+    instrumentos = InstrumentoFinanciero.objects.aggregate(
+        activos=Count("id", filter=Q(activo=True)), modificacion=Max("fecha_modificacion")
+    )
+    usuarios = User.objects.aggregate(activos=Count("id", filter=Q(is_active=True)), alta=Max("date_joined"))
+    cargas = CargaMasiva.objects.aggregate(n=Count("id"), ultima=Max("fecha_carga"))
+    logs = LogAuditoria.objects.aggregate(ultimo=Max("id"), fecha=Max("fecha_hora"))
+
+    return [
+        timezone.localdate(),
+        *calificaciones.values(), *instrumentos.values(), *usuarios.values(), *cargas.values(), *logs.values(),
+    ]
 
 
 # ============================================================================
@@ -584,7 +633,7 @@ def listar_calificaciones(request):
             - mercado (str): Filtro por tipo de mercado (ACN, CFI, FFM).
             - tipo_sociedad (str): Filtro por origen (A=Corredora, C=Bolsa).
             - ejercicio (int): Filtro por año de ejercicio comercial.
-            - codigo_instrumento (str): Filtro parcial por código (ICONTAINS).
+            - codigo_instrumento (str): Filtro parcial por código o nombre (ICONTAINS).
             - fecha_desde (str): Fecha mínima del informe (formato YYYY-MM-DD).
             - fecha_hasta (str): Fecha máxima del informe (formato YYYY-MM-DD).
             - numero_dj (str): Filtro parcial por número de DJ (ICONTAINS).
@@ -600,81 +649,49 @@ def listar_calificaciones(request):
         - Solo muestra registros con activo=True (borrado lógico)
         - Ordenado por fecha_creacion descendente (más recientes primero)
         - Paginación: 50 registros por página (optimización para CPU limitado)
-        - Query optimizado con select_related('instrumento', 'usuario_creador')
+        - Filtros y proyección de columnas de CalificacionQuery (compartidos con
+          las exportaciones); una consulta con select_related('instrumento') y only()
+        - GET condicional: ETag del conjunto filtrado (una consulta agregada que
+          también da el total del paginador); 304 sin renderizar (sin
+          Last-Modified: ver utils/condicional)
         - Template: 'calificaciones/listar.html' con sticky columns CSS
     """
-    # Base queryset con optimización de queries
-    calificaciones = CalificacionTributaria.objects.filter(activo=True).select_related(
-        "instrumento", "usuario_creador"
-    )
-
-    # NUEVOS FILTROS - Campos de metadata (Fase 3)
-    mercado = request.GET.get("mercado", "").strip()
-    tipo_sociedad = request.GET.get("tipo_sociedad", "").strip()
-    ejercicio = request.GET.get("ejercicio", "").strip()
-
-    if mercado:
-        calificaciones = calificaciones.filter(mercado__iexact=mercado)
-
-    if tipo_sociedad:
-        calificaciones = calificaciones.filter(tipo_sociedad__iexact=tipo_sociedad)
-
-    if ejercicio:
-        try:
-            ejercicio_int = int(ejercicio)
-            calificaciones = calificaciones.filter(ejercicio=ejercicio_int)
-        except ValueError:
-            logger.warning(f"Invalid ejercicio filter value: {ejercicio}")
-
-    # FILTROS EXISTENTES (compatibilidad legacy)
-    codigo_instrumento = request.GET.get("codigo_instrumento", "").strip()
-    fecha_desde = request.GET.get("fecha_desde", "").strip()
-    fecha_hasta = request.GET.get("fecha_hasta", "").strip()
-    numero_dj = request.GET.get("numero_dj", "").strip()
-
-    if codigo_instrumento:
-        calificaciones = calificaciones.filter(
-            instrumento__codigo_instrumento__icontains=codigo_instrumento
-        )
-
-    if fecha_desde:
-        calificaciones = calificaciones.filter(fecha_informe__gte=fecha_desde)
+    # Filtros compartidos con las exportaciones; solo las columnas que muestra la tabla
+    consulta = CalificacionQuery.desde_request(request)
+    filtros = consulta.filtros
 
-    if fecha_hasta:
-        calificaciones = calificaciones.filter(fecha_informe__lte=fecha_hasta)
-
-    if numero_dj:
-        calificaciones = calificaciones.filter(numero_dj__icontains=numero_dj)
-
-    # Ordenamiento
-    calificaciones = calificaciones.order_by("-fecha_creacion")
+    # Validador del conjunto filtrado: si el cliente tiene esta versión, 304 sin renderizar
+    estado = consulta.validador()
+    etag, modificacion = validadores(request, request.get_full_path(), *estado.values())
+    no_modificada = respuesta_condicional(request, etag, modificacion)
+    if no_modificada:
+        return no_modificada
 
     # PAGINACIÓN - Lado del servidor (50 registros por página para optimización de CPU)
-    paginator = Paginator(calificaciones, 50)
+    paginator = Paginator(consulta.para_listado(), 50)
+    paginator.count = estado["activas"]  # Ya contadas por el validador (sin COUNT aparte)
     page_number = request.GET.get("page", 1)
     page_obj = paginator.get_page(page_number)
 
     logger.info(
         f"Calificaciones list - User: {request.user.username}, "
         f"Total: {paginator.count}, Page: {page_number}/{paginator.num_pages}, "
-        f"Filters: mercado={mercado}, tipo_sociedad={tipo_sociedad}, ejercicio={ejercicio}"
+        f"Filters: mercado={filtros['mercado']}, tipo_sociedad={filtros['tipo_sociedad']}, "
+        f"ejercicio={filtros['ejercicio']}"
     )
 
     context = {
         "calificaciones": page_obj,  # Paginado
         "page_obj": page_obj,
-        # Filtros nuevos
-        "mercado": mercado,
-        "tipo_sociedad": tipo_sociedad,
-        "ejercicio": ejercicio,
-        # Filtros legacy
-        "codigo_instrumento": codigo_instrumento,
-        "fecha_desde": fecha_desde,
-        "fecha_hasta": fecha_hasta,
-        "numero_dj": numero_dj,
+        # Valores de los filtros (mercado, tipo_sociedad, ejercicio, codigo_instrumento,
+        # fecha_desde, fecha_hasta, numero_dj) para mantener el estado del formulario
+        **filtros,
+        # Mismos filtros para los enlaces de exportación
+        "filtros_query": consulta.querystring(),
     }
 
-    return render(request, "calificaciones/listar.html", context)
+    response = render(request, "calificaciones/listar.html", context)
+    return agregar_validadores(response, etag, modificacion)
 
 
 @login_required
@@ -1172,6 +1189,8 @@ def crear_instrumento(request):
         - Registra acción CREATE en LogAuditoria
         - Logging: INFO en creación exitosa con código y tipo
         - codigo_instrumento debe ser único (constraint en BD)
+        - codigo_instrumento vacío: save() lo genera con generar_codigos_unicos
+          (mismo generador que la carga masiva)
     """
     if request.method == "POST":
         form = InstrumentoFinancieroForm(request.POST)
@@ -1332,7 +1351,7 @@ def eliminar_instrumento(request, pk):
 # ============================================================================
 # SECCIÓN 6: OPERACIONES MASIVAS
 # ============================================================================
-# Funciones: carga_masiva, exportar_excel, exportar_csv
+# Funciones: carga_masiva, progreso_carga_masiva, exportar_excel, exportar_csv
 # Líneas: 861-1100 (aprox. 240 líneas)
 # ============================================================================
 
@@ -1352,21 +1371,31 @@ def carga_masiva(request):
 
     Retorna:
         HttpResponse:
-            - POST: Redirect a 'dashboard' después de procesar.
+            - POST: Redirect a 'carga_masiva' tras encolar (modo asíncrono) o a
+              'dashboard' después de procesar (modo síncrono).
             - GET: Render de 'calificaciones/carga_masiva.html' con formulario.
 
     Excepciones:
-        ValueError: Si el formato del archivo no es soportado (.xlsx, .csv).
+        ValueError: Si el formato del archivo no es soportado (.xlsx, .csv, .csv.gz).
         PermissionError: Si hay problemas de acceso al archivo.
         KeyError: Si faltan campos requeridos en las filas del archivo.
 
     Notas:
-        - Formatos soportados: .xlsx (Excel), .csv (UTF-8)
+        - Formatos soportados: .xlsx (Excel), .csv (UTF-8), .csv.gz (CSV comprimido)
         - Campos requeridos: codigo_instrumento, fecha_informe
         - Campos opcionales: nombre_instrumento, tipo_instrumento, monto, factor,
           metodo_ingreso, numero_dj, observaciones
         - Estados posibles: EXITOSO (0 errores), PARCIAL (algunos errores), FALLIDO (todos errores)
-        - Registra cada fila procesada en CargaMasiva con errores_detalle
+        - Registra los errores por fila en CargaMasivaError (ver errores_carga_masiva)
+        - Modo asíncrono (settings.CARGA_MASIVA_ASINCRONA): la vista solo guarda el
+          archivo y encola un TrabajoCarga; lo procesa `manage.py procesar_cargas`
+        - Avance consultable en JSON vía progreso_carga_masiva
+        - dry_run (simulación): valida parseo, prioridad y REGLA A/B sobre una
+          instantánea de solo lectura y muestra los contadores sin escribir nada
+        - Archivos duplicados (mismo SHA-256, ArchivoCargado) no se reprocesan: se
+          informa la carga original, salvo que esta haya quedado FALLIDA o REVERTIDA
+        - Las filas se confirman en transacciones de CARGA_MASIVA_FILAS_POR_COMMIT;
+          una carga interrumpida se continúa con reanudar_carga_masiva
         - Logging exhaustivo: INFO (inicio/fin), WARNING (errores por fila), ERROR (crítico)
         - Requiere permiso: @requiere_permiso("crear")
     """
@@ -1375,275 +1404,108 @@ def carga_masiva(request):
         if form.is_valid():
             archivo = request.FILES["archivo"]
 
+            if form.cleaned_data["dry_run"]:
+                # Simulación: mismo flujo sobre una instantánea de solo lectura, sin escribir
+                try:
+                    esquema, filas = leer_filas(archivo, archivo.name)
+                    colapsadas = filas_colapsadas(filas, esquema=esquema)
+                    archivo.seek(0)
+                    esquema, filas = leer_filas(archivo, archivo.name)
+                    simulacion = MotorCargaMasiva(usuario=request.user, simulacion=True).procesar(
+                        filas, colapsadas=colapsadas, esquema=esquema
+                    )
+                except Exception as e:
+                    logger.error(f"Bulk upload dry run failed - File: {archivo.name}, Error: {str(e)}")
+                    messages.error(request, f"Error al procesar archivo: {str(e)}")
+                    return redirect("carga_masiva")
+
+                logger.info(
+                    f"Bulk upload dry run - User: {request.user.username}, File: {archivo.name}, "
+                    f"Created: {simulacion.creados}, Updated: {simulacion.actualizados}, "
+                    f"Unchanged: {simulacion.sin_cambios}, Collapsed: {simulacion.colapsados}, "
+                    f"Skipped: {simulacion.omitidos}, "
+                    f"Failed: {simulacion.fallidos}"
+                )
+                cargas_anteriores = (
+                    CargaMasiva.objects.filter(usuario=request.user).defer('errores_detalle')
+                    .order_by('-fecha_carga')[:10]
+                )
+                return render(request, "calificaciones/carga_masiva.html", {
+                    "form": CargaMasivaForm(),
+                    "cargas_anteriores": cargas_anteriores,
+                    "simulacion": simulacion,
+                    "simulacion_archivo": archivo.name,
+                    "simulacion_errores": simulacion.errores[:MAX_ERRORES_SIMULACION],
+                })
+
             logger.info(
                 f"Bulk upload started - User: {request.user.username}, "
                 f"File: {archivo.name}, Size: {archivo.size} bytes"
             )
 
-            # Crear registro de carga
-            carga = CargaMasiva.objects.create(
-                usuario=request.user,
-                archivo_nombre=archivo.name,
-                archivo=archivo,
-                estado="PROCESANDO",
+            # Registrar carga (el archivo queda almacenado para el worker) salvo duplicado
+            trabajo, original = encolar_archivo(
+                archivo, request.user, ip_address=obtener_ip_cliente(request)
             )
-
-            try:
-                # Detectar tipo de archivo
-                if archivo.name.endswith(".xlsx"):
-                    logger.debug(f"Processing Excel file: {archivo.name}")
-                    registros = procesar_excel(archivo)
-                elif archivo.name.endswith(".csv"):
-                    logger.debug(f"Processing CSV file: {archivo.name}")
-                    registros = procesar_csv(archivo)
-                else:
-                    logger.error(f"Unsupported file format: {archivo.name}")
-                    raise ValueError("Formato de archivo no soportado")
-
-                # Procesar registros con lógica de UPDATE y reglas de prioridad
-                creados = 0
-                actualizados = 0
-                omitidos = 0
-                fallidos = 0
-                errores = []
-
-                for i, registro in enumerate(registros, start=1):
-                    try:
-                        # Buscar o crear instrumento
-                        instrumento, created = InstrumentoFinanciero.objects.get_or_create(
-                            codigo_instrumento=registro["codigo_instrumento"],
-                            defaults={
-                                "nombre_instrumento": registro.get("nombre_instrumento", ""),
-                                "tipo_instrumento": registro.get("tipo_instrumento", "Otro"),
-                            },
-                        )
-
-                        # Determinar origen del archivo actual (por defecto BOLSA)
-                        nuevo_origen = registro.get('origen', 'BOLSA').upper()
-                        if nuevo_origen not in ['BOLSA', 'CORREDORA', 'MANUAL']:
-                            nuevo_origen = 'BOLSA'
-
-                        # PASO 1: Intentar obtener registro existente
-                        try:
-                            obj = CalificacionTributaria.objects.get(
-                                instrumento=instrumento,
-                                fecha_informe=registro["fecha_informe"],
-                                numero_dj=registro.get("numero_dj", "")
-                            )
-                            
-                            # PASO 2: REGLA DE PRIORIDAD - CORREDORA > BOLSA
-                            # Si el registro existente es de CORREDORA y el nuevo es de BOLSA, NO actualizar
-                            is_existing_corredora = obj.origen == 'CORREDORA'
-                            is_new_bolsa = nuevo_origen == 'BOLSA'
-                            
-                            if is_existing_corredora and is_new_bolsa:
-                                omitidos += 1
-                                errores.append(
-                                    f"Fila {i}: OMITIDO - Registro existente de Corredora tiene prioridad sobre Bolsa. "
-                                    f"Instrumento: {instrumento.codigo_instrumento}, Fecha: {registro['fecha_informe']}"
-                                )
-                                logger.info(
-                                    f"Row {i} skipped due to priority rule: CORREDORA > BOLSA - "
-                                    f"Instrumento: {instrumento.codigo_instrumento}"
-                                )
-                                continue  # Saltar esta iteración
-                            
-                            # PASO 3: ACTUALIZAR REGISTRO (Si pasa regla de prioridad)
-                            # Actualizar metadata
-                            obj.usuario_creador = request.user
-                            obj.monto = Decimal(str(registro["monto"])) if registro.get("monto") else None
-                            obj.factor = Decimal(str(registro["factor"])) if registro.get("factor") else None
-                            obj.metodo_ingreso = registro.get("metodo_ingreso", "MONTO")
-                            obj.numero_dj = registro.get("numero_dj", "")
-                            obj.observaciones = registro.get("observaciones", "")
-                            obj.origen = nuevo_origen
-                            obj.fuente_origen = 'MASIVA'  # HDU 16: Marcar como carga masiva
-                            
-                            # Actualizar campos administrativos
-                            obj.secuencia = int(registro["secuencia"]) if registro.get("secuencia") else 0
-                            obj.numero_dividendo = int(registro["numero_dividendo"]) if registro.get("numero_dividendo") else 0
-                            obj.tipo_sociedad = registro.get("tipo_sociedad", None)
-                            obj.valor_historico = Decimal(str(registro["valor_historico"])) if registro.get("valor_historico") else Decimal('0')
-                            obj.mercado = registro.get("mercado", None)
-                            obj.ejercicio = int(registro["ejercicio"]) if registro.get("ejercicio") else 0
-                            
-                            # Actualizar dinámicamente todos los factores (8-37)
-                            for factor_num in range(8, 38):
-                                factor_key = f'factor_{factor_num}'
-                                if factor_key in registro and registro[factor_key]:
-                                    try:
-                                        setattr(obj, factor_key, Decimal(str(registro[factor_key])))
-                                    except (ValueError, TypeError):
-                                        setattr(obj, factor_key, Decimal('0'))
-                                else:
-                                    setattr(obj, factor_key, Decimal('0'))
-                            
-                            obj.save()
-                            actualizados += 1
-                            logger.info(
-                                f"Row {i} updated successfully - Instrumento: {instrumento.codigo_instrumento}, "
-                                f"Origen: {nuevo_origen}"
-                            )
-                        
-                        except CalificacionTributaria.DoesNotExist:
-                            # PASO 4: CREAR NUEVO REGISTRO (Si no existe)
-                            calificacion_data = {
-                                'instrumento': instrumento,
-                                'usuario_creador': request.user,
-                                'monto': Decimal(str(registro["monto"])) if registro.get("monto") else None,
-                                'factor': Decimal(str(registro["factor"])) if registro.get("factor") else None,
-                                'metodo_ingreso': registro.get("metodo_ingreso", "MONTO"),
-                                'numero_dj': registro.get("numero_dj", ""),
-                                'fecha_informe': registro["fecha_informe"],
-                                'observaciones': registro.get("observaciones", ""),
-                                'origen': nuevo_origen,
-                                'fuente_origen': 'MASIVA',  # HDU 16: Marcar como carga masiva
-                                # Campos metadata administrativos
-                                'secuencia': int(registro["secuencia"]) if registro.get("secuencia") else 0,
-                                'numero_dividendo': int(registro["numero_dividendo"]) if registro.get("numero_dividendo") else 0,
-                                'tipo_sociedad': registro.get("tipo_sociedad", None),
-                                'valor_historico': Decimal(str(registro["valor_historico"])) if registro.get("valor_historico") else Decimal('0'),
-                                'mercado': registro.get("mercado", None),
-                                'ejercicio': int(registro["ejercicio"]) if registro.get("ejercicio") else 0,
-                            }
-                            
-                            # Mapear dinámicamente todos los factores (8-37)
-                            for factor_num in range(8, 38):
-                                factor_key = f'factor_{factor_num}'
-                                if factor_key in registro and registro[factor_key]:
-                                    try:
-                                        calificacion_data[factor_key] = Decimal(str(registro[factor_key]))
-                                    except (ValueError, TypeError):
-                                        calificacion_data[factor_key] = Decimal('0')
-                                else:
-                                    calificacion_data[factor_key] = Decimal('0')
-                            
-                            CalificacionTributaria.objects.create(**calificacion_data)
-                            creados += 1
-                            logger.info(
-                                f"Row {i} created successfully - Instrumento: {instrumento.codigo_instrumento}, "
-                                f"Origen: {nuevo_origen}"
-                            )
-                    except ValidationError as e:
-                        # Captura errores de validación del modelo (ej: suma de factores > 1)
-                        fallidos += 1
-                        error_msg = e.message if hasattr(e, 'message') else str(e)
-                        errores.append(f"Fila {i}: {error_msg}")
-                        logger.warning(f"Bulk upload row {i} validation error: {e}")
-                    except IntegrityError as e:
-                        # Captura errores de integridad de base de datos
-                        fallidos += 1
-                        error_str = str(e).lower()
-                        # Detectar si es un error de duplicado por unique_together
-                        if 'unique' in error_str or 'duplicate' in error_str or 'already exists' in error_str:
-                            errores.append(f"Fila {i}: Error - Este registro ya existe en el sistema (Duplicado).")
-                            logger.warning(f"Bulk upload row {i} duplicate record: {e}")
-                        else:
-                            errores.append(f"Fila {i}: Error de integridad de datos - {str(e)}")
-                            logger.warning(f"Bulk upload row {i} integrity error: {e}")
-                    except KeyError as e:
-                        fallidos += 1
-                        errores.append(f"Fila {i}: Campo requerido faltante - {str(e)}")
-                        logger.warning(f"Bulk upload row {i} missing field: {e}")
-                    except ValueError as e:
-                        fallidos += 1
-                        errores.append(f"Fila {i}: Valor inválido - {str(e)}")
-                        logger.warning(f"Bulk upload row {i} invalid value: {e}")
-                    except Exception as e:
-                        # Captura cualquier otro error inesperado
-                        fallidos += 1
-                        errores.append(f"Fila {i}: {str(e)}")
-                        logger.error(f"Bulk upload row {i} unexpected error: {e}", exc_info=True)
-
-                # Calcular totales
-                exitosos = creados + actualizados
-                
-                # Actualizar registro de carga con estadísticas detalladas
-                carga.registros_procesados = len(registros)
-                carga.registros_exitosos = exitosos
-                carga.registros_fallidos = fallidos
-                carga.errores_detalle = "\n".join(errores) if errores else "Ningún error"
-
-                if fallidos == 0 and omitidos == 0:
-                    carga.estado = "EXITOSO"
-                    logger.info(
-                        f"Bulk upload completed successfully - User: {request.user.username}, "
-                        f"File: {archivo.name}, Created: {creados}, Updated: {actualizados}, Total: {exitosos}/{len(registros)}"
-                    )
-                elif exitosos > 0:
-                    carga.estado = "PARCIAL"
-                    logger.warning(
-                        f"Bulk upload partially completed - User: {request.user.username}, "
-                        f"File: {archivo.name}, Created: {creados}, Updated: {actualizados}, "
-                        f"Skipped: {omitidos}, Failed: {fallidos}"
-                    )
-                else:
-                    carga.estado = "FALLIDO"
-                    logger.error(
-                        f"Bulk upload failed completely - User: {request.user.username}, "
-                        f"File: {archivo.name}, Total records: {len(registros)}, Failed: {fallidos}"
-                    )
-
-                carga.save()
-
-                # Registrar en auditoría con detalles completos
-                ip_address = obtener_ip_cliente(request)
-                LogAuditoria.objects.create(
-                    usuario=request.user,
-                    accion="BULK_UPLOAD",
-                    tabla_afectada="CalificacionTributaria",
-                    registro_id=carga.id,
-                    ip_address=ip_address,
-                    detalles=(
-                        f"Carga masiva completada: {creados} creados, {actualizados} actualizados, "
-                        f"{omitidos} omitidos (prioridad), {fallidos} fallidos"
-                    ),
+            if original is not None:
+                messages.warning(
+                    request,
+                    f"♻️ El archivo {archivo.name} ya fue cargado el "
+                    f"{timezone.localtime(original.fecha_carga):%d/%m/%Y %H:%M} "
+                    f"(carga #{original.id}, estado {original.get_estado_display()}: "
+                    f"{original.registros_exitosos} exitosos, {original.registros_fallidos} fallidos). "
+                    f"No se volvió a procesar."
                 )
+                return redirect("carga_masiva")
+            carga = trabajo.carga
 
+            if settings.CARGA_MASIVA_ASINCRONA:
+                messages.info(
+                    request,
+                    f"📥 Archivo {archivo.name} recibido. Se está procesando en segundo plano; "
+                    f"el avance se muestra en el historial de cargas."
+                )
+                return redirect("carga_masiva")
+
+            # Modo síncrono (sin workers): procesar el trabajo dentro de la solicitud
+            trabajo = reclamar_trabajo(identificador_worker(), trabajo_id=trabajo.id)
+            if trabajo is None:
+                return _carga_en_otro_worker(request, carga)
+            resultado = ejecutar_trabajo(trabajo)
+            carga.refresh_from_db()
+
+            if resultado is None:
+                messages.error(request, f"Error al procesar archivo: {carga.errores_detalle}")
+            elif resultado.omitidos > 0:
                 # Mensaje de éxito con detalles
-                if omitidos > 0:
-                    messages.success(
-                        request,
-                        f"✅ Procesados {exitosos} registros correctamente ({creados} nuevos, {actualizados} actualizados). "
-                        f"⚠️ {omitidos} omitidos por regla de prioridad (Corredora > Bolsa). "
-                        f"❌ {fallidos} con errores."
-                    )
-                else:
-                    messages.success(
-                        request,
-                        f"✅ Procesados {exitosos} registros correctamente ({creados} nuevos, {actualizados} actualizados). "
-                        f"❌ {fallidos} con errores."
-                    )
-
-            except ValueError as e:
-                logger.error(f"File format error - File: {archivo.name}, Error: {str(e)}")
-                carga.estado = "FALLIDO"
-                carga.errores_detalle = f"Error de formato: {str(e)}"
-                carga.save()
-                messages.error(request, f"Error al procesar archivo: Formato inválido - {str(e)}")
-            except PermissionError as e:
-                logger.error(f"File access error - File: {archivo.name}, Error: {str(e)}")
-                carga.estado = "FALLIDO"
-                carga.errores_detalle = f"Error de acceso al archivo: {str(e)}"
-                carga.save()
-                messages.error(request, f"Error al acceder al archivo: {str(e)}")
-            except Exception as e:
-                logger.error(
-                    f"Critical error in bulk upload - User: {request.user.username}, "
-                    f"File: {archivo.name}, Error: {str(e)}",
-                    exc_info=True,
+                messages.success(
+                    request,
+                    f"✅ Procesados {resultado.exitosos} registros correctamente ({resultado.creados} nuevos, "
+                    f"{resultado.actualizados} actualizados, {resultado.sin_cambios} sin cambios). "
+                    f"🔁 {resultado.colapsados} repetidos en el archivo (prevalece otra fila con la misma clave). "
+                    f"⚠️ {resultado.omitidos} omitidos por regla de prioridad (Corredora > Bolsa). "
+                    f"❌ {resultado.fallidos} con errores."
+                )
+            else:
+                messages.success(
+                    request,
+                    f"✅ Procesados {resultado.exitosos} registros correctamente ({resultado.creados} nuevos, "
+                    f"{resultado.actualizados} actualizados, {resultado.sin_cambios} sin cambios). "
+                    f"🔁 {resultado.colapsados} repetidos en el archivo (prevalece otra fila con la misma clave). "
+                    f"❌ {resultado.fallidos} con errores."
                 )
-                carga.estado = "FALLIDO"
-                carga.errores_detalle = str(e)
-                carga.save()
-                messages.error(request, f"Error inesperado al procesar archivo: {str(e)}")
 
             return redirect("dashboard")
     else:
         form = CargaMasivaForm()
 
-    # Obtener historial de cargas recientes para mostrar en la plantilla
-    cargas_anteriores = CargaMasiva.objects.filter(usuario=request.user).order_by('-fecha_carga')[:10]
+    # Obtener historial de cargas recientes (sin el texto de errores: se consulta en errores_carga_masiva)
+    cargas_anteriores = (
+        CargaMasiva.objects.filter(usuario=request.user)
+        .defer('errores_detalle')
+        .annotate(filas_actualizadas=Sum('cambios__actualizados'))
+        .order_by('-fecha_carga')[:10]
+    )
 
     return render(request, "calificaciones/carga_masiva.html", {
         "form": form,
@@ -1651,6 +1513,373 @@ def carga_masiva(request):
     })
 
 
+@login_required
+@requiere_permiso("crear")
+def reanudar_carga_masiva(request, pk):
+    """
+    Reanuda una carga masiva FALLIDA desde su última fila confirmada (checkpoint).
+
+    Parámetros:
+        request (HttpRequest): Solicitud POST desde el historial de carga_masiva.html.
+        pk (int): ID de CargaMasiva.
+
+    Retorna:
+        HttpResponse: Redirect a 'carga_masiva' con el resultado de la operación.
+
+    Notas:
+        - Solo el usuario que subió el archivo (o un superusuario) puede reanudarla
+        - Las filas ya confirmadas no se vuelven a procesar; los contadores y errores
+          anteriores se conservan
+        - En modo síncrono (CARGA_MASIVA_ASINCRONA=False) se procesa dentro de la solicitud
+    """
+    if request.method != "POST":
+        return redirect("carga_masiva")
+
+    carga = _carga_del_usuario(request, pk)
+
+    trabajo = reanudar_carga(carga, ip_address=obtener_ip_cliente(request))
+    if trabajo is None:
+        messages.warning(request, f"La carga #{carga.id} no tiene un avance pendiente que reanudar.")
+        return redirect("carga_masiva")
+
+    logger.info(
+        f"Bulk upload resume requested - User: {request.user.username}, "
+        f"Carga: {carga.id}, From row: {carga.fila_checkpoint + 1}"
+    )
+
+    if settings.CARGA_MASIVA_ASINCRONA:
+        messages.info(
+            request,
+            f"🔁 La carga #{carga.id} continuará desde la fila {carga.fila_checkpoint + 1} en segundo plano."
+        )
+        return redirect("carga_masiva")
+
+    trabajo = reclamar_trabajo(identificador_worker(), trabajo_id=trabajo.id)
+    if trabajo is None:
+        return _carga_en_otro_worker(request, carga)
+    ejecutar_trabajo(trabajo)
+    carga.refresh_from_db()
+    if carga.estado == "FALLIDO":
+        messages.error(request, f"La carga #{carga.id} volvió a interrumpirse. Revise el detalle de errores.")
+    else:
+        messages.success(
+            request,
+            f"✅ Carga #{carga.id} completada: {carga.registros_exitosos} de "
+            f"{carga.registros_procesados} registros procesados correctamente."
+        )
+    return redirect("carga_masiva")
+
+
+@login_required
+@requiere_permiso("modificar")
+def revertir_carga_masiva(request, pk):
+    """
+    Revierte una carga masiva: restaura los valores previos de las calificaciones
+    que actualizó y elimina las que creó, a partir de sus changesets (CambioCarga).
+
+    Parámetros:
+        request (HttpRequest): Solicitud POST desde el historial de carga_masiva.html.
+        pk (int): ID de CargaMasiva.
+
+    Retorna:
+        HttpResponse: Redirect a 'carga_masiva' con el resultado de la operación.
+
+    Notas:
+        - Solo el usuario que subió el archivo (o un superusuario) puede revertirla
+        - Solo se puede revertir la última carga aplicada (las posteriores primero)
+        - Las calificaciones editadas después de la carga no se tocan (se informan)
+        - Elimina los instrumentos que creó la carga y quedaron sin calificaciones
+        - La carga queda en estado REVERTIDO; registra BULK_ROLLBACK en LogAuditoria
+    """
+    if request.method != "POST":
+        return redirect("carga_masiva")
+
+    carga = _carga_del_usuario(request, pk)
+    try:
+        reversion = revertir_carga(
+            carga, usuario=request.user, ip_address=obtener_ip_cliente(request)
+        )
+    except ReversionNoPermitida as e:
+        messages.warning(request, str(e))
+        return redirect("carga_masiva")
+
+    logger.info(f"Bulk upload rollback requested - User: {request.user.username}, Carga: {carga.id}")
+    mensaje = (
+        f"↩️ Carga #{carga.id} revertida: {reversion.restauradas} calificaciones restauradas, "
+        f"{reversion.eliminadas} eliminadas"
+    )
+    if reversion.instrumentos_eliminados:
+        mensaje += f", {reversion.instrumentos_eliminados} instrumentos eliminados"
+    messages.success(request, mensaje + ".")
+    if reversion.omitidas:
+        listadas = ", ".join(f"#{pk}" for pk in reversion.omitidas[:10])
+        messages.warning(
+            request,
+            f"⚠️ {len(reversion.omitidas)} calificaciones no se revirtieron porque fueron editadas "
+            f"después de la carga: {listadas}{'...' if len(reversion.omitidas) > 10 else ''}"
+        )
+    return redirect("carga_masiva")
+
+
+@login_required
+@requiere_permiso("consultar")
+def progreso_carga_masiva(request, pk):
+    """
+    Retorna en JSON el avance de una carga masiva encolada o en proceso.
+
+    Parámetros:
+        request (HttpRequest): Solicitud GET (usada por polling desde carga_masiva.html).
+        pk (int): ID de CargaMasiva.
+
+    Retorna:
+        JsonResponse:
+            {
+                "estado": "PROCESANDO",
+                "estado_trabajo": "EN_CURSO",
+                "filas_procesadas": 12000,
+                "filas_totales": 50000,
+                "porcentaje": 24.0,
+                "filas_por_segundo": 850.3,
+                "eta_segundos": 44.7,
+                "registros_exitosos": 0,
+                "registros_fallidos": 0
+            }
+
+    Notas:
+        - Solo el usuario que subió el archivo (o un superusuario) puede consultarlo
+        - filas_por_segundo y eta_segundos se calculan sobre el intento actual del worker
+    """
+    filtros = {"pk": pk}
+    if not request.user.is_superuser:
+        filtros["usuario"] = request.user
+    carga = get_object_or_404(CargaMasiva.objects.select_related("trabajo"), **filtros)
+
+    datos = {
+        "estado": carga.estado,
+        "estado_trabajo": None,
+        "filas_procesadas": carga.registros_procesados,
+        "filas_totales": carga.registros_procesados,
+        "porcentaje": 100.0 if carga.estado not in ("EN_COLA", "PROCESANDO") else 0.0,
+        "filas_por_segundo": 0.0,
+        "eta_segundos": None,
+        "registros_exitosos": carga.registros_exitosos,
+        "registros_fallidos": carga.registros_fallidos,
+    }
+
+    trabajo = getattr(carga, "trabajo", None)
+    if trabajo is not None:
+        datos["estado_trabajo"] = trabajo.estado
+        if carga.estado in ("EN_COLA", "PROCESANDO"):
+            eta = trabajo.eta_segundos()
+            datos.update({
+                "filas_procesadas": trabajo.filas_procesadas,
+                "filas_totales": trabajo.filas_totales,
+                "porcentaje": (
+                    round(100.0 * trabajo.filas_procesadas / trabajo.filas_totales, 1)
+                    if trabajo.filas_totales else 0.0
+                ),
+                "filas_por_segundo": round(trabajo.filas_por_segundo(), 1),
+                "eta_segundos": round(eta, 1) if eta is not None else None,
+            })
+
+    return JsonResponse(datos)
+
+
+def _carga_del_usuario(request, pk):
+    """CargaMasiva del usuario (cualquiera si es superusuario) o 404."""
+    filtros = {"pk": pk}
+    if not request.user.is_superuser:
+        filtros["usuario"] = request.user
+    return get_object_or_404(CargaMasiva, **filtros)
+
+
+def _carga_en_otro_worker(request, carga):
+    """
+    Modo síncrono: el trabajo de la carga ya lo reclamó un worker de la cola
+    (reclamar_trabajo retornó None). Redirige al historial, que muestra su avance.
+    """
+    logger.info(f"Bulk upload job already claimed by a worker - Carga: {carga.id}")
+    messages.info(
+        request,
+        f"⏳ La carga #{carga.id} ya se está procesando en segundo plano; "
+        f"el avance se muestra en el historial de cargas."
+    )
+    return redirect("carga_masiva")
+
+
+def _filtrar_errores_carga(request, carga):
+    """Aplica los filtros GET (codigo, columna, fila_desde, fila_hasta) a los errores de la carga."""
+    errores = carga.errores.all()
+    filtros = {
+        "codigo": request.GET.get("codigo", "").strip(),
+        "columna": request.GET.get("columna", "").strip(),
+        "fila_desde": request.GET.get("fila_desde", "").strip(),
+        "fila_hasta": request.GET.get("fila_hasta", "").strip(),
+    }
+
+    if filtros["codigo"]:
+        errores = errores.filter(codigo=filtros["codigo"])
+    if filtros["columna"]:
+        errores = errores.filter(columna=filtros["columna"])
+    for parametro, lookup in (("fila_desde", "fila__gte"), ("fila_hasta", "fila__lte")):
+        if filtros[parametro]:
+            try:
+                errores = errores.filter(**{lookup: int(filtros[parametro])})
+            except ValueError:
+                logger.warning(f"Invalid {parametro} filter value: {filtros[parametro]}")
+
+    return errores.order_by("fila", "id"), filtros
+
+
+def _lineas_csv(filas):
+    """
+    Genera el CSV de las filas (cuerpo de StreamingHttpResponse) en bloques de
+    hasta TAMANO_BLOQUE_CSV caracteres. La primera línea (encabezados) se
+    entrega sola, antes de leer el resto de las filas.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    filas = iter(filas)
+    for fila in filas:
+        writer.writerow(fila)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        break
+    for fila in filas:
+        writer.writerow(fila)
+        if buffer.tell() >= TAMANO_BLOQUE_CSV:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@login_required
+@requiere_permiso("consultar")
+def errores_carga_masiva(request, pk):
+    """
+    Detalle paginado y filtrable de los errores por fila de una carga masiva.
+
+    Parámetros:
+        request (HttpRequest): GET con filtros opcionales:
+            - codigo (str): Código de error (CargaMasivaError.CODIGOS).
+            - columna (str): Columna del archivo (ej: factor_8).
+            - fila_desde / fila_hasta (int): Rango de filas del archivo.
+            - page (int): Número de página.
+        pk (int): ID de CargaMasiva.
+
+    Retorna:
+        HttpResponse: Render de 'calificaciones/carga_masiva_errores.html' con:
+            - carga: CargaMasiva (incluye el resumen errores_detalle)
+            - page_obj: Página de CargaMasivaError
+            - conteo_codigos: Total de errores por código (sin filtros)
+            - Filtros aplicados para mantener estado
+
+    Notas:
+        - Solo el usuario que subió el archivo (o un superusuario) puede consultarlo
+        - Paginación: ERRORES_CARGA_POR_PAGINA errores por página
+        - Los rechazos completos se descargan con exportar_errores_carga_masiva
+    """
+    carga = _carga_del_usuario(request, pk)
+    errores, filtros = _filtrar_errores_carga(request, carga)
+
+    paginator = Paginator(errores, ERRORES_CARGA_POR_PAGINA)
+    page_obj = paginator.get_page(request.GET.get("page", 1))
+
+    etiquetas = dict(CargaMasivaError.CODIGOS)
+    conteo_codigos = [
+        {"codigo": item["codigo"], "etiqueta": etiquetas.get(item["codigo"], item["codigo"]), "total": item["total"]}
+        for item in carga.errores.values("codigo").annotate(total=Count("id")).order_by("codigo")
+    ]
+
+    return render(request, "calificaciones/carga_masiva_errores.html", {
+        "carga": carga,
+        "page_obj": page_obj,
+        "conteo_codigos": conteo_codigos,
+        "codigos": CargaMasivaError.CODIGOS,
+        **filtros,
+    })
+
+
+@login_required
+@requiere_permiso("consultar")
+def exportar_errores_carga_masiva(request, pk):
+    """
+    Descarga en CSV los errores por fila de una carga masiva (mismos filtros que
+    errores_carga_masiva), generado en streaming para no cargar todo en memoria.
+
+    Retorna:
+        StreamingHttpResponse: CSV con columnas Fila, Columna, Código, Mensaje.
+    """
+    carga = _carga_del_usuario(request, pk)
+    errores, filtros = _filtrar_errores_carga(request, carga)
+
+    logger.info(
+        f"Bulk upload errors export - User: {request.user.username}, Carga: {carga.id}, "
+        f"Filters: codigo={filtros['codigo']}, columna={filtros['columna']}"
+    )
+
+    filas = errores.values_list("fila", "columna", "codigo", "mensaje").iterator(chunk_size=2000)
+    response = StreamingHttpResponse(
+        _lineas_csv(chain([["Fila", "Columna", "Código", "Mensaje"]], filas)),
+        content_type="text/csv; charset=utf-8",
+    )
+    response["Content-Disposition"] = f'attachment; filename=errores_carga_{carga.id}.csv'
+    return response
+
+
+@login_required
+@requiere_permiso("consultar")
+def exportar_diferencias_carga_masiva(request, pk):
+    """
+    Descarga el reporte de diferencias de una carga masiva: qué campos cambió
+    en cada calificación que actualizó (calculado por el motor al escribir cada
+    bloque y guardado en sus changesets, CambioCarga).
+
+    Parámetros:
+        request (HttpRequest): Solicitud GET desde el historial de carga_masiva.html.
+        pk (int): ID de CargaMasiva.
+
+    Retorna:
+        HttpResponse: Excel (.xlsx) con dos hojas:
+            - Resumen: Campo, Filas modificadas
+            - Detalle: Fila, ID Calificación, Campo, Valor anterior, Valor nuevo
+
+    Notas:
+        - Solo el usuario que subió el archivo (o un superusuario) puede descargarlo
+        - Libro write_only de openpyxl: el detalle se escribe por changeset
+        - Una carga revertida conserva su reporte
+    """
+    carga = _carga_del_usuario(request, pk)
+
+    wb = openpyxl.Workbook(write_only=True)
+    resumen = wb.create_sheet("Resumen")
+    resumen.append(["Campo", "Filas modificadas"])
+    for campo, total in conteo_diferencias(carga):
+        resumen.append([campo, total])
+
+    detalle = wb.create_sheet("Detalle")
+    detalle.append(["Fila", "ID Calificación", "Campo", "Valor anterior", "Valor nuevo"])
+    total_diferencias = 0
+    for diferencia in iterar_diferencias(carga):
+        detalle.append(list(diferencia))
+        total_diferencias += 1
+
+    logger.info(
+        f"Bulk upload diff export - User: {request.user.username}, Carga: {carga.id}, "
+        f"Changes: {total_diferencias}"
+    )
+
+    response = HttpResponse(
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    response["Content-Disposition"] = f'attachment; filename=diferencias_carga_{carga.id}.xlsx'
+    wb.save(response)
+    return response
+
+
 @login_required
 @requiere_permiso("crear")
 def descargar_plantilla(request, formato='xlsx'):
@@ -1743,6 +1972,78 @@ def descargar_plantilla(request, formato='xlsx'):
     return response
 
 
+def _respuesta_exportacion(request, trabajo):
+    """
+    Envía el archivo de un TrabajoExportacion COMPLETADO por bloques de
+    TAMANO_BLOQUE_ARCHIVO, lo marca como usado (LRU) y registra la descarga en auditoría.
+    Si el cliente ya tiene ese mismo archivo (ETag = clave y fecha de generación,
+    Last-Modified = fecha de generación) responde 304 sin enviarlo ni auditar.
+    """
+    etag, modificacion = validadores(
+        request, trabajo.clave, trabajo.fecha_fin.isoformat(),
+        ultima_modificacion=trabajo.fecha_fin, personal=False, debil=False,
+    )
+    no_modificada = respuesta_condicional(request, etag, modificacion)
+    if no_modificada:
+        return no_modificada
+
+    registrar_acceso(trabajo)
+    formato = trabajo.get_formato_display()
+    logger.info(
+        f"{formato} export downloaded - User: {request.user.username}, Trabajo: {trabajo.id}, "
+        f"Records: {trabajo.filas_exportadas}, Downloads: {trabajo.descargas}"
+    )
+    LogAuditoria.objects.create(
+        usuario=request.user,
+        accion="READ",
+        tabla_afectada="CalificacionTributaria",
+        ip_address=obtener_ip_cliente(request),
+        detalles=f"Exportación {formato}: {trabajo.filas_exportadas} registros con filtros aplicados",
+    )
+
+    timestamp = timezone.localtime(trabajo.fecha_fin).strftime("%Y%m%d_%H%M%S")
+    extension = EXTENSIONES[trabajo.formato]
+    response = FileResponse(
+        trabajo.archivo.open("rb"),
+        as_attachment=True,
+        filename=f"calificaciones_{timestamp}.{extension}",
+        content_type=CONTENT_TYPES_EXPORTACION[trabajo.formato],
+    )
+    response.block_size = TAMANO_BLOQUE_ARCHIVO
+    return agregar_validadores(response, etag, modificacion)
+
+
+def _exportar(request, formato):
+    """
+    Cuerpo de exportar_excel y exportar_csv: envía el archivo si ya existe para
+    los filtros y los datos actuales; si no, encola su generación (o la ejecuta
+    dentro de la solicitud si EXPORTACION_ASINCRONA=False).
+    """
+    # Filtros compartidos con listar_calificaciones
+    consulta = CalificacionQuery.desde_request(request)
+    filtros = consulta.filtros
+
+    trabajo, disponible = solicitar_exportacion(consulta, formato, request.user)
+    logger.info(
+        f"Export requested - User: {request.user.username}, Format: {formato}, "
+        f"Trabajo: {trabajo.id}, Cached: {disponible}, "
+        f"Filters: mercado={filtros['mercado']}, tipo_sociedad={filtros['tipo_sociedad']}, "
+        f"ejercicio={filtros['ejercicio']}"
+    )
+    if disponible:
+        return _respuesta_exportacion(request, trabajo)
+
+    if not settings.EXPORTACION_ASINCRONA:
+        # Modo síncrono (sin workers): generar el archivo dentro de la solicitud
+        reclamado = reclamar_exportacion(identificador_worker(), trabajo_id=trabajo.id)
+        if reclamado is not None and ejecutar_exportacion(reclamado) is not None:
+            return _respuesta_exportacion(request, reclamado)
+        trabajo.refresh_from_db()
+
+    # En cola o generándose (para esta u otra solicitud idéntica): la página consulta el avance
+    return render(request, "calificaciones/exportacion.html", {"trabajo": trabajo}, status=202)
+
+
 @login_required
 @requiere_permiso("consultar")
 def exportar_excel(request):
@@ -1759,142 +2060,29 @@ def exportar_excel(request):
             - tipo_sociedad: A (Corredora), C (Bolsa)
             - ejercicio: Año (int)
             - numero_dj: Número de DJ
+            - fecha_desde / fecha_hasta: Rango de fecha del informe (YYYY-MM-DD)
 
     Retorna:
-        HttpResponse: Archivo Excel descargable con:
-            - Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet
-            - Filename: calificaciones_YYYYMMDD_HHMMSS.xlsx
-            - Columnas: 41+ campos (ID, Instrumento, Metadata, 30 Factores, Observaciones)
+        HttpResponse:
+            - FileResponse con el archivo Excel si ya está generado:
+              Content-Type application/vnd.openxmlformats-officedocument.spreadsheetml.sheet,
+              filename calificaciones_YYYYMMDD_HHMMSS.xlsx (fecha de generación),
+              41+ columnas (ID, Instrumento, Metadata, 30 Factores, Observaciones)
+            - 202 con 'calificaciones/exportacion.html' mientras se genera
 
     Notas:
         - Requiere permiso: 'consultar'
-        - Librería: openpyxl
+        - Librería: openpyxl (modo solo escritura)
         - Solo exporta registros activos (activo=True)
-        - Aplica mismos filtros que listar_calificaciones
-        - Query optimizado con select_related('instrumento', 'usuario_creador')
+        - Aplica mismos filtros que listar_calificaciones (CalificacionQuery)
+        - El archivo lo genera un worker (manage.py procesar_exportaciones) y se
+          reutiliza para solicitudes idénticas mientras los datos no cambien
+          (utils/cola_exportaciones); con EXPORTACION_ASINCRONA=False se genera
+          dentro de la solicitud
+        - GET condicional: 304 si el cliente ya tiene el archivo (ETag / Last-Modified)
+        - Más de MAX_FILAS_HOJA_EXCEL filas se reparten en varias hojas
     """
-    # Aplicar filtros (misma lógica que listar_calificaciones)
-    calificaciones = CalificacionTributaria.objects.filter(activo=True).select_related(
-        "instrumento", "usuario_creador"
-    )
-
-    # FILTROS PRINCIPALES
-    mercado = request.GET.get("mercado", "").strip()
-    tipo_sociedad = request.GET.get("tipo_sociedad", "").strip()
-    ejercicio = request.GET.get("ejercicio", "").strip()
-    codigo_instrumento = request.GET.get("codigo_instrumento", "").strip()
-    numero_dj = request.GET.get("numero_dj", "").strip()
-
-    if mercado:
-        calificaciones = calificaciones.filter(mercado__iexact=mercado)
-    
-    if tipo_sociedad:
-        calificaciones = calificaciones.filter(tipo_sociedad__iexact=tipo_sociedad)
-    
-    if ejercicio:
-        try:
-            ejercicio_int = int(ejercicio)
-            calificaciones = calificaciones.filter(ejercicio=ejercicio_int)
-        except ValueError:
-            pass
-    
-    if codigo_instrumento:
-        calificaciones = calificaciones.filter(
-            Q(instrumento__codigo_instrumento__icontains=codigo_instrumento) |
-            Q(instrumento__nombre_instrumento__icontains=codigo_instrumento)
-        )
-    
-    if numero_dj:
-        calificaciones = calificaciones.filter(numero_dj__icontains=numero_dj)
-
-    logger.info(
-        f"Excel export - User: {request.user.username}, Records: {calificaciones.count()}, "
-        f"Filters: mercado={mercado}, tipo_sociedad={tipo_sociedad}, ejercicio={ejercicio}"
-    )
-
-    # Crear libro de Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Calificaciones"
-
-    # Encabezados dinámicos con 30 factores
-    headers = [
-        "ID",
-        "Código Instrumento",
-        "Nombre Instrumento",
-        "Fecha Informe",
-        "Mercado",
-        "Secuencia",
-        "Origen (Tipo Soc)",
-        "N° DJ",
-        "Ejercicio",
-        "Valor Histórico",
-        "Monto",
-    ]
-    
-    # Agregar headers de 30 factores dinámicamente
-    for i in range(8, 38):
-        headers.append(f"Factor {i}")
-    
-    headers.extend([
-        "Método Ingreso",
-        "Usuario Creador",
-        "Fecha Creación",
-        "Observaciones"
-    ])
-    
-    ws.append(headers)
-
-    # Datos
-    for cal in calificaciones:
-        row = [
-            cal.id,
-            cal.instrumento.codigo_instrumento,
-            cal.instrumento.nombre_instrumento,
-            cal.fecha_informe.strftime("%Y-%m-%d") if cal.fecha_informe else "",
-            cal.mercado or "",
-            cal.secuencia if cal.secuencia else "",
-            cal.tipo_sociedad or "",
-            cal.numero_dj,
-            cal.ejercicio if cal.ejercicio else "",
-            float(cal.valor_historico) if cal.valor_historico else None,
-            float(cal.monto) if cal.monto else None,
-        ]
-        
-        # Agregar 30 factores dinámicamente
-        for i in range(8, 38):
-            factor_value = getattr(cal, f"factor_{i}", None)
-            row.append(float(factor_value) if factor_value else None)
-        
-        row.extend([
-            cal.metodo_ingreso or "",
-            cal.usuario_creador.username if cal.usuario_creador else "",
-            cal.fecha_creacion.strftime("%Y-%m-%d %H:%M:%S") if cal.fecha_creacion else "",
-            cal.observaciones or "",
-        ])
-        
-        ws.append(row)
-
-    # Preparar respuesta
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    timestamp = timezone.now().strftime("%Y%m%d_%H%M%S")
-    response["Content-Disposition"] = f'attachment; filename=calificaciones_{timestamp}.xlsx'
-
-    wb.save(response)
-
-    # Registrar en auditoría
-    ip_address = obtener_ip_cliente(request)
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        accion="READ",
-        tabla_afectada="CalificacionTributaria",
-        ip_address=ip_address,
-        detalles=f"Exportación Excel: {calificaciones.count()} registros con filtros aplicados",
-    )
-
-    return response
+    return _exportar(request, "XLSX")
 
 
 @login_required
@@ -1913,136 +2101,76 @@ def exportar_csv(request):
             - tipo_sociedad: A (Corredora), C (Bolsa)
             - ejercicio: Año (int)
             - numero_dj: Número de DJ
+            - fecha_desde / fecha_hasta: Rango de fecha del informe (YYYY-MM-DD)
 
     Retorna:
-        HttpResponse: Archivo CSV descargable con:
-            - Content-Type: text/csv
-            - Encoding: UTF-8 (compatible con caracteres especiales)
-            - Filename: calificaciones_YYYYMMDD_HHMMSS.csv
-            - Columnas: 41+ campos (ID, Instrumento, Metadata, 30 Factores, Observaciones)
+        HttpResponse:
+            - FileResponse con el archivo CSV si ya está generado:
+              Content-Type text/csv, UTF-8, filename calificaciones_YYYYMMDD_HHMMSS.csv,
+              41+ columnas (ID, Instrumento, Metadata, 30 Factores, Observaciones)
+            - 202 con 'calificaciones/exportacion.html' mientras se genera
 
     Notas:
         - Requiere permiso: 'consultar'
         - Librería: csv (stdlib)
         - Solo exporta registros activos (activo=True)
-        - Aplica mismos filtros que listar_calificaciones
-        - Query optimizado con select_related('instrumento', 'usuario_creador')
+        - Aplica mismos filtros que listar_calificaciones (CalificacionQuery)
+        - Misma cola y cache de archivos (y GET condicional) que exportar_excel
         - Separador: coma (,)
     """
-    # Aplicar filtros (misma lógica que listar_calificaciones)
-    calificaciones = CalificacionTributaria.objects.filter(activo=True).select_related(
-        "instrumento", "usuario_creador"
-    )
+    return _exportar(request, "CSV")
 
-    # FILTROS PRINCIPALES
-    mercado = request.GET.get("mercado", "").strip()
-    tipo_sociedad = request.GET.get("tipo_sociedad", "").strip()
-    ejercicio = request.GET.get("ejercicio", "").strip()
-    codigo_instrumento = request.GET.get("codigo_instrumento", "").strip()
-    numero_dj = request.GET.get("numero_dj", "").strip()
 
-    if mercado:
-        calificaciones = calificaciones.filter(mercado__iexact=mercado)
-    
-    if tipo_sociedad:
-        calificaciones = calificaciones.filter(tipo_sociedad__iexact=tipo_sociedad)
-    
-    if ejercicio:
-        try:
-            ejercicio_int = int(ejercicio)
-            calificaciones = calificaciones.filter(ejercicio=ejercicio_int)
-        except ValueError:
-            pass
-    
-    if codigo_instrumento:
-        calificaciones = calificaciones.filter(
-            Q(instrumento__codigo_instrumento__icontains=codigo_instrumento) |
-            Q(instrumento__nombre_instrumento__icontains=codigo_instrumento)
-        )
-    
-    if numero_dj:
-        calificaciones = calificaciones.filter(numero_dj__icontains=numero_dj)
+@login_required
+@requiere_permiso("consultar")
+def progreso_exportacion(request, pk):
+    """
+    Retorna en JSON el estado de un trabajo de exportación.
 
-    logger.info(
-        f"CSV export - User: {request.user.username}, Records: {calificaciones.count()}, "
-        f"Filters: mercado={mercado}, tipo_sociedad={tipo_sociedad}, ejercicio={ejercicio}"
-    )
+    Parámetros:
+        request (HttpRequest): Solicitud GET (polling desde exportacion.html).
+        pk (int): ID de TrabajoExportacion.
 
-    response = HttpResponse(content_type="text/csv")
-    timestamp = timezone.now().strftime("%Y%m%d_%H%M%S")
-    response["Content-Disposition"] = f'attachment; filename=calificaciones_{timestamp}.csv'
+    Retorna:
+        JsonResponse:
+            {
+                "estado": "EN_CURSO",
+                "filas_exportadas": 12000,
+                "url_descarga": null
+            }
 
-    writer = csv.writer(response)
-    
-    # Encabezados dinámicos con 30 factores
-    headers = [
-        "ID",
-        "Código Instrumento",
-        "Nombre Instrumento",
-        "Fecha Informe",
-        "Mercado",
-        "Secuencia",
-        "Origen (Tipo Soc)",
-        "N° DJ",
-        "Ejercicio",
-        "Valor Histórico",
-        "Monto",
-    ]
-    
-    # Agregar headers de 30 factores dinámicamente
-    for i in range(8, 38):
-        headers.append(f"Factor {i}")
-    
-    headers.extend([
-        "Método Ingreso",
-        "Usuario Creador",
-        "Fecha Creación",
-        "Observaciones"
-    ])
-    
-    writer.writerow(headers)
-
-    # Datos
-    for cal in calificaciones:
-        row = [
-            cal.id,
-            cal.instrumento.codigo_instrumento,
-            cal.instrumento.nombre_instrumento,
-            cal.fecha_informe.strftime("%Y-%m-%d") if cal.fecha_informe else "",
-            cal.mercado or "",
-            cal.secuencia if cal.secuencia else "",
-            cal.tipo_sociedad or "",
-            cal.numero_dj,
-            cal.ejercicio if cal.ejercicio else "",
-            cal.valor_historico if cal.valor_historico else "",
-            cal.monto if cal.monto else "",
-        ]
-        
-        # Agregar 30 factores dinámicamente
-        for i in range(8, 38):
-            factor_value = getattr(cal, f"factor_{i}", None)
-            row.append(factor_value if factor_value else "")
-        
-        row.extend([
-            cal.metodo_ingreso or "",
-            cal.usuario_creador.username if cal.usuario_creador else "",
-            cal.fecha_creacion.strftime("%Y-%m-%d %H:%M:%S") if cal.fecha_creacion else "",
-            cal.observaciones or "",
-        ])
-        
-        writer.writerow(row)
+    Notas:
+        - url_descarga solo se informa cuando el archivo está disponible
+        - Los archivos no son personales: cualquier usuario con permiso
+          'consultar' puede ver los mismos datos desde el listado
+    """
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk)
+    disponible = archivo_disponible(trabajo)
+    return JsonResponse({
+        "estado": trabajo.estado,
+        "filas_exportadas": trabajo.filas_exportadas,
+        "url_descarga": reverse("descargar_exportacion", args=[trabajo.pk]) if disponible else None,
+    })
 
-    # Registrar en auditoría
-    ip_address = obtener_ip_cliente(request)
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        accion="READ",
-        tabla_afectada="CalificacionTributaria",
-        ip_address=ip_address,
-        detalles=f"Exportación CSV: {calificaciones.count()} registros con filtros aplicados",
-    )
 
-    return response
+@login_required
+@requiere_permiso("consultar")
+def descargar_exportacion(request, pk):
+    """
+    Descarga el archivo de un trabajo de exportación COMPLETADO.
+
+    Parámetros:
+        request (HttpRequest): Solicitud GET (redirección desde exportacion.html).
+        pk (int): ID de TrabajoExportacion.
+
+    Retorna:
+        FileResponse: El archivo generado, o 404 si aún no existe o ya fue descartado
+        (en ese caso se vuelve a solicitar desde el listado).
+    """
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk)
+    if not archivo_disponible(trabajo):
+        raise Http404("La exportación no está disponible")
+    return _respuesta_exportacion(request, trabajo)
 
 
 # ============================================================================
@@ -2609,7 +2737,7 @@ def admin_panel(request):
     
     roles = Rol.objects.all().order_by('nombre_rol')
     
-    cargas_masivas = CargaMasiva.objects.select_related('usuario').order_by('-fecha_carga')[:20]
+    cargas_masivas = CargaMasiva.objects.select_related('usuario').defer('errores_detalle').order_by('-fecha_carga')[:20]
     
     # Últimos registros de auditoría
     recent_logs = LogAuditoria.objects.select_related('usuario').order_by('-fecha_hora')[:50]
@@ -150,6 +150,35 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Carga masiva: True = la vista encola el archivo y lo procesa un worker
+# (python manage.py procesar_cargas); False = se procesa dentro de la solicitud
+CARGA_MASIVA_ASINCRONA = env.bool('CARGA_MASIVA_ASINCRONA', default=True)
+
+# Procesos para parsear/validar archivos grandes en paralelo (1 = sin paralelismo)
+CARGA_MASIVA_PROCESOS = env.int('CARGA_MASIVA_PROCESOS', default=1)
+
+# Filas confirmadas por transacción en carga masiva; el avance (checkpoint) se
+# guarda en la misma transacción y permite reanudar una carga interrumpida
+CARGA_MASIVA_FILAS_POR_COMMIT = env.int('CARGA_MASIVA_FILAS_POR_COMMIT', default=5000)
+
+# Escribe cada lote de carga masiva vía tabla temporal (COPY en PostgreSQL) y
+# upsert INSERT ... ON CONFLICT en lugar de bulk_create / bulk_update
+CARGA_MASIVA_STAGING = env.bool('CARGA_MASIVA_STAGING', default=False)
+
+# Log de carga masiva: una línea de resumen por lote y una de cada N filas
+# exitosas en INFO (todas en DEBUG; 0 = solo el resumen). CARGA_MASIVA_LOG_COLA:
+# en el worker (procesar_cargas) el log de la ingesta pasa por un QueueHandler y
+# se escribe desde un hilo en segundo plano
+CARGA_MASIVA_LOG_MUESTREO = env.int('CARGA_MASIVA_LOG_MUESTREO', default=100)
+CARGA_MASIVA_LOG_COLA = env.bool('CARGA_MASIVA_LOG_COLA', default=False)
+
+# Exportaciones: True = la vista encola el archivo y lo genera un worker
+# (python manage.py procesar_exportaciones); False = se genera dentro de la solicitud.
+# Los archivos quedan en MEDIA_ROOT/exportaciones/ y se reutilizan mientras los
+# datos no cambien; sobre EXPORTACION_CACHE_MAX_MB se descartan los menos usados
+EXPORTACION_ASINCRONA = env.bool('EXPORTACION_ASINCRONA', default=True)
+EXPORTACION_CACHE_MAX_MB = env.int('EXPORTACION_CACHE_MAX_MB', default=1024)
+
 # Redirección después del inicio de sesión
 LOGIN_REDIRECT_URL = '/'
 LOGIN_URL = 'login'
@@ -0,0 +1,129 @@
+"""
+Micro-benchmark de la conversión por fila de la carga masiva.
+
+Compara el costo por fila (µs) de convertir los valores de una fila de
+40 columnas entre:
+- Diccionario: registro header -> valor y una búsqueda por campo con
+  claves factor_N armadas en cada fila (conversión anterior,
+  valores_desde_registro)
+- Esquema: EsquemaCarga construido una vez por archivo, convertidores
+  precompilados por índice de columna sobre la fila cruda
+
+Uso:
+    python scripts/benchmark_conversion.py [filas]
+    python scripts/benchmark_conversion.py 200000
+"""
+
+import os
+import sys
+import time
+from decimal import Decimal
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+import django
+django.setup()
+
+from calificaciones.utils.esquema_carga import EsquemaCarga
+
+FILAS_POR_DEFECTO = 100000
+REPETICIONES = 3
+HEADERS = (
+    ['codigo_instrumento', 'nombre_instrumento', 'fecha_informe', 'origen', 'mercado',
+     'tipo_sociedad', 'secuencia', 'numero_dividendo', 'ejercicio', 'numero_dj']
+    + [f'factor_{i}' for i in range(8, 38)]
+)
+
+
+def _decimal_o_none(registro, campo):
+    return Decimal(str(registro[campo])) if registro.get(campo) else None
+
+
+def _entero_o_cero(registro, campo):
+    return int(registro[campo]) if registro.get(campo) else 0
+
+
+def valores_diccionario(registro):
+    """Conversión anterior (valores_desde_registro): búsquedas por nombre en el diccionario."""
+    valores = {
+        'monto': _decimal_o_none(registro, 'monto'),
+        'factor': _decimal_o_none(registro, 'factor'),
+        'metodo_ingreso': registro.get("metodo_ingreso", "MONTO"),
+        'numero_dj': registro.get("numero_dj", ""),
+        'observaciones': registro.get("observaciones", ""),
+        'secuencia': _entero_o_cero(registro, 'secuencia'),
+        'numero_dividendo': _entero_o_cero(registro, 'numero_dividendo'),
+        'tipo_sociedad': registro.get("tipo_sociedad", None),
+        'valor_historico': (
+            Decimal(str(registro["valor_historico"])) if registro.get("valor_historico") else Decimal('0')
+        ),
+        'mercado': registro.get("mercado", None),
+        'ejercicio': _entero_o_cero(registro, 'ejercicio'),
+    }
+    for factor_num in range(8, 38):
+        factor_key = f'factor_{factor_num}'
+        if factor_key in registro and registro[factor_key]:
+            try:
+                valores[factor_key] = Decimal(str(registro[factor_key]))
+            except (ValueError, TypeError):
+                valores[factor_key] = Decimal('0')
+        else:
+            valores[factor_key] = Decimal('0')
+    return valores
+
+
+def generar_filas(filas):
+    """Filas crudas como las entrega el lector CSV (todas las celdas como texto)."""
+    factores = ['0.05', '0.1', '0.15'] + ['0'] * 27
+    return [
+        [f'INST{i % 500:04d}', 'Instrumento', '2025-01-15', 'BOLSA', 'ACN',
+         'A', '1', '0', '2025', str(i + 1)] + factores
+        for i in range(filas)
+    ]
+
+
+def conversion_diccionario(filas):
+    for fila in filas:
+        valores_diccionario(dict(zip(HEADERS, fila)))
+
+
+def conversion_esquema(filas):
+    esquema = EsquemaCarga(HEADERS)
+    for fila in filas:
+        esquema.valores(fila)
+
+
+def medir(funcion, filas):
+    """Mejor tiempo de REPETICIONES ejecuciones, en µs por fila."""
+    mejor = min(_cronometrar(funcion, filas) for _ in range(REPETICIONES))
+    return mejor / len(filas) * 1e6
+
+
+def _cronometrar(funcion, filas):
+    inicio = time.perf_counter()
+    funcion(filas)
+    return time.perf_counter() - inicio
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else FILAS_POR_DEFECTO
+    filas = generar_filas(total)
+
+    print(f"\n{'='*50}")
+    print(f"BENCHMARK DE CONVERSIÓN POR FILA ({total} filas)")
+    print(f"{'='*50}")
+    print(f"{'Modo':<12} | {'µs / fila':>10}")
+    print(f"{'-'*50}")
+
+    antes = medir(conversion_diccionario, filas)
+    despues = medir(conversion_esquema, filas)
+    print(f"{'diccionario':<12} | {antes:>10.2f}")
+    print(f"{'esquema':<12} | {despues:>10.2f}")
+    print(f"{'-'*50}")
+    print(f"Mejora: {antes / despues:.1f}x")
+    print(f"{'='*50}\n")
+
+
+if __name__ == '__main__':
+    main()
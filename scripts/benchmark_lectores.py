@@ -0,0 +1,111 @@
+"""
+Benchmark de memoria del lector Excel de carga masiva.
+
+Compara el pico de memoria (tracemalloc) entre:
+- Carga completa: openpyxl en modo normal + lista de todas las filas
+  (comportamiento anterior del lector Excel)
+- Streaming: leer_filas (openpyxl en modo solo lectura, filas crudas),
+  consumido por lotes como lo hace MotorCargaMasiva
+
+Uso:
+    python scripts/benchmark_lectores.py [filas ...]
+    python scripts/benchmark_lectores.py 10000 50000 200000
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from itertools import islice
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+import django
+django.setup()
+
+import openpyxl
+from calificaciones.utils.lectores import leer_filas
+from calificaciones.utils.motor_carga import TAMANO_LOTE
+
+FILAS_POR_DEFECTO = [10000, 50000, 200000]
+HEADERS = (
+    ['codigo_instrumento', 'fecha_informe', 'origen', 'numero_dj', 'ejercicio']
+    + [f'factor_{i}' for i in range(8, 38)]
+)
+
+
+def generar_excel(ruta, filas):
+    """Genera un Excel de prueba con 30 factores (escritura en streaming)."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(HEADERS)
+    factores = [0.01] * 30
+    for i in range(filas):
+        ws.append([f'INST{i % 500:04d}', date(2025, 1, 1 + i % 28), 'BOLSA', '1949', 2025] + factores)
+    wb.save(ruta)
+
+
+def carga_completa(ruta):
+    """Lector anterior: workbook completo en memoria + lista de registros."""
+    wb = openpyxl.load_workbook(ruta)
+    sheet = wb.active
+    headers = [cell.value for cell in sheet[1]]
+    registros = []
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        registro = dict(zip(headers, row))
+        if registro.get('codigo_instrumento'):
+            registros.append(registro)
+    return len(registros)
+
+
+def carga_streaming(ruta):
+    """Lector actual: generador de filas crudas consumido por lotes."""
+    total = 0
+    with open(ruta, 'rb') as archivo:
+        _, filas = leer_filas(archivo, ruta)
+        while True:
+            lote = list(islice(filas, TAMANO_LOTE))
+            if not lote:
+                break
+            total += len(lote)
+    return total
+
+
+def medir(funcion, ruta):
+    """Ejecuta la función y retorna (filas, segundos, pico MB)."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    filas = funcion(ruta)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return filas, segundos, pico / (1024 * 1024)
+
+
+def main():
+    tamanos = [int(arg) for arg in sys.argv[1:]] or FILAS_POR_DEFECTO
+
+    print(f"\n{'='*70}")
+    print("BENCHMARK DE MEMORIA - LECTOR EXCEL")
+    print(f"{'='*70}")
+    print(f"{'Filas':>10} | {'Modo':<10} | {'Tiempo (s)':>10} | {'Pico (MB)':>10}")
+    print(f"{'-'*70}")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for filas in tamanos:
+            ruta = os.path.join(directorio, f'benchmark_{filas}.xlsx')
+            generar_excel(ruta, filas)
+
+            for modo, funcion in (('completa', carga_completa), ('streaming', carga_streaming)):
+                leidas, segundos, pico = medir(funcion, ruta)
+                assert leidas == filas, f"{modo}: {leidas} filas leídas, esperadas {filas}"
+                print(f"{filas:>10} | {modo:<10} | {segundos:>10.2f} | {pico:>10.1f}")
+
+    print(f"{'='*70}\n")
+
+
+if __name__ == '__main__':
+    main()